@@ -0,0 +1,77 @@
+"""
+Per-frame CPU time and peak Python/NumPy memory of frame encoding.
+
+Compares the former PIL pipeline (copy, fromarray, split/merge, PIL PNG)
+with ImageManipulatorMixin.frame_to_bytes (cv2.imencode on the capture buffer).
+
+Run from the app directory:
+    python -m benchmarks.frame_encoding
+"""
+import io
+import time
+import tracemalloc
+from os import environ
+
+import numpy
+from PIL import Image
+
+# settings are read from env on import
+for name in ("token_timeout", "youtube_delay", "task_queue_size", "retries_number", "retries_period"):
+    environ.setdefault(name, "1")
+
+from collectors.base_collectors import ImageManipulatorMixin  # noqa: E402
+
+RESOLUTIONS = {"1080p": (1080, 1920), "4K": (2160, 3840)}
+ROUNDS = 5
+
+
+def make_frame(height: int, width: int) -> numpy.ndarray:
+    """
+    Smooth gradients plus a little noise, roughly as compressible as a camera frame
+    """
+    y, x = numpy.mgrid[0:height, 0:width]
+    frame = numpy.empty((height, width, 3), dtype=numpy.uint8)
+    frame[..., 0] = (x * 255 // width).astype(numpy.uint8)
+    frame[..., 1] = (y * 255 // height).astype(numpy.uint8)
+    frame[..., 2] = ((x + y) % 256).astype(numpy.uint8)
+    noise = numpy.random.default_rng(0).integers(0, 8, frame.shape, dtype=numpy.uint8)
+    return frame + noise
+
+
+def legacy_pil_png(frame: numpy.ndarray) -> bytes:
+    frame = frame.copy()
+    b, g, r = Image.fromarray(frame, mode="RGB").split()
+    f = io.BytesIO()
+    Image.merge("RGB", (r, g, b)).save(f, "PNG")
+    return f.getvalue()
+
+
+def measure(func, frame: numpy.ndarray):
+    tracemalloc.start()
+    started = time.process_time()
+    for _ in range(ROUNDS):
+        result = func(frame)
+    cpu = (time.process_time() - started) / ROUNDS
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak, len(result)
+
+
+def main() -> None:
+    encoders = {
+        "PIL png (before)": legacy_pil_png,
+        "cv2 png level 3": lambda f: ImageManipulatorMixin.frame_to_bytes(f, "png", 3),
+        "cv2 png level 1": lambda f: ImageManipulatorMixin.frame_to_bytes(f, "png", 1),
+        "cv2 jpg q90": lambda f: ImageManipulatorMixin.frame_to_bytes(f, "jpg", 90),
+        "cv2 webp q90": lambda f: ImageManipulatorMixin.frame_to_bytes(f, "webp", 90),
+    }
+    print(f"{'frame':<6} {'encoder':<18} {'cpu ms':>8} {'peak MiB':>9} {'size KiB':>9}")
+    for name, (height, width) in RESOLUTIONS.items():
+        frame = make_frame(height, width)
+        for encoder, func in encoders.items():
+            cpu, peak, size = measure(func, frame)
+            print(f"{name:<6} {encoder:<18} {cpu * 1000:>8.1f} {peak / 2 ** 20:>9.1f} {size / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Throughput of the durable job queue (queues.durable.DurableQueue on SQLite).
+
+"enqueue" puts JOBS jobs and waits until they are written, "dequeue" takes
+and acks them and waits until the deletes are written, "mixed" runs
+producers and workers together as in production, so a part of the jobs is
+acked before it is ever written. "shared" puts the jobs into a SharedQueue
+of one intake process and collects them by a second one (queue_backend
+"shared"). The target is 10k ops/s.
+
+Run from the app directory:
+    python -m benchmarks.job_queue
+"""
+import asyncio
+import tempfile
+import time
+import uuid
+from os import environ
+
+# settings are read from env on import
+for name in ("token_timeout", "youtube_delay", "task_queue_size", "retries_number", "retries_period"):
+    environ.setdefault(name, "1")
+
+from image_api_client.client import Client  # noqa: E402
+from queues.durable import DurableQueue, SharedJobStore, SharedQueue, SQLiteJobStore  # noqa: E402
+
+JOBS = 50000
+WORKERS = 20
+SYNC_INTERVAL = 0.05
+
+
+def make_job() -> tuple:
+    sensor_id = uuid.uuid4()
+    return 0, (sensor_id, uuid.uuid4(), "rtsp", 5, None, False, Client(sensor_id))
+
+
+async def worker(queue: DurableQueue, count: int) -> None:
+    for _ in range(count):
+        await queue.get()
+        queue.task_done()
+
+
+async def synced(queue: DurableQueue) -> None:
+    while queue.store.pending():
+        await asyncio.sleep(SYNC_INTERVAL / 10)
+
+
+def report(name: str, ops: int, elapsed: float) -> None:
+    print(f"{name:<8} {ops:>7} ops {elapsed:>7.2f} s {ops / elapsed:>10.0f} ops/s")
+
+
+async def main() -> None:
+    jobs = [make_job() for _ in range(JOBS)]
+    with tempfile.TemporaryDirectory() as directory:
+        queue = DurableQueue(SQLiteJobStore(directory), sync_interval=SYNC_INTERVAL)
+        await queue.restore()
+        sync = asyncio.ensure_future(queue.run())
+
+        started = time.perf_counter()
+        for job in jobs:
+            await queue.put(job)
+        await synced(queue)
+        report("enqueue", JOBS, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(queue, JOBS // WORKERS) for _ in range(WORKERS)])
+        await synced(queue)
+        report("dequeue", JOBS, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        workers = [asyncio.ensure_future(worker(queue, JOBS // WORKERS)) for _ in range(WORKERS)]
+        for index, job in enumerate(jobs):
+            await queue.put(job)
+            if index % 100 == 0:
+                # Let the workers and the sync in, as requests do
+                await asyncio.sleep(0)
+        await asyncio.gather(*workers)
+        await synced(queue)
+        report("mixed", 2 * JOBS, time.perf_counter() - started)
+
+        sync.cancel()
+        await queue.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The intake process has no workers and claims nothing. The collector
+        # workers finish jobs instantly, so a large prefetch keeps them busy
+        # between syncs
+        intake, collector = [
+            SharedQueue(SharedJobStore(directory, lease=30), sync_interval=SYNC_INTERVAL, prefetch=prefetch)
+            for prefetch in (0, 2000)
+        ]
+        await intake.restore()
+        await collector.restore()
+        syncs = [asyncio.ensure_future(queue.run()) for queue in (intake, collector)]
+        started = time.perf_counter()
+        workers = [asyncio.ensure_future(worker(collector, JOBS // WORKERS)) for _ in range(WORKERS)]
+        for job in jobs:
+            await intake.put(job)
+        await asyncio.gather(*workers)
+        await synced(collector)
+        report("shared", 2 * JOBS, time.perf_counter() - started)
+        for sync in syncs:
+            sync.cancel()
+        await intake.close()
+        await collector.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
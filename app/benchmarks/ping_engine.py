@@ -0,0 +1,109 @@
+"""
+Probes per second of the bulk ping engine (collectors.ping_engine.PingEngine).
+
+A listener farm of PORTS listening sockets on 127.0.0.1 runs in a separate
+process and accepts and closes connections. SENSORS sensors, a quarter of
+them on closed ports, are checked through the whole engine: sensor data
+from the sensor cache, probe, check record to ping_check_batcher, whose
+POST is replaced by a stub. The target is 10k probes/s on one core, "cpu"
+is the time of the engine process only: on loopback it is charged with the
+handshakes of both ends, and the farm may share the core.
+
+Run from the app directory:
+    python -m benchmarks.ping_engine
+"""
+import asyncio
+import multiprocessing
+import selectors
+import socket
+import time
+import uuid
+from os import environ
+
+# settings are read from env on import
+for name in ("token_timeout", "youtube_delay", "task_queue_size", "retries_number", "retries_period"):
+    environ.setdefault(name, "1")
+environ.setdefault("sensor_cache_size", "1000000")
+environ.setdefault("sensor_cache_ttl", "3600")
+
+from collectors.ping_engine import PingEngine  # noqa: E402
+from image_api_client.batcher import ping_check_batcher  # noqa: E402
+from image_api_client.client import Client, sensor_cache  # noqa: E402
+
+SENSORS = 50000
+PORTS = 64
+WINDOWS = (100, 1000)
+TIMEOUT = 1
+
+
+def listener_farm(ports: multiprocessing.Queue, stop: multiprocessing.Event) -> None:
+    selector = selectors.DefaultSelector()
+    for _ in range(PORTS):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(4096)
+        listener.setblocking(False)
+        selector.register(listener, selectors.EVENT_READ)
+        ports.put(listener.getsockname()[1])
+    while not stop.is_set():
+        for key, _ in selector.select(0.1):
+            while True:
+                try:
+                    connection, _ = key.fileobj.accept()
+                except BlockingIOError:
+                    break
+                except OSError:
+                    continue
+                connection.close()
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def post_batch(records):
+    return {}
+
+
+async def main() -> None:
+    ports, stop = multiprocessing.Queue(), multiprocessing.Event()
+    farm = multiprocessing.Process(target=listener_farm, args=(ports, stop))
+    farm.start()
+    open_ports = [ports.get() for _ in range(PORTS)]
+    dead_port = closed_port()
+
+    ping_check_batcher._post_batch = post_batch
+    clients = []
+    for index in range(SENSORS):
+        client = Client(uuid.uuid4())
+        port = dead_port if index % 4 == 0 else open_ports[index % PORTS]
+        sensor_cache.set(client.sensor_id, {"ip": "127.0.0.1", "port": port})
+        clients.append(client)
+
+    try:
+        for window in WINDOWS:
+            engine = PingEngine(window=window, timeout=TIMEOUT)
+            runner = asyncio.ensure_future(engine.run())
+            started, cpu_started = time.perf_counter(), time.process_time()
+            for client in clients:
+                engine.submit(client, None)
+            while engine.stats()["pending"] or engine.stats()["in_flight"]:
+                await asyncio.sleep(0.01)
+            await ping_check_batcher.close()
+            elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+            runner.cancel()
+            stats = engine.stats()
+            print(
+                f"window {window:>5} {SENSORS:>7} probes {elapsed:>6.2f} s {SENSORS / elapsed:>8.0f} probes/s"
+                f"  cpu {cpu:>6.2f} s {SENSORS / cpu:>8.0f} probes/cpu s"
+                f"  reachable {stats['reachable']} unreachable {stats['unreachable']} failed {stats['failed']}"
+            )
+    finally:
+        stop.set()
+        farm.join()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
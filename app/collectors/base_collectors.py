@@ -1,17 +1,18 @@
-import aiobotocore
 import aiohttp
+import cv2
 import io
+import numpy
 from os import environ
 
-from botocore.exceptions import ClientError
-
+import deadlines
 from collectors import collectors_logger
 from collectors.capture.video import VideoCaptureThreading
+from collectors.storage import object_storage
 from exceptions.exceptions import SourceUnavailableException
+from executors.cpu import cpu_executor
 from PIL import Image
-from typing import Union, Tuple
+from typing import Awaitable, Callable, Optional, Union, Tuple
 from image_api_client.client import Client
-from botocore.config import Config
 
 from models.remotes import CheckResult
 from settings import settings
@@ -19,6 +20,24 @@ from settings import settings
 
 RETRIES = int(environ.get("http_client_retries_number", default=5))
 
+FRAME_ENCODINGS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class Resume:
+    """
+    Returned by collect() of a collector which has to wait between two phases
+    (e.g. after logging in to a device). The worker is released and the job
+    is resumed by awaiting continuation() after delay seconds.
+    """
+
+    def __init__(self, delay: float, continuation: Callable[[], Awaitable[CheckResult]]) -> None:
+        self.delay = delay
+        self.continuation = continuation
+
 
 class BaseCollector:
     ip = None
@@ -45,12 +64,27 @@ class BaseCollector:
     def collect(self) -> CheckResult:
         raise NotImplementedError
 
+    @staticmethod
+    async def resume_after(
+            delay: float, continuation: Callable[[], Awaitable[CheckResult]]
+    ) -> Union[Resume, CheckResult]:
+        if delay > 0:
+            return Resume(delay, continuation)
+        return await continuation()
+
 
 class HTTPMixin:
     TIMEOUT: aiohttp.ClientTimeout = aiohttp.ClientTimeout(
         total=float(environ.get("sensor_timeout", default=10))
     )
 
+    @property
+    def timeout(self) -> aiohttp.ClientTimeout:
+        """
+        TIMEOUT cut to the remaining budget of the job
+        """
+        return deadlines.bound_timeout(self.TIMEOUT)
+
 
 class ImageManipulatorMixin:
     @staticmethod
@@ -69,24 +103,47 @@ class ImageManipulatorMixin:
         image.save(f, out_ext)
         return f.getvalue()
 
+    @staticmethod
+    def frame_to_bytes(frame: numpy.ndarray, out_ext: str, level: int) -> Optional[bytes]:
+        """
+        Encodes an OpenCV (BGR) frame straight from the capture buffer, runs in cpu_executor.
+        level is the PNG compression (0-9) or the JPEG/WebP quality (1-100)
+        """
+        ext, param = FRAME_ENCODINGS[out_ext]
+        encoded, buffer = cv2.imencode(ext, frame, [param, level])
+        if not encoded:
+            return None
+        return buffer.tobytes()
+
+    @classmethod
+    def convert(cls, data: bytes, out_ext: str) -> bytes:
+        """
+        Re-encodes an image received from a device, runs in cpu_executor
+        """
+        return cls.to_bytes(Image.open(io.BytesIO(data)), out_ext)
+
 
 class CVCollector(BaseCollector, ImageManipulatorMixin):
     collector_type = "cv"
 
     @staticmethod
-    async def get_frame(url) -> Tuple[bytes, str]:
-        ext = "PNG"
-        async with VideoCaptureThreading(url) as vcap:
+    async def get_frame(url, deadline: float = None) -> Tuple[bytes, str]:
+        async with VideoCaptureThreading(url, deadline=deadline) as vcap:
             if not vcap.isOpened():
                 raise SourceUnavailableException(detail=f"Can not connect to {url}")
             ret, image = vcap.read()
             if image is None:
                 raise SourceUnavailableException(detail=f"Can not connect to {url}")
-        rgb_frame = CVCollector.bgr_to_rgb(CVCollector.bytes_to_image(image))
-        image_bytes = CVCollector.to_bytes(rgb_frame, ext)
         collectors_logger.debug("Video capture was completed")
+        return await CVCollector.encode_frame(image, url)
+
+    @staticmethod
+    async def encode_frame(image: numpy.ndarray, url: str) -> Tuple[bytes, str]:
+        ext = settings.FRAME_FORMAT
+        level = settings.FRAME_PNG_COMPRESSION if ext == "png" else settings.FRAME_QUALITY
+        image_bytes = await cpu_executor.run(CVCollector.frame_to_bytes, image, ext, level)
         if image_bytes:
-            return image_bytes, ext.lower()
+            return image_bytes, ext
         raise SourceUnavailableException(detail=f"Can not connect to {url}")
 
 
@@ -106,23 +163,4 @@ class DBCollector(BaseCollector):
             return result
 
     async def _get_file(self, filename: str) -> Union[bytes, None]:
-        session = aiobotocore.get_session()
-        async with session.create_client(
-            "s3",
-            region_name="msk",
-            endpoint_url=settings.S3_ENDPOINT,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            use_ssl=False,
-            config=Config(proxies={}),
-        ) as client:
-            try:
-                response = await client.get_object(
-                    Bucket=settings.AWS_BUCKET_NAME, Key=filename
-                )
-                async with response["Body"] as stream:
-                    return await stream.read()
-            except ClientError as ex:
-                if ex.response['Error']['Code'] == 'NoSuchKey':
-                    collectors_logger.warning(f"{filename}: {ex}")
-                    return None
+        return await object_storage.get(filename)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from settings import settings
+
+capture_logger = logging.getLogger("collector_app.capture")
+
+
+class CaptureExecutor:
+    """
+    The only thread pool blocking OpenCV calls (open, read, release) run in.
+
+    Concurrent captures of one source are limited by per_source_limit. A call
+    which exceeds its timeout raises asyncio.TimeoutError right away; the
+    thread itself can not be interrupted, so on_timeout is called with the
+    late result (e.g. to release a cv2.VideoCapture) once it finally returns.
+    """
+
+    def __init__(self, max_workers: int, per_source_limit: int) -> None:
+        self.max_workers = max_workers
+        self.per_source_limit = per_source_limit
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._source_slots: Dict[Any, asyncio.Semaphore] = {}
+        self._source_users: Dict[Any, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.submitted = 0
+        self.timed_out = 0
+
+    def start(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="capture"
+            )
+        return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    @asynccontextmanager
+    async def source_slot(self, src: Any) -> AsyncIterator[None]:
+        slot = self._source_slots.get(src)
+        if slot is None:
+            slot = self._source_slots[src] = asyncio.Semaphore(self.per_source_limit)
+        self._source_users[src] = self._source_users.get(src, 0) + 1
+        try:
+            async with slot:
+                yield
+        finally:
+            self._source_users[src] -= 1
+            if not self._source_users[src]:
+                del self._source_users[src]
+                del self._source_slots[src]
+
+    async def run(
+            self,
+            func: Callable,
+            *args,
+            timeout: float = None,
+            on_timeout: Callable[[Any], None] = None,
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.start(), partial(func, *args))
+        self.submitted += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        future.add_done_callback(self._done)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            capture_logger.warning(f"{getattr(func, '__name__', func)} timed out after {timeout}s")
+            if on_timeout is not None:
+                future.add_done_callback(partial(self._cleanup, on_timeout))
+            raise
+
+    def _done(self, _: asyncio.Future) -> None:
+        self.in_flight -= 1
+
+    def _cleanup(self, on_timeout: Callable[[Any], None], future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.start().submit(on_timeout, future.result())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "submitted": self.submitted,
+            "timed_out": self.timed_out,
+            "sources": len(self._source_slots),
+        }
+
+
+capture_executor = CaptureExecutor(
+    max_workers=settings.CAPTURE_WORKERS,
+    per_source_limit=settings.CAPTURE_PER_SOURCE_LIMIT,
+)
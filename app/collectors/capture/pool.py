@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import cv2
+import numpy
+
+import deadlines
+from collectors.capture.executor import capture_executor
+from exceptions.exceptions import SourceUnavailableException
+from settings import settings
+
+pool_logger = logging.getLogger("collector_app.capture.pool")
+
+READ_TIMEOUT_MARGIN = 1.0
+
+
+class PooledStream:
+    """
+    Long-lived cv2.VideoCapture. A reader thread keeps grabbing (demux and
+    decode, no conversion) so the capture always holds the latest frame,
+    without a new connection, codec init or waiting for a keyframe.
+
+    Only the reader thread touches the capture. While read() waits it also
+    retrieves the next grabbed frame and hands it over under a Condition
+    which is only held to swap the frame, never around a blocking grab().
+    """
+
+    def __init__(self, src: str) -> None:
+        self.src = src
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.last_used = time.monotonic()
+        self.failed = False
+        self._condition = threading.Condition()
+        self._waiting = 0
+        self._frame: Optional[numpy.ndarray] = None
+        self._frames = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self) -> None:
+        """
+        Blocking, runs in an executor
+        """
+        self.cap = cv2.VideoCapture(self.src)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise SourceUnavailableException(detail=f"Can not connect to {self.src}")
+        self._thread = threading.Thread(
+            target=self._grab_frames, name="stream-pool-reader", daemon=True
+        )
+        self._thread.start()
+
+    def _grab_frames(self) -> None:
+        while not self._stopped.is_set():
+            if not self.cap.grab():
+                with self._condition:
+                    self.failed = True
+                    self._condition.notify_all()
+                return
+            if self._waiting:
+                retrieved, frame = self.cap.retrieve()
+                with self._condition:
+                    self._frame = frame if retrieved else None
+                    self._frames += 1
+                    self._condition.notify_all()
+
+    def read(self, timeout: float) -> Optional[numpy.ndarray]:
+        """
+        Blocking, runs in an executor. Returns the first frame grabbed after
+        the call, None if there is none within timeout
+        """
+        deadline = time.monotonic() + timeout
+        if not self._condition.acquire(timeout=timeout):
+            return None
+        try:
+            self._waiting += 1
+            seen = self._frames
+            try:
+                fresh = self._condition.wait_for(
+                    lambda: self._frames > seen or self.failed, deadline - time.monotonic()
+                )
+            finally:
+                self._waiting -= 1
+            if not fresh or self.failed:
+                return None
+            frame = self._frame
+        finally:
+            self._condition.release()
+        self.last_used = time.monotonic()
+        return frame
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.cap is not None:
+            self.cap.release()
+
+
+class StreamPool:
+    """
+    Warm captures keyed by source url, capped at max_streams (least recently
+    used stream is closed first) and closed after idle_ttl seconds without reads.
+    A stream which lost its connection is reopened on the next read.
+    """
+
+    def __init__(self, max_streams: int, idle_ttl: float, read_timeout: float) -> None:
+        self.max_streams = max_streams
+        self.idle_ttl = idle_ttl
+        self.read_timeout = read_timeout
+        self._streams: "OrderedDict[str, PooledStream]" = OrderedDict()
+        self._opening: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    def is_warm(self, src: str) -> bool:
+        stream = self._streams.get(src)
+        return stream is not None and not stream.failed
+
+    async def read(self, src: str) -> numpy.ndarray:
+        stream = await self._get_stream(src)
+        timeout = deadlines.bound(self.read_timeout)
+        try:
+            # read() gives up after timeout itself, the margin covers a busy executor
+            frame = await capture_executor.run(
+                stream.read,
+                timeout,
+                timeout=timeout + READ_TIMEOUT_MARGIN,
+                on_timeout=lambda _: stream.close(),
+            )
+        except asyncio.TimeoutError:
+            # Closed by on_timeout once the late read returns
+            self._forget(src, stream)
+            frame = None
+        else:
+            if frame is None:
+                self._discard(src, stream)
+        if frame is None:
+            raise SourceUnavailableException(
+                detail=f"No frames was gotten from the source {src}"
+            )
+        return frame
+
+    async def _get_stream(self, src: str) -> PooledStream:
+        stream = self._streams.get(src)
+        if stream is not None and not stream.failed:
+            self._streams.move_to_end(src)
+            return stream
+        if stream is not None:
+            self._discard(src, stream)
+        future = self._opening.get(src)
+        if future is None:
+            future = asyncio.ensure_future(self._open(src))
+            self._opening[src] = future
+            future.add_done_callback(lambda _: self._opening.pop(src, None))
+        return await asyncio.shield(future)
+
+    async def _open(self, src: str) -> PooledStream:
+        stream = PooledStream(src)
+        await capture_executor.run(
+            stream.open, timeout=settings.CAPTURE_TIMEOUT, on_timeout=lambda _: stream.close()
+        )
+        self._streams[src] = stream
+        pool_logger.debug(f"Opened pooled stream, {len(self._streams)} streams in pool")
+        while len(self._streams) > self.max_streams:
+            _, evicted = self._streams.popitem(last=False)
+            self._close(evicted)
+        return stream
+
+    def _forget(self, src: str, stream: PooledStream) -> None:
+        if self._streams.get(src) is stream:
+            del self._streams[src]
+
+    def _discard(self, src: str, stream: PooledStream) -> None:
+        self._forget(src, stream)
+        self._close(stream)
+
+    @staticmethod
+    def _close(stream: PooledStream) -> None:
+        # Joining the reader thread may wait for a pending grab()
+        capture_executor.start().submit(stream.close)
+
+    def evict_idle(self) -> None:
+        now = time.monotonic()
+        for src, stream in list(self._streams.items()):
+            if now - stream.last_used > self.idle_ttl:
+                self._discard(src, stream)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.idle_ttl / 2)
+            self.evict_idle()
+
+    def close(self) -> None:
+        for src, stream in list(self._streams.items()):
+            self._discard(src, stream)
+
+
+stream_pool = StreamPool(
+    max_streams=settings.RTSP_POOL_MAX_STREAMS,
+    idle_ttl=settings.RTSP_POOL_IDLE_TTL,
+    read_timeout=settings.RTSP_POOL_READ_TIMEOUT,
+)
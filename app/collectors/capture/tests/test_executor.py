@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_per_source_limit():
+    from collectors.capture.executor import CaptureExecutor
+
+    executor = CaptureExecutor(max_workers=4, per_source_limit=1)
+    active = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+
+    async def capture(src):
+        async with executor.source_slot(src):
+            active[src] += 1
+            peak[src] = max(peak[src], active[src])
+            await executor.run(time.sleep, 0.02)
+            active[src] -= 1
+
+    try:
+        await asyncio.gather(*[capture(src) for src in ("a", "b") * 3])
+    finally:
+        executor.shutdown()
+    assert peak == {"a": 1, "b": 1}
+    stats = executor.stats()
+    assert stats["submitted"] == 6
+    assert stats["max_in_flight"] == 2
+    assert stats["in_flight"] == 0
+    assert stats["sources"] == 0
+
+
+@pytest.mark.asyncio
+async def test_timeout_cleans_up_late_result():
+    from collectors.capture.executor import CaptureExecutor
+
+    executor = CaptureExecutor(max_workers=1, per_source_limit=1)
+    unblock = threading.Event()
+    released = threading.Event()
+
+    def slow_open():
+        unblock.wait(5)
+        return "capture"
+
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(
+                slow_open, timeout=0.01,
+                on_timeout=lambda cap: cap == "capture" and released.set()
+            )
+        assert executor.stats()["timed_out"] == 1
+        assert executor.stats()["in_flight"] == 1
+        unblock.set()
+        assert await asyncio.get_running_loop().run_in_executor(None, released.wait, 5)
+        assert executor.stats()["in_flight"] == 0
+    finally:
+        unblock.set()
+        executor.shutdown()
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import numpy
+import pytest
+
+from exceptions.exceptions import SourceUnavailableException
+
+FRAME = numpy.zeros((4, 4, 3), dtype=numpy.uint8)
+
+
+def make_capture(opened=True, frames=None):
+    cap = MagicMock()
+    cap.isOpened.return_value = opened
+
+    def grab():
+        time.sleep(0.001)
+        return True if frames is None else frames.pop(0) if frames else False
+
+    cap.grab.side_effect = grab
+    cap.retrieve.return_value = (True, FRAME)
+    return cap
+
+
+@pytest.fixture()
+def video_capture_mock(mocker):
+    return mocker.patch("collectors.capture.pool.cv2.VideoCapture",
+                        side_effect=lambda src: make_capture())
+
+
+@pytest.fixture()
+def pool():
+    from collectors.capture.pool import StreamPool
+
+    pool = StreamPool(max_streams=2, idle_ttl=60, read_timeout=1)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_read_reuses_stream(pool, video_capture_mock):
+    frames = await asyncio.gather(*[pool.read("rtsp://camera") for _ in range(3)])
+    assert all(frame is FRAME for frame in frames)
+    assert await pool.read("rtsp://camera") is FRAME
+    video_capture_mock.assert_called_once_with("rtsp://camera")
+    assert pool.is_warm("rtsp://camera")
+    assert not pool.is_warm("rtsp://other")
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction(pool, video_capture_mock):
+    for src in ("rtsp://a", "rtsp://b", "rtsp://a", "rtsp://c"):
+        await pool.read(src)
+    assert len(pool) == 2
+    assert pool.is_warm("rtsp://a") and pool.is_warm("rtsp://c")
+    assert not pool.is_warm("rtsp://b")
+
+
+@pytest.mark.asyncio
+async def test_idle_eviction(pool, video_capture_mock):
+    await pool.read("rtsp://a")
+    pool.evict_idle()
+    assert len(pool) == 1
+    pool.idle_ttl = 0
+    pool.evict_idle()
+    assert len(pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_reconnect_after_stream_loss(pool, mocker):
+    # A few grabs so the first read is waiting before the stream is lost
+    captures = [make_capture(frames=[True] * 20), make_capture()]
+    video_capture_mock = mocker.patch("collectors.capture.pool.cv2.VideoCapture",
+                                      side_effect=lambda src: captures.pop(0))
+    await pool.read("rtsp://a")
+    await asyncio.sleep(0.1)
+    assert not pool.is_warm("rtsp://a")
+    assert await pool.read("rtsp://a") is FRAME
+    assert video_capture_mock.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_unavailable_source(pool, mocker):
+    mocker.patch("collectors.capture.pool.cv2.VideoCapture",
+                 side_effect=lambda src: make_capture(opened=False))
+    with pytest.raises(SourceUnavailableException):
+        await pool.read("rtsp://a")
+    assert len(pool) == 0
+
+
+class SlowCapture:
+    """
+    cv2.VideoCapture of a stream whose grab() blocks for period seconds
+    """
+
+    def __init__(self, period, frames=None):
+        self.period = period
+        self.frames = frames
+        self.grabbed = 0
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        time.sleep(self.period)
+        if self.frames is not None and self.grabbed >= self.frames:
+            return False
+        self.grabbed += 1
+        return True
+
+    def retrieve(self):
+        return True, numpy.full((2, 2), self.grabbed, numpy.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def open_stream(mocker, capture):
+    from collectors.capture.pool import PooledStream
+
+    mocker.patch("collectors.capture.pool.cv2.VideoCapture", return_value=capture)
+    stream = PooledStream("rtsp://camera")
+    stream.open()
+    return stream
+
+
+def test_read_returns_a_fresh_frame(mocker):
+    capture = SlowCapture(0.01)
+    stream = open_stream(mocker, capture)
+    try:
+        time.sleep(0.05)
+        grabbed = capture.grabbed
+        frame = stream.read(1)
+        assert frame is not None and frame[0, 0] > grabbed
+    finally:
+        stream.close()
+    assert capture.released
+
+
+def test_readers_are_not_starved_by_grab(mocker):
+    stream = open_stream(mocker, SlowCapture(0.05))
+    frames = []
+    readers = [threading.Thread(target=lambda: frames.append(stream.read(1))) for _ in range(4)]
+    try:
+        started = time.monotonic()
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        # All of them are served by one or two grabs, not one grab each
+        assert time.monotonic() - started < 0.15
+        assert all(frame is not None for frame in frames)
+    finally:
+        stream.close()
+
+
+def test_read_timeout_and_lost_stream(mocker):
+    stream = open_stream(mocker, SlowCapture(0.05, frames=1))
+    try:
+        assert stream.read(0.01) is None
+        assert stream.read(1) is not None
+        assert stream.read(1) is None
+        assert stream.failed
+    finally:
+        stream.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_read_timeout(mocker):
+    from collectors.capture.pool import StreamPool
+
+    mocker.patch("collectors.capture.pool.READ_TIMEOUT_MARGIN", 0.01)
+    capture = SlowCapture(0.5)
+    mocker.patch("collectors.capture.pool.cv2.VideoCapture", return_value=capture)
+    pool = StreamPool(max_streams=2, idle_ttl=60, read_timeout=0.05)
+    with pytest.raises(SourceUnavailableException):
+        await pool.read("rtsp://camera")
+    assert len(pool) == 0
+    pool.close()
@@ -1,3 +1,9 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import asynctest
 import numpy
 import pytest
 
@@ -20,3 +26,99 @@ class TestVideoCaptureThreading:
             with pytest.raises(SourceUnavailableException):
                 async with VideoCaptureThreading(url) as vcap:
                     vcap.read()
+
+
+def make_capture(grabs):
+    cap = MagicMock()
+    cap.grab.side_effect = lambda: grabs.pop(0) if grabs else False
+    cap.retrieve.return_value = (True, numpy.zeros((4, 4, 3), dtype=numpy.uint8))
+    return cap
+
+
+@pytest.mark.asyncio
+async def test_read_retries_with_backoff(mocker):
+    from collectors.capture.video import VideoCaptureThreading
+
+    cap = make_capture([False, False, True])
+    mocker.patch("collectors.capture.video.cv2.VideoCapture", return_value=cap)
+    sleep = mocker.patch("collectors.capture.video.asyncio.sleep", side_effect=asynctest.CoroutineMock())
+    async with VideoCaptureThreading("rtsp://camera") as vcap:
+        ret, image = vcap.read()
+    assert image is not None
+    assert sleep.call_count == 2
+    assert cap.retrieve.call_count == 1
+    cap.release.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_no_sleep_after_last_attempt(mocker):
+    from collectors.capture.video import RETRIES_NUMBER, VideoCaptureThreading
+
+    cap = make_capture([])
+    mocker.patch("collectors.capture.video.cv2.VideoCapture", return_value=cap)
+    mocker.patch("collectors.capture.video.settings.CAPTURE_SKIP_FRAMES", 2)
+    sleep = mocker.patch("collectors.capture.video.asyncio.sleep", side_effect=asynctest.CoroutineMock())
+    with pytest.raises(SourceUnavailableException):
+        async with VideoCaptureThreading("rtsp://camera") as vcap:
+            vcap.read()
+    assert sleep.call_count == RETRIES_NUMBER - 1
+    # One failed grab per attempt
+    assert cap.grab.call_count == RETRIES_NUMBER
+
+
+@pytest.mark.asyncio
+async def test_frames_are_skipped_once(mocker):
+    from collectors.capture.video import VideoCaptureThreading
+
+    cap = make_capture([True, True, False, True])
+    mocker.patch("collectors.capture.video.cv2.VideoCapture", return_value=cap)
+    mocker.patch("collectors.capture.video.settings.CAPTURE_SKIP_FRAMES", 2)
+    mocker.patch("collectors.capture.video.asyncio.sleep", side_effect=asynctest.CoroutineMock())
+    async with VideoCaptureThreading("rtsp://camera") as vcap:
+        vcap.read()
+    # Three grabs of the first attempt, one of the second
+    assert cap.grab.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_read_gives_up_at_deadline(mocker):
+    from collectors.capture.video import VideoCaptureThreading
+
+    cap = make_capture([])
+    mocker.patch("collectors.capture.video.cv2.VideoCapture", return_value=cap)
+    started = time.monotonic()
+    with pytest.raises(SourceUnavailableException):
+        async with VideoCaptureThreading("rtsp://camera", deadline=started + 0.2) as vcap:
+            vcap.read()
+    assert time.monotonic() - started < 0.5
+    cap.retrieve.assert_not_called()
+    cap.release.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_read_timeout_releases_late(mocker):
+    from collectors.capture.video import VideoCaptureThreading
+
+    unblock = threading.Event()
+    cap = make_capture([])
+    cap.grab.side_effect = lambda: unblock.wait(5)
+    mocker.patch("collectors.capture.video.cv2.VideoCapture", return_value=cap)
+    mocker.patch("collectors.capture.video.settings.CAPTURE_READ_TIMEOUT", 0.05)
+    with pytest.raises(SourceUnavailableException):
+        await VideoCaptureThreading("rtsp://camera").start()
+    cap.release.assert_not_called()
+    unblock.set()
+    for _ in range(100):
+        if cap.release.called:
+            break
+        await asyncio.sleep(0.01)
+    cap.release.assert_called_once()
+
+
+@pytest.mark.parametrize("attempt", [0, 3, 10])
+def test_backoff_delay(attempt):
+    from collectors.capture.video import backoff_delay
+    from settings import settings
+
+    ceiling = min(settings.CAPTURE_BACKOFF_MAX, settings.CAPTURE_BACKOFF_BASE * 2 ** attempt)
+    assert all(0 <= backoff_delay(attempt) <= ceiling for _ in range(20))
@@ -1,48 +1,116 @@
 import asyncio
-import concurrent
+import logging
+import random
+import time
 import cv2
 
 from functools import partial
 from os import environ
+from typing import Callable
+
+import deadlines
+from collectors.capture.executor import capture_executor
 from exceptions.exceptions import SourceUnavailableException
+from settings import settings
 
 
 RETRIES_NUMBER = int(environ.get("retries_number"))
 
+capture_logger = logging.getLogger("collector_app.capture")
+
+
+def release(cap: cv2.VideoCapture, *_) -> None:
+    cap.release()
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter, so captures of cameras which went
+    down together do not retry in lockstep
+    """
+    ceiling = min(settings.CAPTURE_BACKOFF_MAX, settings.CAPTURE_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
 
 class VideoCaptureThreading:
-    def __init__(self, src=0, width=640, height=480):
+    """
+    Reads a single frame. Every blocking call is bounded by the per-attempt
+    read timeout and by the deadline (time.monotonic() value) of the capture:
+    capture_deadline or the job deadline, whichever comes first. Failed reads
+    are retried with backoff until the deadline is reached.
+    """
+
+    def __init__(self, src=0, width=640, height=480, deadline: float = None):
         self.src = src
         self.width = width
         self.height = height
+        self.deadline = deadline
         self.grabbed, self.frame = None, None
         self.cap = None
 
     async def start(self):
-        await self.update()
+        try:
+            await self.update()
+        except SourceUnavailableException:
+            await self.__aexit__(None, None, None)
+            raise
         return self
 
     async def update(self):
-        loop = asyncio.get_running_loop()
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            self.cap = await loop.run_in_executor(pool, partial(cv2.VideoCapture, self.src))
+        deadline = self.deadline or deadlines.earliest(time.monotonic() + settings.CAPTURE_DEADLINE)
+        async with capture_executor.source_slot(self.src):
+            self.cap = await self._run(partial(cv2.VideoCapture, self.src), deadline, release)
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-            for i in range(RETRIES_NUMBER):
-                self.grabbed, self.frame = await loop.run_in_executor(
-                    pool, self.cap.read)
-                if self.frame is not None:
+            for attempt in range(RETRIES_NUMBER):
+                # Later attempts read on from the frames already skipped
+                skip_frames = settings.CAPTURE_SKIP_FRAMES if attempt == 0 else 0
+                grab = partial(self._grab, self.cap, skip_frames)
+                if await self._run(grab, deadline, partial(release, self.cap)):
+                    self.grabbed, self.frame = await self._run(
+                        self.cap.retrieve, deadline, partial(release, self.cap)
+                    )
+                    if self.frame is not None:
+                        break
+                if attempt == RETRIES_NUMBER - 1:
+                    break
+                delay = backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    capture_logger.debug(f"Capture deadline reached after {attempt + 1} attempts")
                     break
-                await asyncio.sleep(RETRIES_NUMBER)
+                await asyncio.sleep(delay)
+
+    async def _run(self, func: Callable, deadline: float, on_timeout: Callable):
+        timeout = min(settings.CAPTURE_READ_TIMEOUT, deadline - time.monotonic())
+        if timeout <= 0:
+            raise SourceUnavailableException(detail=f"Capture deadline exceeded for {self.src}")
+        try:
+            return await capture_executor.run(func, timeout=timeout, on_timeout=on_timeout)
+        except asyncio.TimeoutError:
+            # The capture is released by on_timeout once the pending call returns
+            self.cap = None
+            raise SourceUnavailableException(detail=f"Capture timed out for {self.src}")
+
+    @staticmethod
+    def _grab(cap: cv2.VideoCapture, skip_frames: int) -> bool:
+        """
+        Grabs without retrieving, i.e. without converting frames which are
+        skipped anyway. The first capture_skip_frames frames after connecting
+        may be decoded from an incomplete GOP, they are dropped until the
+        decoder has seen a keyframe.
+        """
+        for _ in range(skip_frames + 1):
+            if not cap.grab():
+                return False
+        return True
 
     def read(self):
         if self.frame is None:
             raise SourceUnavailableException(
                 f"No frames was gotten from the source {self.src}"
             )
-        frame = self.frame.copy()
-        grabbed = self.grabbed
-        return grabbed, frame
+        # The buffer belongs to this capture only, so no defensive copy is needed
+        return self.grabbed, self.frame
 
     def isOpened(self):
         return self.cap.isOpened()
@@ -51,4 +119,5 @@ class VideoCaptureThreading:
         return await self.start()
 
     async def __aexit__(self, exec_type, exc_value, traceback):
-        self.cap.release()
+        if self.cap is not None:
+            await capture_executor.run(self.cap.release)
@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from collectors import collectors_logger
+from exceptions.exceptions import HostUnavailableError
+from settings import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Errors which mean the device itself is unreachable, an HTTP error status does not count
+HOST_FAILURES = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+class HostGuard:
+    """
+    Concurrency limit and circuit breaker of one device.
+
+    After failure_threshold consecutive connection failures the circuit opens
+    and requests fail right away with HostUnavailableError. reset_timeout
+    seconds later a single probe request is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, limit: int, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.slots = asyncio.Semaphore(limit)
+
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            return True
+        return self.state == CLOSED
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class HostGuards:
+    """
+    HostGuard per device host, shared by all workers
+    """
+
+    def __init__(self, limit: int, failure_threshold: int, reset_timeout: float) -> None:
+        self.limit = limit
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._guards: Dict[str, HostGuard] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.rejected = 0
+
+    def get(self, host: str) -> HostGuard:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Semaphores belong to the loop they were created in
+            self._loop = loop
+            self._guards.clear()
+        guard = self._guards.get(host)
+        if guard is None:
+            guard = self._guards[host] = HostGuard(
+                self.limit, self.failure_threshold, self.reset_timeout
+            )
+        return guard
+
+    @asynccontextmanager
+    async def guard(self, host: str) -> AsyncIterator[None]:
+        guard = self.get(host)
+        if guard.is_open():
+            self.rejected += 1
+            raise HostUnavailableError(detail=f"Host {host} is unavailable, circuit is open")
+        async with guard.slots:
+            if not guard.allow():
+                self.rejected += 1
+                raise HostUnavailableError(detail=f"Host {host} is unavailable, circuit is open")
+            try:
+                yield
+            except HOST_FAILURES:
+                guard.record_failure()
+                if guard.state == OPEN:
+                    collectors_logger.warning(f"Circuit of {host} is open for {self.reset_timeout}s")
+                raise
+            except Exception:
+                # The device answered
+                guard.record_success()
+                raise
+            except BaseException:
+                # A cancelled probe must not leave the circuit half-open
+                if guard.state == HALF_OPEN:
+                    guard.record_failure()
+                raise
+            guard.record_success()
+
+    def stats(self) -> Dict[str, int]:
+        states = [guard.state for guard in self._guards.values()]
+        return {
+            "hosts": len(states),
+            "open": states.count(OPEN),
+            "half_open": states.count(HALF_OPEN),
+            "rejected": self.rejected,
+        }
+
+
+host_guards = HostGuards(
+    limit=settings.HOST_CONCURRENCY_LIMIT,
+    failure_threshold=settings.HOST_FAILURE_THRESHOLD,
+    reset_timeout=settings.HOST_RESET_TIMEOUT,
+)
+
+
+def guarded(func):
+    """
+    Runs a collector method under the limiter and circuit breaker of self.ip.
+    Goes under the backoff decorator, so every retry passes the breaker and
+    retries stop as soon as the circuit opens.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        async with host_guards.guard(self.ip):
+            return await func(self, *args, **kwargs)
+
+    return wrapper
@@ -1,5 +1,7 @@
 import asyncio
 from os import environ
+
+import deadlines
 from collectors.base_collectors import BaseCollector
 from exceptions.exceptions import CollectorTimeoutError
 from models.enums import CheckStatus
@@ -14,7 +16,7 @@ class PingCollector(BaseCollector):
         result = CheckResult(check_status=CheckStatus.UNAVAILABLE)
         try:
             reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(self.ip, self.port), self.TIMEOUT_PING
+                asyncio.open_connection(self.ip, self.port), deadlines.bound(self.TIMEOUT_PING)
             )
         except (TimeoutError, OSError, asyncio.TimeoutError):
             raise CollectorTimeoutError(status=404, detail="Порт не доступен")
@@ -0,0 +1,199 @@
+import asyncio
+import errno
+import socket
+import struct
+from collections import deque
+from functools import partial
+from typing import Deque, Dict, Optional, Tuple
+from uuid import UUID
+
+from collectors import collectors_logger
+from image_api_client.batcher import ping_check_batcher
+from image_api_client.client import Client
+from models.enums import CheckStatus
+from settings import settings
+
+# l_onoff=1, l_linger=0: close() resets the connection, so a probe leaves no TIME_WAIT socket
+ABORTIVE_CLOSE = struct.pack("ii", 1, 0)
+
+
+class PingEngine:
+    """
+    Bulk TCP reachability checks of the ping collect type.
+
+    Ping jobs do not go through the job queue and the workers: submit() only
+    buffers them and run() probes up to window of them at once. A probe is a
+    bare non-blocking connect which fails after timeout seconds, its check
+    record goes straight to ping_check_batcher.
+    """
+
+    def __init__(self, window: int, timeout: float) -> None:
+        self.window = window
+        self.timeout = timeout
+        self._pending: Optional[asyncio.Queue] = None
+        self._in_flight = 0
+        self._deadlines: Deque[Tuple[float, socket.socket, asyncio.Future]] = deque()
+        self._sweeper: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.submitted = 0
+        self.reachable = 0
+        self.unreachable = 0
+        self.failed = 0
+
+    def _bind(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues belong to the loop they were created in
+            self._loop = loop
+            self._pending = asyncio.Queue()
+            self._deadlines.clear()
+            self._sweeper = None
+        return self._pending
+
+    def submit(self, client: Client, collect_type_id: Optional[UUID]) -> None:
+        self._bind().put_nowait((client, collect_type_id))
+        self.submitted += 1
+
+    async def run(self) -> None:
+        # A fixed set of checkers spares a task per check
+        self._bind()
+        await asyncio.gather(*[self._checker() for _ in range(self.window)])
+
+    async def _checker(self) -> None:
+        pending = self._pending
+        while True:
+            client, collect_type_id = await pending.get()
+            self._in_flight += 1
+            try:
+                detail, status = await self._check(client)
+            finally:
+                self._in_flight -= 1
+            try:
+                saved = await ping_check_batcher.submit(
+                    client.check_payload(None, False, collect_type_id, detail, status.value)
+                )
+                saved.add_done_callback(partial(self._report, client.sensor_id))
+            except Exception as e:
+                collectors_logger.exception(e)
+
+    async def _check(self, client: Client) -> Tuple[Optional[str], CheckStatus]:
+        try:
+            sensor_data = await client.get_sensor_data()
+            reachable = await self.probe(sensor_data["ip"], int(sensor_data["port"]))
+        except Exception as e:
+            self.failed += 1
+            return str(e)[:500], CheckStatus.UNAVAILABLE
+        if reachable:
+            self.reachable += 1
+            return None, CheckStatus.NOCHANGE
+        self.unreachable += 1
+        return "Порт не доступен", CheckStatus.UNAVAILABLE
+
+    @staticmethod
+    def _report(sensor_id: UUID, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            e = future.exception()
+            collectors_logger.warning(f"Ping check of {sensor_id} was not saved: {getattr(e, 'detail', e)}")
+
+    async def probe(self, host: str, port: int) -> bool:
+        """
+        True if a TCP connection to host:port is accepted within timeout
+        """
+        self._bind()
+        loop = self._loop
+        family = address_family(host)
+        if family is None:
+            addresses = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            if not addresses:
+                return False
+            family, _, _, _, address = addresses[0]
+            host = address[0]
+        result = loop.create_future()
+        self._connect(loop, family, host, port, result)
+        return await result
+
+    def _connect(
+            self, loop: asyncio.AbstractEventLoop, family: int, host: str, port: int, result: asyncio.Future
+    ) -> None:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, ABORTIVE_CLOSE)
+        try:
+            code = sock.connect_ex((host, port))
+        except OSError:
+            code = errno.EINVAL
+        if code == errno.EINPROGRESS:
+            # On a LAN the handshake is often done by the time connect returns,
+            # which spares registering the socket in the selector
+            code = settled(sock)
+        if code != errno.EINPROGRESS:
+            sock.close()
+            result.set_result(code == 0)
+            return
+        loop.add_writer(sock.fileno(), self._connected, loop, sock, result)
+        # All probes have the same timeout, so the deadlines are in order
+        self._deadlines.append((loop.time() + self.timeout, sock, result))
+        if self._sweeper is None:
+            self._sweeper = loop.call_later(self.timeout, self._sweep, loop)
+
+    @staticmethod
+    def _connected(loop: asyncio.AbstractEventLoop, sock: socket.socket, result: asyncio.Future) -> None:
+        loop.remove_writer(sock.fileno())
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        sock.close()
+        if not result.done():
+            result.set_result(error == 0)
+
+    def _sweep(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Fails the probes which are not connected in time
+        """
+        self._sweeper = None
+        now = loop.time()
+        deadlines = self._deadlines
+        while deadlines and (deadlines[0][0] <= now or deadlines[0][1].fileno() == -1):
+            _, sock, result = deadlines.popleft()
+            if sock.fileno() != -1:
+                loop.remove_writer(sock.fileno())
+                sock.close()
+            if not result.done():
+                result.set_result(False)
+        if deadlines:
+            self._sweeper = loop.call_at(deadlines[0][0], self._sweep, loop)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "submitted": self.submitted,
+            "pending": self._pending.qsize() if self._pending else 0,
+            "in_flight": self._in_flight,
+            "reachable": self.reachable,
+            "unreachable": self.unreachable,
+            "failed": self.failed,
+        }
+
+
+def settled(sock: socket.socket) -> int:
+    """
+    0 if a non-blocking connect succeeded, its error if it failed, EINPROGRESS if it is not done
+    """
+    try:
+        sock.getpeername()
+        return 0
+    except OSError:
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) or errno.EINPROGRESS
+
+
+def address_family(host: str) -> Optional[int]:
+    """
+    AF_INET or AF_INET6 for an IP address, None for a host name
+    """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return family
+        except OSError:
+            pass
+    return None
+
+
+ping_engine = PingEngine(window=settings.PING_ENGINE_WINDOW, timeout=settings.PING_ENGINE_TIMEOUT)
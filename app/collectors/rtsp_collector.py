@@ -1,5 +1,6 @@
 import logging
 import urllib
+from typing import Tuple
 from urllib.parse import urlparse
 
 from aiortsp.rtsp.connection import RTSPConnection
@@ -8,8 +9,10 @@ from aiortsp.rtsp.session import RTSPMediaSession
 from aiortsp.transport import transport_for_scheme
 
 from collectors.base_collectors import CVCollector, DBCollector
+from collectors.capture.pool import stream_pool
 from exceptions.exceptions import ForbiddenError, SourceUnavailableException, UnauthorizedError
 from models.remotes import CheckResult
+from settings import settings
 
 logger = logging.getLogger("collector_app.RtspCollector")
 
@@ -52,9 +55,21 @@ class RtspCollector(CVCollector, DBCollector):
             url = f"{self.ip}:{554}/Streaming/Channels/101"
         return f'rtsp://{url}'
 
+    async def get_pooled_frame(self, url: str) -> Tuple[bytes, str]:
+        """
+        Takes the latest frame of a warm stream, credentials are only checked when the stream is opened
+        """
+        if not stream_pool.is_warm(url):
+            await self.test_connection(url)
+        image = await stream_pool.read(url)
+        return await self.encode_frame(image, url)
+
     async def collect(self) -> CheckResult:
         url = self.prepare_rtsp_url()
-        await self.test_connection(url)
         result = CheckResult()
-        result.image, result.extension = await self.get_frame(url)
+        if settings.RTSP_POOL_ENABLED:
+            result.image, result.extension = await self.get_pooled_frame(url)
+        else:
+            await self.test_connection(url)
+            result.image, result.extension = await self.get_frame(url)
         return result
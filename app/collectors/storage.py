@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from functools import partial
+from typing import Any, Dict, Optional
+
+import aiobotocore
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from image_api_client.cache import AsyncLRUCache
+from settings import settings
+
+storage_logger = logging.getLogger("collector_app.storage")
+
+
+class ObjectStorage:
+    """
+    Process-wide S3 client of the image storage.
+
+    The client, its credentials and its connection pool are created once
+    instead of for every download. Fetched objects are kept in an in-memory
+    LRU cache bounded by cache_size bytes; objects are stored by image id
+    and never change, so reprocessing a sensor reads them from the cache.
+    """
+
+    def __init__(self, max_pool_connections: int, cache_size: int, cache_ttl: float) -> None:
+        self.max_pool_connections = max_pool_connections
+        self._cache = AsyncLRUCache(max_size=cache_size, ttl=cache_ttl)
+        self._context = None
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._starting: Optional[asyncio.Lock] = None
+        self._starting_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.requests = 0
+        self.downloads = 0
+
+    def _is_started(self) -> bool:
+        return self._client is not None and self._loop is asyncio.get_event_loop()
+
+    def _bind(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._starting_loop is not loop:
+            # Locks belong to the loop they were created in
+            self._starting_loop = loop
+            self._starting = asyncio.Lock()
+        return self._starting
+
+    async def start(self) -> None:
+        if self._is_started():
+            return
+        # Concurrent first downloads must not create a client each
+        async with self._bind():
+            if not self._is_started():
+                await self._start()
+
+    async def _start(self) -> None:
+        context = aiobotocore.get_session().create_client(
+            "s3",
+            region_name="msk",
+            endpoint_url=settings.S3_ENDPOINT,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            use_ssl=False,
+            config=Config(proxies={}, max_pool_connections=self.max_pool_connections),
+        )
+        self._client = await context.__aenter__()
+        self._context, self._loop = context, asyncio.get_running_loop()
+        storage_logger.info(f"S3 client started: max_pool_connections={self.max_pool_connections}")
+
+    async def close(self) -> None:
+        if self._context is not None and self._loop is asyncio.get_event_loop():
+            await self._context.__aexit__(None, None, None)
+        self._context, self._client, self._loop = None, None, None
+
+    async def get_client(self) -> Any:
+        """
+        Shared S3 client, created lazily if the app was not started
+        """
+        await self.start()
+        return self._client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Object of the storage bucket, None if there is no such key
+        """
+        self.requests += 1
+        return await self._cache.get_or_fetch(
+            key, partial(self._download, key), cacheable=lambda data: data is not None, sizeof=len
+        )
+
+    async def _download(self, key: str) -> Optional[bytes]:
+        client = await self.get_client()
+        self.downloads += 1
+        try:
+            response = await client.get_object(Bucket=settings.AWS_BUCKET_NAME, Key=key)
+            async with response["Body"] as stream:
+                return await stream.read()
+        except ClientError as ex:
+            if ex.response['Error']['Code'] == 'NoSuchKey':
+                storage_logger.warning(f"{key}: {ex}")
+                return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "downloads": self.downloads,
+            "cached": len(self._cache),
+            "cached_bytes": self._cache.size,
+        }
+
+
+object_storage = ObjectStorage(
+    max_pool_connections=settings.S3_POOL_CONNECTIONS,
+    cache_size=settings.S3_CACHE_SIZE,
+    cache_ttl=settings.S3_CACHE_TTL,
+)
@@ -1,13 +1,16 @@
-import asyncio
 import base64
-from typing import Tuple, Type, Union
+from functools import partial
+from typing import Optional, Tuple, Type, Union
 
 import aiohttp
 import backoff
 
+import deadlines
 from collectors import collectors_logger
-from collectors.base_collectors import RETRIES, HTTPMixin, DBCollector, BaseCollector
+from collectors.base_collectors import RETRIES, HTTPMixin, DBCollector, BaseCollector, Resume
+from collectors.hosts import guarded
 from exceptions.exceptions import ForbiddenError, UnauthorizedError
+from image_api_client.sessions import session_manager
 from image_api_client.client import Client
 from models.remotes import CheckResult
 from settings.settings import TD_DELAY
@@ -32,29 +35,53 @@ class TDCollector(HTTPMixin, DBCollector):
         self.port = camera_data["port"]
         return self
 
+    async def collect(self) -> Union[CheckResult, Resume, None]:
+        """
+        Logs in, the image can be fetched TD_DELAY seconds later with the session cookies
+        """
+        cookies = await self.login_to_device()
+        if cookies is None:
+            return None
+        return await self.resume_after(TD_DELAY, partial(self.get_image, cookies))
+
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
-    async def collect(self) -> Union[CheckResult, None]:
+    @guarded
+    async def login_to_device(self) -> Optional[aiohttp.CookieJar]:
         login_url = f"http://{self.ip}/login"
-        image_url = f"http://{self.ip}/video_feed/1?0.04008162014960104"
         try:
             login_form = {"username": self.login, "password": self.password}
-            async with aiohttp.ClientSession(
-                timeout=self.TIMEOUT, raise_for_status=True
+            cookies = aiohttp.CookieJar(unsafe=True)
+            async with session_manager.session(
+                timeout=self.timeout, raise_for_status=True, cookie_jar=cookies
             ) as session:
                 async with session.post(login_url, data=login_form) as reg_resp:
-                    if reg_resp.status == 200:
-                        await asyncio.sleep(TD_DELAY)
-                        async with session.get(image_url) as resp:
-                            if resp.status == 200:
-                                result = CheckResult()
-                                result.image, result.extension = (
-                                    await resp.read(),
-                                    "png",
-                                )
-                                return result
+                    if reg_resp.status != 200:
+                        return None
+        except Exception as ex:
+            collectors_logger.warning(ex)
+            raise ex
+        return cookies
 
+    @backoff.on_exception(
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
+    )
+    @guarded
+    async def get_image(self, cookies: aiohttp.CookieJar) -> Optional[CheckResult]:
+        image_url = f"http://{self.ip}/video_feed/1?0.04008162014960104"
+        try:
+            async with session_manager.session(
+                timeout=self.timeout, raise_for_status=True, cookie_jar=cookies
+            ) as session:
+                async with session.get(image_url) as resp:
+                    if resp.status == 200:
+                        result = CheckResult()
+                        result.image, result.extension = (
+                            await resp.read(),
+                            "png",
+                        )
+                        return result
         except Exception as ex:
             collectors_logger.warning(ex)
             raise ex
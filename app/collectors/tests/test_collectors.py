@@ -1,4 +1,5 @@
 import asyncio
+import io
 import uuid
 from unittest.mock import AsyncMock
 
@@ -178,6 +179,21 @@ class TestTDCollector(TestBaseCollector):
                                          data={"username": collector.login, "password": collector.password})
             mock_get.assert_called_with(f"http://{collector.ip}/video_feed/1?0.04008162014960104")
 
+    async def test_td_collector_resumes(self, collector, aiohttp_mocks, mocker):
+        from collectors.base_collectors import Resume
+        from collectors.td_collector import TDCollector
+        mocker.patch("collectors.td_collector.TD_DELAY", 10)
+        collector = await collector(TDCollector)
+        mock_get, mock_post = aiohttp_mocks
+        mock_get.return_value.__aenter__.return_value.status = 200
+        mock_post.return_value.__aenter__.return_value.status = 200
+        mock_get.return_value.__aenter__.return_value.read = CoroutineMock(return_value=b"image")
+        resume = await collector.collect()
+        assert isinstance(resume, Resume)
+        assert resume.delay == 10
+        mock_get.assert_not_called()
+        assert await resume.continuation() == CheckResult(image=b"image", extension="png")
+
 
 @pytest.mark.asyncio
 class TestCVCollector(TestBaseCollector):
@@ -197,6 +213,19 @@ class TestCVCollector(TestBaseCollector):
         collector = await collector(CVCollector)
         assert type(collector.to_bytes(image, "png")) == bytes
 
+    @pytest.mark.parametrize("ext,level", [("png", 3), ("jpg", 90), ("webp", 90)])
+    async def test_frame_to_bytes(self, collector, image: Image, ext, level):
+        from collectors.base_collectors import CVCollector
+
+        collector = await collector(CVCollector)
+        frame = numpy.array(image)
+        image_bytes = collector.frame_to_bytes(frame, ext, level)
+        decoded = Image.open(io.BytesIO(image_bytes))
+        assert decoded.format == {"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}[ext]
+        assert decoded.size == image.size
+        if ext == "png":
+            assert numpy.array_equal(numpy.array(decoded), frame[..., ::-1])
+
     async def test_bytes_to_image(self, collector, image: Image):
         from collectors.base_collectors import CVCollector
 
@@ -220,10 +249,10 @@ class TestCVCollector(TestBaseCollector):
         )
         mock.return_value.__aexit__ = CoroutineMock(return_value=None)
         if not case:
-            assert await collector.get_frame("url") == (
-                collector.to_bytes(collector.bgr_to_rgb(image), "PNG"),
-                "png",
-            )
+            image_bytes, ext = await collector.get_frame("url")
+            assert ext == "png"
+            assert numpy.array_equal(numpy.array(Image.open(io.BytesIO(image_bytes))),
+                                     numpy.array(collector.bgr_to_rgb(image)))
         elif case == 1:
             mock = mocker.patch(
                 "collectors.base_collectors.VideoCaptureThreading"
@@ -247,7 +276,7 @@ class TestCVCollector(TestBaseCollector):
                 await collector.get_frame("url")
         else:
             mocker.patch(
-                "collectors.base_collectors.CVCollector.to_bytes"
+                "collectors.base_collectors.CVCollector.frame_to_bytes"
             ).return_value = None
             with pytest.raises(SourceUnavailableException):
                 await collector.get_frame("url")
@@ -258,6 +287,7 @@ class TestDBCollector(TestBaseCollector):
     @pytest.mark.parametrize("case", [*range(2)])
     async def test_get_file(self, collector, image, mocker, case):
         from collectors.base_collectors import DBCollector, ImageManipulatorMixin
+        from collectors.storage import ObjectStorage
 
         db_collector = await collector(DBCollector)
         image_bytes = ImageManipulatorMixin.to_bytes(image, "png")
@@ -273,18 +303,38 @@ class TestDBCollector(TestBaseCollector):
                                                       operation_name="my_operation",)
         read_result_mock = CoroutineMock(return_value=image_bytes)
         read_mock.__aenter__.return_value.read = read_result_mock
-        boto_mock = mocker.patch("collectors.base_collectors.aiobotocore")
+        boto_mock = mocker.patch("collectors.storage.aiobotocore")
         boto_mock.get_session.return_value = get_session_mock
+        get_session_mock.create_client.return_value.__aenter__ = CoroutineMock()
         get_session_mock.create_client.return_value.__aenter__.return_value.get_object = (
             get_object_mock
         )
+        mocker.patch("collectors.base_collectors.object_storage", ObjectStorage(4, 1024 * 1024, 60))
         if case:
             assert await db_collector._get_file("filename") == image_bytes
-            get_object_mock.assert_awaited_with(Bucket="bucket", Key="filename")
-            get_session_mock.create_client.assert_called()
+            assert await db_collector._get_file("filename") == image_bytes
+            get_object_mock.assert_awaited_once_with(Bucket="bucket", Key="filename")
+            get_session_mock.create_client.assert_called_once()
             read_result_mock.assert_awaited()
         else:
             assert await db_collector._get_file("filename") is None
+            assert await db_collector._get_file("filename") is None
+            assert get_object_mock.await_count == 2
+
+    async def test_storage_client_is_created_once(self, mocker):
+        from collectors.storage import ObjectStorage
+
+        async def enter():
+            await asyncio.sleep(0.01)
+            return MagicMock()
+
+        boto_mock = mocker.patch("collectors.storage.aiobotocore")
+        create_client_mock = boto_mock.get_session.return_value.create_client
+        create_client_mock.return_value.__aenter__ = CoroutineMock(side_effect=enter)
+        storage = ObjectStorage(4, 1024 * 1024, 60)
+        clients = await asyncio.gather(*[storage.get_client() for _ in range(5)])
+        create_client_mock.assert_called_once()
+        assert all(client is clients[0] for client in clients)
 
     async def test_collect_from_db(self, collector, image, mocker):
         from collectors.base_collectors import DBCollector
@@ -340,6 +390,20 @@ class TestWectechCollector(TestBaseCollector):
             mock_get.assert_called_with(f"http://{collector.ip}/rightImage.jpg",
                                         params={"_time": ANY})
 
+    async def test_wectech_collector_resumes(self, collector, aiohttp_mocks, mocker):
+        from collectors.base_collectors import Resume
+        from collectors.wecktech_collector import WectechCollector
+        mocker.patch("collectors.wecktech_collector.WECTECH_DELAY", 10)
+        collector = await collector(WectechCollector)
+        mock_get, mock_post = aiohttp_mocks
+        mock_get.return_value.__aenter__.return_value.status = 200
+        mock_post.return_value.__aenter__.return_value.status = 200
+        mock_get.return_value.__aenter__.return_value.read = CoroutineMock(return_value=b"image")
+        resume = await collector.collect()
+        assert isinstance(resume, Resume)
+        mock_get.assert_not_called()
+        assert await resume.continuation() == CheckResult(image=b"image", extension="jpg")
+
 
 @pytest.mark.asyncio
 class TestPingCollectors(TestBaseCollector):
@@ -419,6 +483,25 @@ class TestRTSPCollectors(TestBaseCollector):
                      new=CoroutineMock(return_value=True))
         assert await collector.collect() == CheckResult(image=image_bytes, extension="png")
 
+    async def test_rtsp_collector_pooled(self, image, collector, mocker):
+        from collectors.rtsp_collector import RtspCollector
+        collector = await collector(RtspCollector)
+        mocker.patch('collectors.rtsp_collector.settings.RTSP_POOL_ENABLED', True)
+        test_connection_mock = mocker.patch('collectors.rtsp_collector.RtspCollector.test_connection',
+                                            new=CoroutineMock(return_value=True))
+        get_frame_mock = mocker.patch('collectors.rtsp_collector.RtspCollector.get_frame')
+        pool_mock = mocker.patch('collectors.rtsp_collector.stream_pool')
+        pool_mock.read = CoroutineMock(return_value=numpy.array(image))
+        pool_mock.is_warm.return_value = False
+        result = await collector.collect()
+        assert result.extension == "png"
+        test_connection_mock.assert_awaited_once_with(collector.prepare_rtsp_url())
+        pool_mock.read.assert_awaited_once_with(collector.prepare_rtsp_url())
+        pool_mock.is_warm.return_value = True
+        await collector.collect()
+        test_connection_mock.assert_awaited_once()
+        get_frame_mock.assert_not_called()
+
 
 @pytest.mark.asyncio
 class TestYoutubeCollectors(TestBaseCollector):
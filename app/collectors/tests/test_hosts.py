@@ -0,0 +1,108 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from exceptions.exceptions import HostUnavailableError
+
+
+async def fail(guards, host, error=aiohttp.ClientConnectionError):
+    with pytest.raises(error):
+        async with guards.guard(host):
+            raise error()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_recovers(mocker):
+    from collectors.hosts import HostGuards, OPEN, CLOSED
+
+    guards = HostGuards(limit=2, failure_threshold=2, reset_timeout=0.05)
+    await fail(guards, "10.0.0.1")
+    await fail(guards, "10.0.0.1", asyncio.TimeoutError)
+    assert guards.get("10.0.0.1").state == OPEN
+    with pytest.raises(HostUnavailableError):
+        async with guards.guard("10.0.0.1"):
+            pass
+    async with guards.guard("10.0.0.2"):
+        pass
+    assert guards.stats() == {"hosts": 2, "open": 1, "half_open": 0, "rejected": 1}
+
+    await asyncio.sleep(0.05)
+    await fail(guards, "10.0.0.1")
+    assert guards.get("10.0.0.1").state == OPEN
+    await asyncio.sleep(0.05)
+    async with guards.guard("10.0.0.1"):
+        pass
+    assert guards.get("10.0.0.1").state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_http_errors_do_not_open_circuit():
+    from collectors.hosts import HostGuards, CLOSED
+
+    guards = HostGuards(limit=2, failure_threshold=1, reset_timeout=60)
+    await fail(guards, "10.0.0.1", aiohttp.ClientPayloadError)
+    assert guards.get("10.0.0.1").state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_half_open_lets_one_probe_through():
+    from collectors.hosts import HostGuards
+
+    guards = HostGuards(limit=5, failure_threshold=1, reset_timeout=0)
+    await fail(guards, "10.0.0.1")
+    probe_started = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def probe():
+        async with guards.guard("10.0.0.1"):
+            probe_started.set()
+            await finish.wait()
+
+    task = asyncio.ensure_future(probe())
+    await probe_started.wait()
+    with pytest.raises(HostUnavailableError):
+        async with guards.guard("10.0.0.1"):
+            pass
+    finish.set()
+    await task
+    async with guards.guard("10.0.0.1"):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    from collectors.hosts import HostGuards
+
+    guards = HostGuards(limit=2, failure_threshold=3, reset_timeout=60)
+    active, peak = 0, 0
+
+    async def request():
+        nonlocal active, peak
+        async with guards.guard("10.0.0.1"):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    await asyncio.gather(*[request() for _ in range(6)])
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_guarded():
+    from collectors.hosts import guarded, host_guards
+
+    class Device:
+        ip = "10.0.0.9"
+
+        @guarded
+        async def fetch(self):
+            raise aiohttp.ClientConnectionError()
+
+    device = Device()
+    for _ in range(host_guards.failure_threshold):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await device.fetch()
+    with pytest.raises(HostUnavailableError):
+        await device.fetch()
@@ -0,0 +1,103 @@
+import asyncio
+import errno
+import socket
+import uuid
+
+import pytest
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_probe():
+    from collectors.ping_engine import PingEngine
+
+    server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    engine = PingEngine(window=10, timeout=1)
+    assert await engine.probe("127.0.0.1", port)
+    assert await engine.probe("localhost", port)
+    server.close()
+    await server.wait_closed()
+    assert not await engine.probe("127.0.0.1", free_port())
+
+
+@pytest.mark.asyncio
+async def test_probe_timeout(mocker):
+    from collectors.ping_engine import PingEngine
+
+    # The connection is never established
+    mocker.patch.object(socket.socket, "connect_ex", return_value=errno.EINPROGRESS)
+    loop = asyncio.get_running_loop()
+    mocker.patch.object(loop, "add_writer")
+    remove_writer = mocker.patch.object(loop, "remove_writer")
+    engine = PingEngine(window=10, timeout=0.05)
+    assert not await engine.probe("127.0.0.1", 80)
+    remove_writer.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_window_and_checks(mocker):
+    from collectors.ping_engine import PingEngine
+    from image_api_client.client import Client
+    from models.enums import CheckStatus
+
+    records = []
+
+    async def submit(record):
+        records.append(record)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    mocker.patch("collectors.ping_engine.ping_check_batcher.submit", side_effect=submit)
+    mocker.patch.object(Client, "get_sensor_data", return_value={"ip": "127.0.0.1", "port": 80})
+    engine = PingEngine(window=2, timeout=1)
+    in_flight = []
+
+    async def probe(host, port):
+        in_flight.append(engine.stats()["in_flight"])
+        reachable = len(in_flight) % 2 == 0
+        await asyncio.sleep(0.01)
+        return reachable
+
+    mocker.patch.object(engine, "probe", side_effect=probe)
+    task = asyncio.ensure_future(engine.run())
+    collect_type_id = uuid.uuid4()
+    for _ in range(5):
+        engine.submit(Client(uuid.uuid4()), collect_type_id)
+    await asyncio.sleep(0.1)
+    task.cancel()
+
+    assert max(in_flight) == 2
+    assert len(records) == 5
+    assert {record["collect_type_id"] for record in records} == {collect_type_id}
+    assert all(record["image"] is False for record in records)
+    statuses = [record["check_status"] for record in records]
+    assert CheckStatus.NOCHANGE.value in statuses and CheckStatus.UNAVAILABLE.value in statuses
+    assert engine.stats() == {
+        "submitted": 5, "pending": 0, "in_flight": 0, "reachable": 2, "unreachable": 3, "failed": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_sensor_data_error(mocker):
+    from collectors.ping_engine import PingEngine
+    from image_api_client.client import Client
+    from models.enums import CheckStatus
+
+    submit = mocker.patch("collectors.ping_engine.ping_check_batcher.submit", side_effect=Exception("skip"))
+    mocker.patch.object(Client, "get_sensor_data", side_effect=KeyError("ip"))
+    engine = PingEngine(window=2, timeout=1)
+    task = asyncio.ensure_future(engine.run())
+    engine.submit(Client(uuid.uuid4()), None)
+    await asyncio.sleep(0.01)
+    task.cancel()
+    record = submit.call_args[0][0]
+    assert record["check_status"] == CheckStatus.UNAVAILABLE.value
+    assert record["detail"] == "'ip'"
+    assert engine.stats()["failed"] == 1
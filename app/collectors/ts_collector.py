@@ -5,6 +5,7 @@ import aiohttp
 from collectors import collectors_logger
 from collectors.base_collectors import CVCollector, HTTPMixin, DBCollector
 from exceptions.exceptions import ForbiddenError, UnauthorizedError
+from image_api_client.sessions import session_manager
 from models.remotes import CheckResult
 
 
@@ -28,8 +29,8 @@ class TSCollector(CVCollector, HTTPMixin, DBCollector):
             "Accept-Encoding": "gzip, deflate, br",
             "Accept-Language": "ru,en-US;q=0.9,en;q=0.8,ru-RU;q=0.7",
         }
-        async with aiohttp.ClientSession(
-            timeout=self.TIMEOUT, raise_for_status=True
+        async with session_manager.session(
+            timeout=self.timeout, raise_for_status=True
         ) as session:
             async with session.get(playlist_url, headers=headers, ssl=False) as resp:
                 if resp.status == 200:
@@ -1,12 +1,15 @@
-import asyncio
 import time
-from typing import Union
+from functools import partial
+from typing import Optional, Union
 import aiohttp
 import backoff
 
+import deadlines
 from collectors import collectors_logger
-from collectors.base_collectors import RETRIES, HTTPMixin, DBCollector
+from collectors.base_collectors import RETRIES, HTTPMixin, DBCollector, Resume
+from collectors.hosts import guarded
 from exceptions.exceptions import ForbiddenError, UnauthorizedError
+from image_api_client.sessions import session_manager
 from models.remotes import CheckResult
 from settings.settings import WECTECH_DELAY
 
@@ -15,33 +18,59 @@ class WectechCollector(HTTPMixin, DBCollector):
 
     collector_type = "wectech"
 
+    async def collect(self) -> Union[None, Resume, CheckResult]:
+        """
+        Registers the client, the image can be fetched WECTECH_DELAY seconds later
+        """
+        cookies = await self.register()
+        if cookies is None:
+            return None
+        return await self.resume_after(WECTECH_DELAY, partial(self.get_image, cookies))
+
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
-    async def collect(self) -> Union[None, CheckResult]:
-        ts = int(time.time())
+    @guarded
+    async def register(self) -> Optional[aiohttp.CookieJar]:
         register_url = f"http://{self.ip}/registerClient.cgi"
-        image_url = f"http://{self.ip}/rightImage.jpg"
         try:
-            params = {"_time": ts}
-            auth = aiohttp.BasicAuth(self.login, self.password)
-            async with aiohttp.ClientSession(
-                timeout=self.TIMEOUT, auth=auth, raise_for_status=True
+            cookies = aiohttp.CookieJar(unsafe=True)
+            async with session_manager.session(
+                timeout=self.timeout, auth=self.auth, raise_for_status=True, cookie_jar=cookies
             ) as session:
                 async with session.post(
                     register_url, data="uid=9475608a80164b5b&image1=2"
                 ) as reg_resp:
-                    if reg_resp.status == 200:
-                        await asyncio.sleep(WECTECH_DELAY)
-                        async with session.get(image_url, params=params) as resp:
-                            if resp.status == 200:
-                                result = CheckResult()
-                                result.image, result.extension = (
-                                    await resp.read(),
-                                    "jpg",
-                                )
-                                return result
+                    if reg_resp.status != 200:
+                        return None
+        except Exception as ex:
+            collectors_logger.warning(ex)
+            raise ex
+        return cookies
+
+    @property
+    def auth(self) -> aiohttp.BasicAuth:
+        return aiohttp.BasicAuth(self.login, self.password)
 
+    @backoff.on_exception(
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
+    )
+    @guarded
+    async def get_image(self, cookies: aiohttp.CookieJar) -> Optional[CheckResult]:
+        image_url = f"http://{self.ip}/rightImage.jpg"
+        try:
+            params = {"_time": int(time.time())}
+            async with session_manager.session(
+                timeout=self.timeout, auth=self.auth, raise_for_status=True, cookie_jar=cookies
+            ) as session:
+                async with session.get(image_url, params=params) as resp:
+                    if resp.status == 200:
+                        result = CheckResult()
+                        result.image, result.extension = (
+                            await resp.read(),
+                            "jpg",
+                        )
+                        return result
         except Exception as ex:
             collectors_logger.warning(ex)
             raise ex
@@ -1,18 +1,21 @@
-import io
 import aiohttp
 import backoff
+import deadlines
 import time
 
 from collectors.base_collectors import RETRIES, HTTPMixin, DBCollector, ImageManipulatorMixin
+from collectors.hosts import guarded
+from executors.cpu import cpu_executor
+from image_api_client.sessions import session_manager
 from models.remotes import CheckResult
 from typing import Tuple, Union
-from PIL import Image
 
 
 class XovisCollector(DBCollector, HTTPMixin, ImageManipulatorMixin):
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
+    @guarded
     async def collect(self) -> Union[None, Tuple[bytes, str]]:
         ts = int(time.time())
         token = ''
@@ -20,8 +23,8 @@ class XovisCollector(DBCollector, HTTPMixin, ImageManipulatorMixin):
         if self.login in ('Администратор', 'Administrator'):
             self.login = 'admin'
         auth = aiohttp.BasicAuth(self.login, self.password)
-        async with aiohttp.ClientSession(
-            timeout=self.TIMEOUT, raise_for_status=True
+        async with session_manager.session(
+            timeout=self.timeout, raise_for_status=True
         ) as session:
             async with session.get(url, auth=auth) as resp:
                 if resp.status == 200:
@@ -33,8 +36,7 @@ class XovisCollector(DBCollector, HTTPMixin, ImageManipulatorMixin):
                 if resp.status == 200:
                     result = CheckResult()
                     data = await resp.read()
-                    image_bmp = Image.open(io.BytesIO(data))
-                    image_png = self.to_bytes(image=image_bmp, out_ext='png')
+                    image_png = await cpu_executor.run(ImageManipulatorMixin.convert, data, 'png')
                     result.image, result.extension = (
                         image_png,
                         "png",
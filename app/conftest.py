@@ -22,3 +22,5 @@ def mock_envs(monkeypatch):
     monkeypatch.setenv('http_client_retries_number', "1")
     monkeypatch.setenv('wectech_delay', "0")
     monkeypatch.setenv('td_delay', "0")
+    monkeypatch.setenv("cpu_executor", "thread")
+    monkeypatch.setenv("queue_backend", "memory")
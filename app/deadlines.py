@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+import aiohttp
+
+from exceptions.exceptions import DeadlineExceededError
+from settings import settings
+
+# time.monotonic() value by which the current job must be finished
+_deadline: ContextVar[Optional[float]] = ContextVar("job_deadline", default=None)
+
+
+def for_collect_type(collect_type: Optional[str]) -> float:
+    return settings.JOB_DEADLINES.get(collect_type, settings.JOB_DEADLINE)
+
+
+@contextmanager
+def job_deadline(seconds: float) -> Iterator[float]:
+    """
+    Sets the deadline of the job run in the current task. Tasks created
+    inside the block inherit it.
+    """
+    deadline = time.monotonic() + seconds
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def get() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left until the deadline, None outside of a job
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired(*_) -> bool:
+    """
+    Also serves as giveup of the backoff decorators, so retries stop once the
+    job is out of time
+    """
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def earliest(deadline: float) -> float:
+    job = _deadline.get()
+    return deadline if job is None else min(deadline, job)
+
+
+def bound(seconds: float) -> float:
+    """
+    Cuts a timeout to the remaining budget of the job
+    """
+    left = remaining()
+    if left is None:
+        return seconds
+    if left <= 0:
+        raise DeadlineExceededError(detail="Job deadline exceeded")
+    return min(seconds, left)
+
+
+def bound_timeout(timeout: aiohttp.ClientTimeout) -> aiohttp.ClientTimeout:
+    if remaining() is None:
+        return timeout
+    return aiohttp.ClientTimeout(
+        total=bound(timeout.total or float("inf")),
+        connect=timeout.connect,
+        sock_read=timeout.sock_read,
+        sock_connect=timeout.sock_connect,
+    )
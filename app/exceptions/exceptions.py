@@ -32,6 +32,14 @@ class SourceUnavailableException(CollectorError):
         self.detail = detail
 
 
+class HostUnavailableError(SourceUnavailableException):
+    """Raised without a request while the circuit of a host is open"""
+
+
+class DeadlineExceededError(SourceUnavailableException):
+    """Raised when the time budget of a job is spent"""
+
+
 class ApiClientError(CollectorError):
     def __init__(
         self,
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from settings import settings
+
+executors_logger = logging.getLogger("collector_app.executors")
+
+PROCESS = "process"
+THREAD = "thread"
+
+
+def _noop() -> None:
+    return None
+
+
+class CPUExecutor:
+    """
+    Pool for CPU bound work (image decoding/encoding, base64) which must not
+    run on the event loop. A thread pool is used by default: OpenCV releases
+    the GIL, and a process pool would copy every frame to a child and back,
+    which costs more than base64 itself. "process" is for work which holds
+    the GIL.
+
+    Functions passed to run() must be picklable for the process pool, i.e.
+    defined at module level or as static/class methods.
+    """
+
+    def __init__(self, kind: str, max_workers: int) -> None:
+        if kind not in (PROCESS, THREAD):
+            raise ValueError(f"Unknown executor kind {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+        self.max_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self) -> Executor:
+        if self._executor is None:
+            if self.kind == PROCESS:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                # Fork the pool processes now rather than in the middle of a burst
+                self._executor.submit(_noop)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="cpu"
+                )
+            executors_logger.info(
+                f"CPU executor started: kind={self.kind}, workers={self.max_workers}"
+            )
+        return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        executor = self.start()
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.max_workers),
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+cpu_executor = CPUExecutor(
+    kind=settings.CPU_EXECUTOR, max_workers=settings.CPU_EXECUTOR_WORKERS
+)
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+
+def square(x):
+    return x * x
+
+
+def worker_pid():
+    return os.getpid()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["thread", "process"])
+async def test_run(kind):
+    from executors.cpu import CPUExecutor
+
+    executor = CPUExecutor(kind=kind, max_workers=2)
+    try:
+        assert await asyncio.gather(*[executor.run(square, i) for i in range(4)]) == [0, 1, 4, 9]
+        pid = await executor.run(worker_pid)
+        assert (pid != os.getpid()) == (kind == "process")
+    finally:
+        executor.shutdown()
+    stats = executor.stats()
+    assert stats["submitted"] == stats["completed"] == 5
+    assert stats["pending"] == 0
+    assert 1 <= stats["max_pending"] <= 4
+
+
+@pytest.mark.asyncio
+async def test_run_failure():
+    from executors.cpu import CPUExecutor
+
+    executor = CPUExecutor(kind="thread", max_workers=1)
+    with pytest.raises(TypeError):
+        await executor.run(square, None)
+    executor.shutdown()
+    assert executor.stats()["failed"] == 1
+    assert executor.stats()["pending"] == 0
+
+
+def test_unknown_kind():
+    from executors.cpu import CPUExecutor
+
+    with pytest.raises(ValueError):
+        CPUExecutor(kind="gpu", max_workers=1)
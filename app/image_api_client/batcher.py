@@ -0,0 +1,190 @@
+import asyncio
+import logging
+from os import environ
+from typing import Dict, List, Optional, Set, Tuple
+
+import aiohttp
+import backoff
+
+from exceptions.exceptions import ApiClientError
+from image_api_client.sessions import session_manager
+from settings import settings
+
+batcher_logger = logging.getLogger("collector_app.batcher")
+
+RETRIES = int(environ.get("http_client_retries_number", default=5))
+TIMEOUT = aiohttp.ClientTimeout(total=float(environ.get("sensor_timeout", default=10)))
+# Statuses camguard answers with when it has no bulk endpoint
+UNSUPPORTED_BATCH_STATUSES = (404, 405)
+
+
+class CheckBatcher:
+    """
+    Write-behind buffer of check records which are sent as one bulk POST
+    once max_batch records are collected or the oldest one waited max_delay
+    seconds.
+
+    The bulk endpoint takes a JSON list of records and answers with a list
+    of {"id": ..., "detail": ...} for the rejected ones. Each submitted
+    record gets a future which fails with ApiClientError if the record was
+    rejected, or with the error of the whole request. If camguard has no
+    bulk endpoint, records are posted one by one to single_url.
+
+    submit() waits while max_pending records are not sent yet.
+    """
+
+    def __init__(
+            self,
+            batch_url: str,
+            single_url: str,
+            max_batch: int,
+            max_delay: float,
+            max_pending: int,
+    ) -> None:
+        self.batch_url = batch_url
+        self.single_url = single_url
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.batch_supported = True
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._sending: Set[asyncio.Future] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sent_batches = 0
+        self.sent_records = 0
+        self.failed_records = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return loop
+
+    async def submit(self, record: Dict) -> asyncio.Future:
+        loop = self._bind()
+        slots = self._slots
+        await slots.acquire()
+        future = loop.create_future()
+        future.add_done_callback(lambda _: slots.release())
+        self._pending.append((record, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self.flush)
+        return future
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def close(self) -> None:
+        """
+        Sends the buffered records and waits until all batches are answered
+        """
+        self.flush()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def _send(self, batch: List[Tuple[Dict, asyncio.Future]]) -> None:
+        records = [record for record, _ in batch]
+        try:
+            rejected = await self._post_batch(records) if self.batch_supported else None
+            if rejected is None:
+                rejected = await self._post_each(records)
+        except Exception as e:
+            batcher_logger.exception(e)
+            self.failed_records += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.sent_batches += 1
+        self.sent_records += len(batch)
+        for record, future in batch:
+            if future.done():
+                continue
+            detail = rejected.get(str(record["id"]))
+            if detail is None:
+                future.set_result(None)
+            else:
+                self.failed_records += 1
+                future.set_exception(ApiClientError(detail=detail))
+
+    @backoff.on_exception(
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+    )
+    async def _post_batch(self, records: List[Dict]) -> Optional[Dict[str, str]]:
+        session = await session_manager.get_session()
+        async with session.post(
+                self.batch_url, json=records, headers=self.headers(), timeout=TIMEOUT
+        ) as resp:
+            if resp.status in UNSUPPORTED_BATCH_STATUSES:
+                batcher_logger.warning(
+                    f"{self.batch_url} is not available, checks are sent one by one"
+                )
+                self.batch_supported = False
+                return None
+            if resp.status != 200:
+                raise ApiClientError(detail=f"Bulk insert failed with status {resp.status}")
+            return {str(item["id"]): item.get("detail") or "rejected" for item in await resp.json()}
+
+    async def _post_each(self, records: List[Dict]) -> Dict[str, str]:
+        statuses = await asyncio.gather(
+            *[self._post_single(record) for record in records], return_exceptions=True
+        )
+        return {
+            str(record["id"]): str(status)
+            for record, status in zip(records, statuses)
+            if status != 200
+        }
+
+    @backoff.on_exception(
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+    )
+    async def _post_single(self, record: Dict) -> int:
+        session = await session_manager.get_session()
+        async with session.post(
+                self.single_url, json=record, headers=self.headers(), timeout=TIMEOUT
+        ) as resp:
+            return resp.status
+
+    @staticmethod
+    def headers() -> Dict[str, str]:
+        return {"Authorization": f"{settings.TOKEN_TYPE} {settings.TOKEN}"}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": len(self._pending),
+            "batches_in_flight": len(self._sending),
+            "sent_batches": self.sent_batches,
+            "sent_records": self.sent_records,
+            "failed_records": self.failed_records,
+        }
+
+
+def make_batcher(path: str) -> CheckBatcher:
+    base = f"{settings.CAMERA_GUARD_BASE}/api/v1/checks/{path}"
+    return CheckBatcher(
+        batch_url=f"{base}/batch",
+        single_url=base,
+        max_batch=settings.CHECK_BATCH_SIZE,
+        max_delay=settings.CHECK_BATCH_DELAY,
+        max_pending=settings.CHECK_BATCH_MAX_PENDING,
+    )
+
+
+image_check_batcher = make_batcher("insert_check")
+ping_check_batcher = make_batcher("insert_ping_check")
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value: Any, size: int, ttl: float) -> None:
+        self.value = value
+        self.size = size
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class LRUCache:
+    """
+    LRU cache bounded by the total size of its values (bytes for images,
+    by default every entry counts as 1 so the bound is the number of entries).
+
+    Expired entries are not dropped on read: the caller gets them back with
+    fresh == False and may revalidate them against the source (ETag etc.)
+    instead of downloading the whole value again.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: Hashable, value: Any, size: int = 1) -> None:
+        self.invalidate(key)
+        if size > self.max_size:
+            return
+        self._entries[key] = CacheEntry(value, size, self.ttl)
+        self.size += size
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+
+class AsyncLRUCache(LRUCache):
+    """
+    LRUCache with single-flight loading: concurrent misses for the same key
+    share one fetch instead of each going to the remote.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        super().__init__(max_size, ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_fetch(
+            self,
+            key: Hashable,
+            fetch: Callable[[], Awaitable[Any]],
+            cacheable: Callable[[Any], bool] = bool,
+            sizeof: Callable[[Any], int] = None,
+    ) -> Any:
+        """
+        sizeof gives the size a fetched value counts with, 1 by default
+        """
+        entry = self.get(key)
+        if entry is not None and entry.fresh:
+            return entry.value
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, fetch, cacheable, sizeof))
+            self._inflight[key] = future
+        return await asyncio.shield(future)
+
+    async def _fetch(
+            self,
+            key: Hashable,
+            fetch: Callable[[], Awaitable[Any]],
+            cacheable: Callable[[Any], bool],
+            sizeof: Optional[Callable[[Any], int]],
+    ) -> Any:
+        try:
+            value = await fetch()
+            if cacheable(value):
+                self.set(key, value, sizeof(value) if sizeof else 1)
+            return value
+        finally:
+            self._inflight.pop(key, None)
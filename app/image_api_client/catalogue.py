@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from uuid import UUID
+
+from image_api_client.client import Client
+from settings import settings
+
+catalogue_logger = logging.getLogger("collector_app.catalogue")
+
+
+class CollectTypesCatalogue:
+    """
+    In-process copy of the camguard collect types keyed by collect type id.
+
+    The catalogue is refreshed in background by run(). An unknown id triggers
+    an immediate refresh (shared by concurrent callers), but once the
+    catalogue has been loaded such refreshes happen at most every
+    miss_refresh_period seconds.
+    """
+
+    def __init__(self, refresh_period: float, miss_refresh_period: float = 10) -> None:
+        self.refresh_period = refresh_period
+        self.miss_refresh_period = miss_refresh_period
+        self._collect_types: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._refreshing: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._collect_types)
+
+    async def get(self, collect_type_id: Optional[UUID]) -> Optional[str]:
+        if collect_type_id is None:
+            return None
+        key = str(collect_type_id)
+        if key not in self._collect_types and self._can_refresh_on_miss():
+            await self.refresh()
+        return self._collect_types.get(key)
+
+    def _can_refresh_on_miss(self) -> bool:
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at >= self.miss_refresh_period
+        )
+
+    async def refresh(self) -> None:
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._load())
+            self._refreshing.add_done_callback(self._refreshed)
+        await asyncio.shield(self._refreshing)
+
+    def _refreshed(self, _: asyncio.Future) -> None:
+        self._refreshing = None
+
+    async def _load(self) -> None:
+        collect_types = await Client(None).get_collect_types()
+        if not isinstance(collect_types, list):
+            catalogue_logger.warning(f"Could not load collect types: {collect_types}")
+            return
+        self._collect_types = {
+            str(col_type["id"]): col_type["collect_type"] for col_type in collect_types
+        }
+        self._loaded_at = time.monotonic()
+        catalogue_logger.debug(f"Loaded {len(self._collect_types)} collect types")
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                catalogue_logger.exception(e)
+            await asyncio.sleep(self.refresh_period)
+
+
+collect_types_catalogue = CollectTypesCatalogue(settings.COLLECT_TYPES_REFRESH_PERIOD)
@@ -5,16 +5,25 @@ import aiohttp
 import base64
 import logging
 import backoff
+import deadlines
 import uuid
 
-from functools import partial
 from io import BytesIO
 from os import environ
 from exceptions.exceptions import ApiClientError, NoReferenceImageError
-from typing import Dict, Tuple, List, Optional
+from executors.cpu import cpu_executor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Tuple, List, Optional, Set
 from uuid import UUID
+from image_api_client.batcher import image_check_batcher, ping_check_batcher
+from image_api_client.cache import AsyncLRUCache, LRUCache
+from image_api_client.downscale import downscale, restore_response, scale_masks
+from image_api_client.hedging import detector_latency, hedged, timed
+from image_api_client.prefilter import change_prefilter, distance, fingerprint
+from image_api_client.sessions import session_manager
 from models.encoders import UUIDEncoder
-from models.remotes import ImageApiResponse
+from models.remotes import ImageApiResponse, ReferenceImage
 from settings import settings
 from PIL import Image
 
@@ -25,6 +34,19 @@ client_logger = logging.getLogger("collector_app.client_logger")
 
 RETRIES = int(environ.get("http_client_retries_number", default=5))
 
+reference_cache = LRUCache(
+    max_size=settings.REFERENCE_CACHE_SIZE, ttl=settings.REFERENCE_CACHE_TTL
+)
+sensor_cache = AsyncLRUCache(
+    max_size=settings.SENSOR_CACHE_SIZE, ttl=settings.SENSOR_CACHE_TTL
+)
+
+MULTIPART = "multipart"
+# Urls which rejected their first multipart upload, their uploads are sent as base64 JSON
+json_only_urls: Set[str] = set()
+# Urls which accepted a multipart upload, a client error of theirs is about the upload itself
+multipart_urls: Set[str] = set()
+
 
 def strip_image_prefix(base64_data: str):
     # data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD
@@ -39,6 +61,24 @@ def image_from_string(base64_data: str):
     return base64.b64decode(strip_image_prefix(base64_data))
 
 
+def image_to_string(image: bytes) -> str:
+    return base64.b64encode(image).decode("utf-8")
+
+
+def multipart_form(fields: Dict[str, Any], files: Dict[str, bytes]) -> aiohttp.FormData:
+    """
+    Raw image bytes are referenced by the form, not copied or encoded
+    """
+    form = aiohttp.FormData()
+    for name, value in fields.items():
+        if not isinstance(value, str):
+            value = str(value) if isinstance(value, UUID) else json.dumps(value, cls=UUIDEncoder)
+        form.add_field(name, value)
+    for name, image in files.items():
+        form.add_field(name, image, filename=name, content_type="application/octet-stream")
+    return form
+
+
 def get_im_size(image: bytes) -> Tuple[int, int]:
     try:
         f = BytesIO(image)
@@ -74,109 +114,277 @@ class Client:
 
     async def post_data(self, url, payload={}):
         client_logger.debug(f"POST for {url}")
-        async with aiohttp.ClientSession(
-                timeout=Client.TIMEOUT,
-                headers=self.headers,
-                json_serialize=partial(json.dumps, cls=UUIDEncoder),
-        ) as session:
-            async with session.post(url, json=payload) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                else:
-                    client_logger.warning(
-                        f"Got response with status {resp.status} and body {await resp.text()}"
-                    )
+        session = await session_manager.get_session()
+        async with session.post(
+                url, json=payload, headers=self.headers,
+                timeout=deadlines.bound_timeout(Client.TIMEOUT),
+        ) as resp:
+            if resp.status == 200:
+                return await resp.json()
+            else:
+                client_logger.warning(
+                    f"Got response with status {resp.status} and body {await resp.text()}"
+                )
+
+    @asynccontextmanager
+    async def post_files(
+            self, url: str, fields: Dict, files: Dict[str, bytes], **kwargs
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Uploads files as multipart/form-data. Files are sent as base64 strings
+        in a JSON body instead if upload_mode is "json" or the remote does not
+        accept multipart for this url: a 4xx to the first multipart upload to
+        a url is taken for that (a JSON-only FastAPI endpoint answers 422), the
+        upload is sent again as JSON and so are the later ones.
+        """
+        client_logger.debug(f"POST files for {url}")
+        session = await session_manager.get_session()
+        if settings.UPLOAD_MODE == MULTIPART and url not in json_only_urls:
+            async with session.post(url, data=multipart_form(fields, files), **kwargs) as resp:
+                if url in multipart_urls or not 400 <= resp.status < 500:
+                    if resp.status < 400:
+                        multipart_urls.add(url)
+                    yield resp
+                    return
+                # The remote may have answered without reading the body, the connection can not be reused
+                resp.close()
+            client_logger.info(f"{url} does not accept multipart uploads, falling back to JSON")
+            json_only_urls.add(url)
+        encoded = await asyncio.gather(
+            *[cpu_executor.run(image_to_string, image) for image in files.values()]
+        )
+        payload = {**fields, **dict(zip(files, encoded))}
+        async with session.post(url, json=payload, **kwargs) as resp:
+            yield resp
 
     async def get_data(self, url, params=None) -> ImageApiResponse:
         client_logger.debug(f"GET for {url}")
-        async with aiohttp.ClientSession(
-                timeout=Client.TIMEOUT, headers=self.headers
-        ) as session:
-            async with session.get(url, params=params) as resp:
-                return await resp.json()
+        session = await session_manager.get_session()
+        async with session.get(
+                url, params=params, headers=self.headers,
+                timeout=deadlines.bound_timeout(Client.TIMEOUT),
+        ) as resp:
+            return await resp.json()
 
     async def insert_first_reference_image(self, image, ext):
         self._image_id = await self.insert_image(image, ext=ext)
         await self.insert_reference_image(self._image_id)
 
     async def get_reference_image(self):
+        entry = reference_cache.get(self.sensor_id)
+        if entry is not None and entry.fresh:
+            reference: ReferenceImage = entry.value
+            return reference.image, reference.masks
         reference_image_ids = await self.get_reference_image_id()
         if not reference_image_ids:
+            reference_cache.invalidate(self.sensor_id)
             raise NoReferenceImageError()
         client_logger.debug(reference_image_ids)
-        reference_image = await self.get_image(reference_image_ids[0]["image_url"])
+        image_id = str(reference_image_ids[0]["image_id"])
         masks = reference_image_ids[0].get("mask")
         client_logger.debug(f"MASKS: {masks}")
-        return reference_image, masks
+        cached = entry.value if entry is not None and entry.value.image_id == image_id else None
+        reference_image, etag = await self.get_image_if_modified(
+            reference_image_ids[0]["image_url"], cached.etag if cached else None
+        )
+        if reference_image is None and etag and cached:
+            client_logger.debug(f"Reference image {image_id} was not modified")
+            reference = cached.copy(update={
+                "masks": masks,
+                "fingerprint": cached.fingerprint if masks == cached.masks else None,
+            })
+        elif reference_image:
+            image_width, image_height = get_im_size(reference_image)
+            reference = ReferenceImage(image_id=image_id,
+                                       image=reference_image,
+                                       masks=masks,
+                                       etag=etag,
+                                       image_width=image_width,
+                                       image_height=image_height)
+        else:
+            return reference_image, masks
+        reference_cache.set(self.sensor_id, reference, len(reference.image))
+        return reference.image, reference.masks
+
+    async def is_unchanged(self, test_image: bytes, reference_image: Optional[bytes],
+                           masks: Optional[List[dict]]) -> bool:
+        """
+        True if the change prefilter takes test_image for reference_image, the
+        reference fetched for this check, so the movement detector need not be asked.
+        The fingerprint is kept in the cache only while it still holds that reference
+        """
+        if reference_image is None:
+            return False
+        entry = reference_cache.get(self.sensor_id)
+        reference: Optional[ReferenceImage] = entry.value if entry is not None else None
+        if reference is not None and (reference.image is not reference_image or reference.masks != masks):
+            reference = None
+        try:
+            if reference is None:
+                reference_size = get_im_size(reference_image)
+                reference_fingerprint = await cpu_executor.run(
+                    fingerprint, reference_image, masks, reference_size, change_prefilter.size
+                )
+            else:
+                reference_size = (reference.image_width, reference.image_height)
+                if reference.fingerprint is None:
+                    reference.fingerprint = await cpu_executor.run(
+                        fingerprint, reference_image, masks, reference_size, change_prefilter.size
+                    )
+                reference_fingerprint = reference.fingerprint
+            test_fingerprint = await cpu_executor.run(
+                fingerprint, test_image, masks, reference_size, change_prefilter.size
+            )
+        except Exception as e:
+            change_prefilter.failed += 1
+            client_logger.warning(f"Change prefilter failed for {self.sensor_id}: {e}")
+            return False
+        return change_prefilter.record(distance(reference_fingerprint, test_fingerprint))
 
     async def request_to_detector_api(self,
-                                      data: dict,
+                                      data: Tuple[Dict, Dict[str, bytes]],
                                       api_version: int,
                                       height: int,
                                       width: int) -> ImageApiResponse:
         url = f"{IMAGE_API_URL}{api_version}/movement"
         client_logger.debug(url)
-        async with aiohttp.ClientSession(timeout=Client.TIMEOUT) as session:
-            async with session.post(url, json=data, ssl=False) as resp:
-                resp_json = await resp.json()
-                if resp.status != 200:
-                    detail = resp_json.get("detail", "image_api_error")
-                    raise ApiClientError(detail=detail)
-                resp = ImageApiResponse(image_height=height,
-                                        image_width=width,
-                                        **resp_json)
-                if resp.matches:
-                    img = image_from_string(resp.matches)
-                    resp.match_image_id = await self.insert_image(
-                        image=img
-                    )
-                return resp
+        fields, files = data
+        async with self.post_files(
+                url, fields, files, ssl=False, timeout=deadlines.bound_timeout(Client.TIMEOUT)
+        ) as resp:
+            resp_json = await resp.json()
+            if resp.status != 200:
+                detail = resp_json.get("detail", "image_api_error")
+                raise ApiClientError(detail=detail)
+            return ImageApiResponse(image_height=height,
+                                    image_width=width,
+                                    **resp_json)
+
+    async def insert_match_image(self, resp: ImageApiResponse) -> ImageApiResponse:
+        """
+        Stores the matches of the detector answer, once for the answer which
+        was used: hedged and timed are the detector requests only
+        """
+        if resp.matches:
+            img = await cpu_executor.run(image_from_string, resp.matches)
+            resp.match_image_id = await self.insert_image(
+                image=img
+            )
+        return resp
 
-    def __prepare_movement_request_data(self, reference_image, test_image, masks):
-        data_api = {
-            "ref_image": base64.b64encode(reference_image).decode("utf-8"),
-            "test_image": base64.b64encode(test_image).decode("utf-8"),
+    @staticmethod
+    def __prepare_movement_request_data(reference_image, test_image, masks):
+        fields = {
             "return_matches": True,
-            "mask": []
+            "mask": masks or [],
         }
-        if masks:
-            data_api["mask"] = masks
-        return data_api
+        files = {"ref_image": reference_image, "test_image": test_image}
+        return fields, files
 
     async def prepare_data_select_api_and_make_request(self,
                                                        test_image: bytes,
                                                        reference_image: bytes,
                                                        masks: List) -> ImageApiResponse:
         image_width, image_height = get_im_size(test_image)
-        data_api = self.__prepare_movement_request_data(reference_image, test_image, masks)
-        for api_version in settings.API_VERSIONS:
+        scale = None
+        if settings.DETECTOR_DOWNSCALE_ENABLED:
             try:
-                image_api_response = await self.request_to_detector_api(data_api,
-                                                                        api_version,
-                                                                        image_height,
-                                                                        image_width)
-            except aiohttp.ClientError as e:
-                client_logger.exception(e)
-                if api_version != settings.API_VERSIONS[-1]:
-                    continue
-                detail = "image_api_error"
-                raise ApiClientError(detail=detail)
+                (test_image, scale), (reference_image, reference_scale) = await asyncio.gather(
+                    self.downscale(test_image, (image_width, image_height)),
+                    self.downscale(reference_image, get_im_size(reference_image)),
+                )
+            except Exception as e:
+                # The originals are sent then
+                client_logger.warning(f"Images of {self.sensor_id} were not downscaled: {e}")
+            else:
+                masks = scale_masks(masks, reference_scale)
+        data_api = self.__prepare_movement_request_data(reference_image, test_image, masks)
+        if settings.DETECTOR_HEDGE_ENABLED:
+            image_api_response = await self.hedged_request_to_detector_api(data_api, image_height, image_width)
+        else:
+            for api_version in settings.API_VERSIONS:
+                try:
+                    image_api_response = await timed(
+                        partial(self.request_to_detector_api, data_api, api_version, image_height, image_width),
+                        detector_latency,
+                    )
+                    break
+                except aiohttp.ClientError as e:
+                    client_logger.exception(e)
+                    if api_version != settings.API_VERSIONS[-1]:
+                        continue
+                    detail = "image_api_error"
+                    raise ApiClientError(detail=detail)
+        image_api_response = await self.insert_match_image(image_api_response)
+        if scale:
+            return restore_response(image_api_response, scale)
         return image_api_response
 
+    async def hedged_request_to_detector_api(
+            self, data: Tuple[Dict, Dict[str, bytes]], height: int, width: int
+    ) -> ImageApiResponse:
+        """
+        Asks the next API version as well when the running requests are slower
+        than the hedge delay, the first answer wins. With a single version the
+        hedge is a second request to it, served by another connection
+        """
+        api_versions = settings.API_VERSIONS
+        if len(api_versions) == 1:
+            api_versions = api_versions * 2
+        try:
+            return await hedged(
+                [
+                    partial(self.request_to_detector_api, data, api_version, height, width)
+                    for api_version in api_versions
+                ],
+                detector_latency,
+                retryable=(aiohttp.ClientError, asyncio.TimeoutError),
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            client_logger.exception(e)
+            raise ApiClientError(detail="image_api_error")
+
+    @staticmethod
+    async def downscale(image: bytes, size: Tuple[int, int]) -> Tuple[bytes, Tuple[float, float]]:
+        if None in size:
+            raise ValueError("Image size is unknown")
+        return await cpu_executor.run(
+            downscale,
+            image,
+            size,
+            (settings.DETECTOR_IMAGE_WIDTH, settings.DETECTOR_IMAGE_HEIGHT),
+            settings.DETECTOR_IMAGE_FORMAT,
+            settings.DETECTOR_IMAGE_QUALITY,
+        )
+
     @staticmethod
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def get_image(url: str) -> bytes:
+        image, _ = await Client.get_image_if_modified(url)
+        return image
+
+    @staticmethod
+    async def get_image_if_modified(url: str, etag: str = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Conditional GET of an image. Returns (None, etag) if the image has not changed since etag
+        """
+        headers = {"If-None-Match": etag} if etag else None
         try:
-            async with aiohttp.ClientSession(timeout=Client.TIMEOUT) as session:
-                async with session.get(url) as resp:
-                    return await resp.read()
+            session = await session_manager.get_session()
+            async with session.get(
+                    url, headers=headers, timeout=deadlines.bound_timeout(Client.TIMEOUT)
+            ) as resp:
+                if resp.status == 304:
+                    return None, etag
+                return await resp.read(), resp.headers.get("ETag")
         except Exception as e:
             client_logger.exception(e)
+            return None, None
 
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def get_reference_image_id(self, reference=True) -> Dict:
         """
@@ -189,51 +397,68 @@ class Client:
         return await self.get_data(url, params)
 
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def insert_image(self, image: bytes, ext: str = "jpg") -> UUID:
         image_id = uuid.uuid4()
         url = f"{CAMERA_GUARD_BASE}/api/v1/images/"
-        payload = {
-            "id": image_id,
-            "image": base64.b64encode(image).decode("utf-8"),
-            "ext": ext,
-        }
-        await self.post_data(url, payload)
+        async with self.post_files(
+                url, {"id": image_id, "ext": ext}, {"image": image},
+                headers=self.headers, timeout=deadlines.bound_timeout(Client.TIMEOUT)
+        ) as resp:
+            if resp.status != 200:
+                client_logger.warning(
+                    f"Got response with status {resp.status} and body {await resp.text()}"
+                )
         return image_id
 
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def insert_reference_image(self, image_id: UUID) -> None:
         url = f"{CAMERA_GUARD_BASE}/api/v1/images/reference/"
         payload = {"sensor_id": self.sensor_id, "image_id": image_id}
+        reference_cache.invalidate(self.sensor_id)
         await self.post_data(url, payload)
 
+    async def get_sensor_data(self) -> Dict:
+        return await sensor_cache.get_or_fetch(
+            self.sensor_id,
+            self.fetch_sensor_data,
+            cacheable=lambda data: isinstance(data, dict) and "ip" in data,
+        )
+
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
-    async def get_sensor_data(self) -> Dict:
+    async def fetch_sensor_data(self) -> Dict:
         url = f"{CAMERA_GUARD_BASE}/api/v1/cameras/"
         payload = {"camera_id": str(self.sensor_id)}
         return await self.get_data(url, payload)
 
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def get_collect_types(self) -> List[Dict]:
         url = f"{CAMERA_GUARD_BASE}/api/v1/collects/"
         return await self.get_data(url)
 
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
+    )
+    async def get_schedules(self) -> List[Dict]:
+        url = f"{CAMERA_GUARD_BASE}/api/v1/schedules/"
+        return await self.get_data(url)
+
+    @backoff.on_exception(
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def insert_image_check(self, **kwargs) -> None:
         url = f"{CAMERA_GUARD_BASE}/api/v1/checks/insert_check"
         return await self.post_data(url, kwargs)
 
     @backoff.on_exception(
-        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None
+        backoff.expo, aiohttp.ClientError, max_tries=RETRIES, jitter=None, giveup=deadlines.expired
     )
     async def insert_sensor_ping(self, **kwargs) -> None:
         url = f"{CAMERA_GUARD_BASE}/api/v1/checks/insert_ping_check"
@@ -244,7 +469,7 @@ class Client:
         # For mock
         return uuid.uuid4()
 
-    async def insert_check(
+    def check_payload(
             self,
             image_id: Optional[UUID],
             has_image: bool,
@@ -252,7 +477,7 @@ class Client:
             detail,
             check_status,
             image_analize: ImageApiResponse = None,
-    ):
+    ) -> Dict:
         payload = {
             "id": self.generate_check_id(),
             "sensor_id": self.sensor_id,
@@ -265,10 +490,33 @@ class Client:
         if has_image:
             if not image_analize:
                 image_analize = ImageApiResponse.parse_obj(dict())
-            payload = dict(payload, **image_analize.dict())
+            return dict(payload, **image_analize.dict())
+        payload["image"] = has_image
+        return payload
+
+    async def insert_check(
+            self,
+            image_id: Optional[UUID],
+            has_image: bool,
+            collect_type_id: Optional[UUID],
+            detail,
+            check_status,
+            image_analize: ImageApiResponse = None,
+    ):
+        """
+        With check_batch enabled the check is only buffered, the returned
+        future resolves once the batch it was sent in is answered
+        """
+        payload = self.check_payload(
+            image_id, has_image, collect_type_id, detail, check_status, image_analize
+        )
+        if has_image:
+            if settings.CHECK_BATCH_ENABLED:
+                return await image_check_batcher.submit(payload)
             return await self.insert_image_check(**payload)
         else:
-            payload["image"] = has_image
+            if settings.CHECK_BATCH_ENABLED:
+                return await ping_check_batcher.submit(payload)
             return await self.insert_sensor_ping(**payload)
 
 
@@ -278,17 +526,18 @@ async def get_token(timeout):
         form = aiohttp.FormData(fields=auth)
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         try:
-            async with aiohttp.ClientSession(
-                    timeout=Client.TIMEOUT, headers=headers
-            ) as session:
-                async with session.post(
-                        f"{settings.CAMERA_GUARD_BASE}/api/v1/auth/token", data=form()
-                ) as resp:
-                    if resp.status == 200:
-                        resp_json = await resp.json()
-                        settings.TOKEN = resp_json["access_token"]
-                        settings.TOKEN_TYPE = resp_json["token_type"]
-                        client_logger.info("Obtained new token")
+            session = await session_manager.get_session()
+            async with session.post(
+                    f"{settings.CAMERA_GUARD_BASE}/api/v1/auth/token",
+                    data=form(),
+                    headers=headers,
+                    timeout=Client.TIMEOUT,
+            ) as resp:
+                if resp.status == 200:
+                    resp_json = await resp.json()
+                    settings.TOKEN = resp_json["access_token"]
+                    settings.TOKEN_TYPE = resp_json["token_type"]
+                    client_logger.info("Obtained new token")
         except Exception as e:
             client_logger.exception(e)
         finally:
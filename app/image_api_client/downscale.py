@@ -0,0 +1,84 @@
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy
+
+from models.remotes import ImageApiResponse
+
+ENCODINGS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+# JPEG is decoded at 1/2, 1/4 or 1/8 straight from the DCT, much faster than a full decode
+REDUCED_READS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+Scale = Tuple[float, float]
+
+
+def fit(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    size shrunk to fit into box with the aspect ratio kept, never enlarged.
+    A zero side of box is not limited
+    """
+    width, height = size
+    box_width, box_height = box
+    factor = min(
+        box_width / width if box_width else 1,
+        box_height / height if box_height else 1,
+        1,
+    )
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def downscale(
+        image: bytes, size: Tuple[int, int], box: Tuple[int, int], ext: str, quality: int
+) -> Tuple[bytes, Scale]:
+    """
+    Image of the given size fitted into box and encoded as ext, with the
+    x and y scale applied. Runs in cpu_executor
+    """
+    width, height = size
+    target = fit(size, box)
+    flags = cv2.IMREAD_COLOR
+    for factor, reduced in REDUCED_READS:
+        if width // factor >= target[0] and height // factor >= target[1]:
+            flags = reduced
+            break
+    frame = cv2.imdecode(numpy.frombuffer(image, numpy.uint8), flags)
+    if frame is None:
+        raise ValueError("Image can not be decoded")
+    if (frame.shape[1], frame.shape[0]) != target:
+        frame = cv2.resize(frame, target, interpolation=cv2.INTER_AREA)
+    extension, param = ENCODINGS[ext]
+    encoded, buffer = cv2.imencode(extension, frame, [param, quality])
+    if not encoded:
+        raise ValueError(f"Image can not be encoded as {ext}")
+    return buffer.tobytes(), (target[0] / width, target[1] / height)
+
+
+def scale_masks(masks: Optional[List[dict]], scale: Scale) -> Optional[List[dict]]:
+    if not masks:
+        return masks
+    scale_x, scale_y = scale
+    return [
+        dict(
+            mask,
+            x1=round(mask["x1"] * scale_x),
+            x2=round(mask["x2"] * scale_x),
+            y1=round(mask["y1"] * scale_y),
+            y2=round(mask["y2"] * scale_y),
+        )
+        for mask in masks
+    ]
+
+
+def restore_response(response: ImageApiResponse, scale: Scale) -> ImageApiResponse:
+    """
+    Coordinates found on the downscaled test image in its original pixels
+    """
+    scale_x, scale_y = scale
+    for field, factor in (("x", scale_x), ("size_x", scale_x), ("y", scale_y), ("size_y", scale_y)):
+        value = getattr(response, field)
+        if value is not None:
+            setattr(response, field, value / factor)
+    return response
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple, Type
+
+from settings import settings
+
+hedging_logger = logging.getLogger("collector_app.hedging")
+
+
+class LatencyTracker:
+    """
+    Latencies of the last window answers of a remote. delay() is their
+    percentile, or initial_delay while fewer than min_samples are known.
+    """
+
+    def __init__(self, window: int, percentile: float, initial_delay: float, min_samples: int) -> None:
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def delay(self) -> float:
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        latencies = sorted(self._latencies)
+        index = math.ceil(self.percentile / 100 * len(latencies)) - 1
+        return latencies[max(0, index)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self._latencies),
+            "hedge_delay": self.delay(),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+async def timed(call: Callable[[], Awaitable], tracker: LatencyTracker) -> Any:
+    started = time.monotonic()
+    result = await call()
+    tracker.record(time.monotonic() - started)
+    return result
+
+
+async def hedged(
+        calls: List[Callable[[], Awaitable]],
+        tracker: LatencyTracker,
+        retryable: Tuple[Type[BaseException], ...],
+) -> Any:
+    """
+    Result of the first of calls to succeed. The next call is started when
+    the running ones take longer than the hedge delay or one of them fails
+    with a retryable error; once one succeeds the others are cancelled.
+    Other errors are raised right away. If all calls fail the last error
+    is raised.
+
+    A cancelled call is recorded with the time it ran, a lower bound of its
+    latency: with the winners only the percentile would drift down to the
+    fast answers and hedge ever more requests.
+    """
+    # index and start time of the running calls
+    pending: Dict[asyncio.Future, Tuple[int, float]] = {}
+    error = None
+    remaining = list(enumerate(calls))
+    try:
+        while remaining or pending:
+            if remaining and (not pending or error is not None):
+                index, call = remaining.pop(0)
+                pending[asyncio.ensure_future(timed(call, tracker))] = index, time.monotonic()
+                error = None
+            delay = tracker.delay() if remaining else None
+            done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Slower than the hedge delay, ask the next one too
+                index, call = remaining.pop(0)
+                pending[asyncio.ensure_future(timed(call, tracker))] = index, time.monotonic()
+                tracker.hedged += 1
+                hedging_logger.debug(f"Request {index} is hedged")
+                continue
+            for future in done:
+                index, _ = pending.pop(future)
+                try:
+                    result = future.result()
+                except retryable as e:
+                    error = e
+                    continue
+                if index > 0:
+                    tracker.hedge_wins += 1
+                return result
+            if not pending and not remaining:
+                raise error
+    finally:
+        now = time.monotonic()
+        for future, (_, started) in pending.items():
+            future.cancel()
+            tracker.record(now - started)
+
+
+detector_latency = LatencyTracker(
+    window=settings.DETECTOR_HEDGE_WINDOW,
+    percentile=settings.DETECTOR_HEDGE_PERCENTILE,
+    initial_delay=settings.DETECTOR_HEDGE_DELAY,
+    min_samples=settings.DETECTOR_HEDGE_MIN_SAMPLES,
+)
@@ -0,0 +1,95 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy
+
+from settings import settings
+
+prefilter_logger = logging.getLogger("collector_app.prefilter")
+
+# Block contrast below this is noise (night, fog), it is not stretched further
+MIN_CONTRAST = 8.0
+
+
+def fingerprint(
+        image: bytes, masks: Optional[List[dict]], reference_size: Tuple[int, int], size: int
+) -> bytes:
+    """
+    size x size grayscale block means of the image normalized to zero mean
+    and unit contrast, as float32 bytes. Blocks mostly covered by masks
+    ({"x1", "y1", "x2", "y2"} in pixels of the reference image) are NaN.
+    Runs in the CPU executor.
+    """
+    frame = cv2.imdecode(numpy.frombuffer(image, numpy.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if frame is None:
+        raise ValueError("Image can not be decoded")
+    height, width = frame.shape
+    weights = numpy.ones((height, width), numpy.float32)
+    reference_width, reference_height = reference_size
+    for mask in masks or []:
+        x1, x2 = sorted((mask["x1"], mask["x2"]))
+        y1, y2 = sorted((mask["y1"], mask["y2"]))
+        weights[
+            int(y1 * height / reference_height):int(numpy.ceil(y2 * height / reference_height)),
+            int(x1 * width / reference_width):int(numpy.ceil(x2 * width / reference_width)),
+        ] = 0
+    sums = cv2.resize(frame * weights, (size, size), interpolation=cv2.INTER_AREA)
+    cover = cv2.resize(weights, (size, size), interpolation=cv2.INTER_AREA)
+    blocks = numpy.full((size, size), numpy.nan, numpy.float32)
+    visible = cover > 0.5
+    blocks[visible] = sums[visible] / cover[visible]
+    if visible.any():
+        values = blocks[visible]
+        blocks = (blocks - values.mean()) / max(float(values.std()), MIN_CONTRAST)
+    return blocks.astype(numpy.float32).tobytes()
+
+
+def distance(first: bytes, second: bytes) -> float:
+    """
+    Largest absolute difference of a block visible in both fingerprints,
+    inf if they have none in common. A mean would let a small object be
+    averaged out by the unchanged blocks
+    """
+    a, b = numpy.frombuffer(first, numpy.float32), numpy.frombuffer(second, numpy.float32)
+    if a.shape != b.shape:
+        return float("inf")
+    difference = numpy.abs(a - b)
+    visible = ~numpy.isnan(difference)
+    if not visible.any():
+        return float("inf")
+    return float(difference[visible].max())
+
+
+class ChangePrefilter:
+    """
+    Cheap local check in front of the movement detector: a test image whose
+    fingerprint is within threshold of the reference one is taken as
+    unchanged and not sent to the image API.
+    """
+
+    def __init__(self, enabled: bool, threshold: float, size: int) -> None:
+        self.enabled = enabled
+        self.threshold = threshold
+        self.size = size
+        self.unchanged = 0
+        self.changed = 0
+        self.failed = 0
+
+    def record(self, value: float) -> bool:
+        unchanged = value < self.threshold
+        if unchanged:
+            self.unchanged += 1
+        else:
+            self.changed += 1
+        return unchanged
+
+    def stats(self) -> Dict[str, int]:
+        return {"unchanged": self.unchanged, "changed": self.changed, "failed": self.failed}
+
+
+change_prefilter = ChangePrefilter(
+    enabled=settings.PREFILTER_ENABLED,
+    threshold=settings.PREFILTER_THRESHOLD,
+    size=settings.PREFILTER_SIZE,
+)
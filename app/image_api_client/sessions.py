@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+from models.encoders import UUIDEncoder
+from settings import settings
+
+sessions_logger = logging.getLogger("collector_app.sessions")
+
+
+class SessionManager:
+    """
+    Process-wide owner of the aiohttp connection pool.
+
+    All outgoing requests (camguard, image api and camera devices) share one
+    TCPConnector, so keep-alive connections and resolved hosts are reused
+    between checks instead of being set up for every call.
+    """
+
+    def __init__(
+            self,
+            limit: int,
+            limit_per_host: int,
+            dns_cache_ttl: int,
+            keepalive_timeout: float,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _is_started(self) -> bool:
+        return (
+            self._session is not None
+            and not self._session.closed
+            and self._loop is asyncio.get_event_loop()
+        )
+
+    async def start(self) -> None:
+        if self._is_started():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+            enable_cleanup_closed=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            json_serialize=partial(json.dumps, cls=UUIDEncoder),
+        )
+        sessions_logger.info(
+            f"HTTP pool started: limit={self.limit}, limit_per_host={self.limit_per_host}"
+        )
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        self._session, self._connector, self._loop = None, None, None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Shared session for stateless API calls, created lazily if the app was not started
+        """
+        await self.start()
+        return self._session
+
+    @asynccontextmanager
+    async def session(self, **kwargs) -> AsyncIterator[aiohttp.ClientSession]:
+        """
+        Short-lived session with its own auth and cookies on top of the shared pool.
+        Used by collectors which log in to a device before fetching an image.
+        """
+        await self.start()
+        session = aiohttp.ClientSession(
+            connector=self._connector, connector_owner=False, **kwargs
+        )
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+session_manager = SessionManager(
+    limit=settings.HTTP_POOL_LIMIT,
+    limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+)
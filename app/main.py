@@ -1,22 +1,75 @@
 import asyncio
+import json
 import uvicorn
 from logging.config import dictConfig
 import logging
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import ValidationError
 
+from collectors.capture.executor import capture_executor
+from collectors.capture.pool import stream_pool
+from collectors.hosts import host_guards
+from collectors.ping_engine import ping_engine
+from collectors.storage import object_storage
+from executors.cpu import cpu_executor
+from image_api_client.batcher import image_check_batcher, ping_check_batcher
+from image_api_client.catalogue import collect_types_catalogue
 from image_api_client.client import Client, get_token
+from image_api_client.hedging import detector_latency
+from image_api_client.prefilter import change_prefilter
+from image_api_client.sessions import session_manager
 from os import environ
-from models.api import Item
+from models.api import BatchResult, Item, RejectedItem
+from queues.durable import DurableQueue, SharedJobStore, SharedQueue, SQLiteJobStore
+from queues.fair import FairQueue
+from queues.periodic import PeriodicScheduler
 from settings import settings
 from settings.settings import RETRIES_NUMBER, QUEUE_SIZE, RETRIES_PERIOD
 from worker import create_workers
 from logging_conf import LOGGING_CONFIG
 
-QUEUE = asyncio.PriorityQueue()
-QUEUE_PRIORITY = {"ping": 0, "wectech": 4, "ftp": 3, "countmax": 1, "rtsp": 2, "xovis": 5}
+
+def make_queue() -> FairQueue:
+    if settings.QUEUE_BACKEND == "sqlite":
+        return DurableQueue(
+            SQLiteJobStore(settings.QUEUE_DIR),
+            sync_interval=settings.QUEUE_SYNC_INTERVAL,
+            weights=settings.COLLECTOR_WEIGHTS,
+            limits=settings.COLLECTOR_LIMITS,
+            coalesce=settings.QUEUE_COALESCE,
+            coalesce_running=settings.QUEUE_COALESCE_RUNNING,
+        )
+    if settings.QUEUE_BACKEND == "shared":
+        return SharedQueue(
+            SharedJobStore(
+                settings.QUEUE_DIR, lease=settings.QUEUE_LEASE, coalesce=settings.QUEUE_COALESCE
+            ),
+            sync_interval=settings.QUEUE_SYNC_INTERVAL,
+            prefetch=settings.QUEUE_PREFETCH,
+            weights=settings.COLLECTOR_WEIGHTS,
+            limits=settings.COLLECTOR_LIMITS,
+            coalesce=settings.QUEUE_COALESCE,
+            coalesce_running=settings.QUEUE_COALESCE_RUNNING,
+        )
+    return FairQueue(
+        weights=settings.COLLECTOR_WEIGHTS,
+        limits=settings.COLLECTOR_LIMITS,
+        coalesce=settings.QUEUE_COALESCE,
+        coalesce_running=settings.QUEUE_COALESCE_RUNNING,
+    )
+
+
+QUEUE = make_queue()
+# Retries are queued with priority 100, behind new jobs of their collect type
+JOB_PRIORITY = 0
 
 dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger("collector_app")
+if sum(settings.COLLECTOR_LIMITS.values()) >= QUEUE_SIZE:
+    logger.warning(
+        f"collector_limits {settings.COLLECTOR_LIMITS} allow slow jobs to take all {QUEUE_SIZE} workers"
+    )
 
 config = {"version": "v1",
           "openapi_url": "/api/v1/openapi.json",
@@ -35,50 +88,180 @@ async def ping():
     return {'result': True}
 
 
+@app.get("/metrics", status_code=200, include_in_schema=False)
+async def metrics():
+    return {
+        # A shared queue reports the jobs waiting for all processes of the replica
+        "queue_size": QUEUE.depth() if isinstance(QUEUE, SharedQueue) else QUEUE.qsize(),
+        "queue_sizes": QUEUE.sizes(),
+        "running": QUEUE.running(),
+        "coalesced": QUEUE.coalesced,
+        "cpu_executor": cpu_executor.stats(),
+        "capture_executor": capture_executor.stats(),
+        "image_check_batcher": image_check_batcher.stats(),
+        "ping_check_batcher": ping_check_batcher.stats(),
+        "scheduler": periodic_scheduler.stats(),
+        "hosts": host_guards.stats(),
+        "queue_store": QUEUE.stats() if isinstance(QUEUE, DurableQueue) else None,
+        "ping_engine": ping_engine.stats() if settings.PING_ENGINE_ENABLED else None,
+        "prefilter": change_prefilter.stats() if change_prefilter.enabled else None,
+        "detector": detector_latency.stats(),
+        "object_storage": object_storage.stats(),
+    }
+
+
+def make_job(item: Item, collect_type: str) -> tuple:
+    return (
+        JOB_PRIORITY,
+        (
+            item.sensor_id,
+            item.collect_type_id,
+            collect_type,
+            RETRIES_NUMBER,
+            None,
+            item.use_db,
+            Client(item.sensor_id),
+        ),
+    )
+
+
+def dispatch(item: Item, collect_type: str) -> None:
+    """
+    With ping_engine enabled ping checks bypass the job queue
+    """
+    if settings.PING_ENGINE_ENABLED and collect_type == "ping":
+        ping_engine.submit(Client(item.sensor_id), item.collect_type_id)
+    else:
+        QUEUE.put_nowait(make_job(item, collect_type))
+
+
 @app.post("/api/v1/collector_start/", response_model=Item)
 async def collector_start(item: Item):
     logger.debug(item)
     global QUEUE
-    collect_type = None
-    client = Client(item.sensor_id)
-    collect_types = await client.get_collect_types()
-    logger.debug(collect_types)
-    for col_type in collect_types:
-        if col_type["id"] == str(item.collect_type_id):
-            collect_type = col_type["collect_type"]
-            break
-    await QUEUE.put(
-        (
-            QUEUE_PRIORITY.get(collect_type, 100),
-            (
-                item.sensor_id,
-                item.collect_type_id,
-                collect_type,
-                RETRIES_NUMBER,
-                None,
-                item.use_db,
-                client,
-            ),
-        )
-    )
+    collect_type = await collect_types_catalogue.get(item.collect_type_id)
+    logger.debug(collect_type)
+    dispatch(item, collect_type)
     return item
 
 
+async def enqueue(item: Item) -> None:
+    collect_type = await collect_types_catalogue.get(item.collect_type_id)
+    dispatch(item, collect_type)
+
+
+periodic_scheduler = PeriodicScheduler(
+    enqueue=enqueue,
+    tick=settings.SCHEDULER_TICK,
+    wheel_size=settings.SCHEDULER_WHEEL_SIZE,
+    refresh_period=settings.SCHEDULES_REFRESH_PERIOD,
+    # The queue volume may be shared by replicas of one node, each partition has its own lock
+    lock_path=os.path.join(
+        settings.QUEUE_DIR, f"scheduler-{settings.SCHEDULER_PARTITION % settings.SCHEDULER_PARTITIONS}.lock"
+    ),
+    partitions=settings.SCHEDULER_PARTITIONS,
+    partition=settings.SCHEDULER_PARTITION,
+)
+
+
+def parse_batch(body: bytes, content_type: str) -> list:
+    """
+    A JSON list of items or NDJSON, one item per line
+    """
+    try:
+        if content_type.startswith("application/x-ndjson"):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed batch: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch must be a list of items")
+    return items
+
+
+@app.post("/api/v1/collector_start/batch", response_model=BatchResult)
+async def collector_start_batch(request: Request):
+    """
+    Enqueues many items at once. Invalid items and items of unknown collect
+    types are rejected, the others are enqueued
+    """
+    result = BatchResult()
+    items = []
+    content_type = request.headers.get("content-type", "")
+    for index, raw in enumerate(parse_batch(await request.body(), content_type)):
+        try:
+            items.append((index, Item.parse_obj(raw)))
+        except ValidationError as e:
+            result.errors.append(RejectedItem(index=index, detail=str(e)))
+    collect_type_ids = list({item.collect_type_id for _, item in items})
+    collect_types = dict(zip(
+        collect_type_ids,
+        await asyncio.gather(*[collect_types_catalogue.get(i) for i in collect_type_ids]),
+    ))
+    for index, item in items:
+        collect_type = collect_types[item.collect_type_id]
+        if item.collect_type_id is not None and collect_type is None:
+            result.errors.append(
+                RejectedItem(index=index, detail=f"Unknown collect type {item.collect_type_id}")
+            )
+            continue
+        dispatch(item, collect_type)
+        result.accepted += 1
+    result.rejected = len(result.errors)
+    logger.info(f"Batch enqueued: {result.accepted} accepted, {result.rejected} rejected")
+    return result
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting data-collector...")
     environ["http_proxy"] = settings.PROXY
+    await session_manager.start()
+    try:
+        await object_storage.start()
+    except Exception as e:
+        # Created again on the first download
+        logger.warning(f"S3 client was not created: {e}")
+    cpu_executor.start()
+    if settings.RTSP_POOL_ENABLED:
+        asyncio.ensure_future(stream_pool.run())
+    if settings.SCHEDULER_ENABLED:
+        asyncio.ensure_future(periodic_scheduler.run())
+    if settings.PING_ENGINE_ENABLED:
+        asyncio.ensure_future(ping_engine.run())
+    scheduler = None
+    if isinstance(QUEUE, DurableQueue):
+        await QUEUE.restore()
+        asyncio.ensure_future(QUEUE.run())
+        scheduler = QUEUE.scheduler
     [
         asyncio.ensure_future(coro)
         for coro in [
             create_workers(
-                task_queue=QUEUE, workers_count=QUEUE_SIZE, retry_period=RETRIES_PERIOD
+                task_queue=QUEUE,
+                workers_count=QUEUE_SIZE,
+                retry_period=RETRIES_PERIOD,
+                scheduler=scheduler,
             ),
             get_token(settings.TOKEN_TIMEOUT),
+            collect_types_catalogue.run(),
         ]
     ]
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("Stopping data-collector...")
+    await asyncio.gather(image_check_batcher.close(), ping_check_batcher.close())
+    if isinstance(QUEUE, DurableQueue):
+        await QUEUE.close()
+    await session_manager.close()
+    await object_storage.close()
+    stream_pool.close()
+    capture_executor.shutdown(wait=False)
+    cpu_executor.shutdown(wait=False)
+
+
 if settings.DEBUG:
     uvicorn.run(
         app, host="0.0.0.0", port=8003, loop="asyncio", log_config=LOGGING_CONFIG
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -8,3 +8,14 @@ class Item(BaseModel):
     sensor_id: UUID
     collect_type_id: Optional[UUID]
     use_db: Optional[bool] = False
+
+
+class RejectedItem(BaseModel):
+    index: int
+    detail: str
+
+
+class BatchResult(BaseModel):
+    accepted: int = 0
+    rejected: int = 0
+    errors: List[RejectedItem] = []
@@ -1,8 +1,9 @@
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat
 
+from models.api import Item
 from models.enums import CheckStatus
 
 
@@ -25,3 +26,23 @@ class CheckResult(BaseModel):
     check_status: Optional[CheckStatus] = CheckStatus.IN_PROGRESS
     image: Optional[bytes] = None
     extension: Optional[str] = None
+
+
+class ReferenceImage(BaseModel):
+    image_id: str
+    image: bytes
+    masks: Optional[List[dict]] = None
+    etag: Optional[str] = None
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    # Change prefilter fingerprint, computed on first use
+    fingerprint: Optional[bytes] = None
+
+
+class Schedule(Item):
+    # seconds between checks
+    interval: confloat(gt=0)
+
+    @property
+    def key(self) -> tuple:
+        return self.sensor_id, self.collect_type_id
@@ -0,0 +1,55 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, List, Optional, Tuple
+
+
+class DelayedJobScheduler:
+    """
+    Timer heap for jobs which must not run before their exec_time.
+
+    Jobs are kept out of the ready queue until they are due, so workers only
+    ever block on queue.get() instead of polling and re-enqueueing retries.
+    A single loop timer is armed for the earliest exec_time in the heap.
+    """
+
+    def __init__(self, queue: asyncio.Queue) -> None:
+        self.queue = queue
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, exec_time: float, item: Any) -> None:
+        """
+        Put item into the ready queue at exec_time (unix timestamp)
+        """
+        entry = (exec_time, next(self._counter), item)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._arm()
+
+    def cancel(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _arm(self) -> None:
+        self.cancel()
+        if self._heap:
+            delay = max(0.0, self._heap[0][0] - time.time())
+            self._timer = asyncio.get_event_loop().call_later(delay, self._release)
+
+    def _release(self) -> None:
+        self._timer = None
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, item = heapq.heappop(self._heap)
+            self._put(item)
+        self._arm()
+
+    def _put(self, item: Any) -> None:
+        self.queue.put_nowait(item)
@@ -0,0 +1,536 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from image_api_client.client import Client
+from models.encoders import UUIDEncoder
+from queues.delayed import DelayedJobScheduler
+from queues.fair import FairQueue, collect_type_of, job_key
+
+queue_logger = logging.getLogger("collector_app.queue")
+
+# id, priority, visible_at, payload
+Row = Tuple[str, int, float, str]
+
+
+def encode_job(item: Tuple[int, tuple]) -> Tuple[int, str]:
+    """
+    The client and the continuation of a resumed job are not stored, a
+    restored job is collected from the start
+    """
+    priority, (sensor_id, collect_type_id, collect_type, retry_count, exec_time, use_db, *_) = item
+    payload = {
+        "sensor_id": sensor_id,
+        "collect_type_id": collect_type_id,
+        "collect_type": collect_type,
+        "retry_count": retry_count,
+        "exec_time": exec_time,
+        "use_db": use_db,
+    }
+    return priority, json.dumps(payload, cls=UUIDEncoder)
+
+
+def decode_job(priority: int, payload: str) -> Tuple[int, tuple]:
+    job = json.loads(payload)
+    sensor_id = UUID(job["sensor_id"])
+    collect_type_id = job["collect_type_id"] and UUID(job["collect_type_id"])
+    return (
+        priority,
+        (
+            sensor_id,
+            collect_type_id,
+            job["collect_type"],
+            job["retry_count"],
+            job["exec_time"],
+            job["use_db"],
+            Client(sensor_id),
+        ),
+    )
+
+
+class SQLiteJobStore:
+    """
+    Jobs of a DurableQueue in an SQLite database in WAL mode.
+
+    add() and ack() only buffer the change, flush() writes everything
+    buffered since the previous flush in one transaction from a thread, so a
+    whole batch costs a single fsync. A job acked before it was flushed is
+    never written at all.
+
+    Every process claims its own database file jobs-<n>.db in directory by
+    an exclusive lock, so a restarted process takes over the jobs of the one
+    which died.
+
+    The connection is used by one thread at a time, a call waits for the
+    thread of the previous one even if the task which started it was
+    cancelled.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._lock: Optional[IO] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._added: Dict[str, Tuple[str, int, str, float, str]] = {}
+        self._acked: List[str] = []
+        self._busy: Optional[asyncio.Future] = None
+
+    def open(self) -> List[Row]:
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = self._claim()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, key TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "collect_type TEXT NOT NULL, "
+            "visible_at REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        return self._connection.execute(
+            "SELECT id, priority, visible_at, payload FROM jobs"
+        ).fetchall()
+
+    def _claim(self) -> str:
+        for index in itertools.count():
+            path = os.path.join(self.directory, f"jobs-{index}.db")
+            lock = open(f"{path}.lock", "w")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            self._lock = lock
+            return path
+
+    def add(
+            self,
+            job_id: str,
+            key: str,
+            priority: int,
+            collect_type: str,
+            visible_at: float,
+            payload: str,
+    ) -> None:
+        self._added[job_id] = (key, priority, collect_type, visible_at, payload)
+
+    def ack(self, job_id: str) -> None:
+        if self._added.pop(job_id, None) is None:
+            self._acked.append(job_id)
+
+    def pending(self) -> int:
+        return len(self._added) + len(self._acked)
+
+    async def flush(self) -> None:
+        if self._added or self._acked:
+            await self._run_buffered(self._write)
+
+    async def _run_in_thread(self, call: Callable, *args) -> Any:
+        while self._busy is not None and not self._busy.done():
+            await asyncio.wait([self._busy])
+        self._busy = asyncio.get_running_loop().run_in_executor(None, call, *args)
+        return await asyncio.shield(self._busy)
+
+    async def _run_buffered(self, write: Callable, *args) -> Any:
+        """
+        Runs write(added, acked, *args) in a thread with the buffered changes
+        """
+        added, self._added = self._added, {}
+        acked, self._acked = self._acked, []
+        try:
+            return await self._run_in_thread(write, added, acked, *args)
+        except Exception:
+            # Retried with the next batch
+            self._added = {**added, **self._added}
+            self._acked = acked + self._acked
+            raise
+
+    def _write(self, added: Dict[str, Tuple[str, int, str, float, str]], acked: List[str]) -> None:
+        with self._connection:
+            self._apply(added, acked)
+
+    def _apply(self, added: Dict[str, Tuple[str, int, str, float, str]], acked: List[str]) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO jobs (id, key, priority, collect_type, visible_at, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(job_id, *row) for job_id, row in added.items()],
+        )
+        self._connection.executemany(
+            "DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in acked]
+        )
+
+    async def close(self) -> None:
+        if self._connection is None:
+            return
+        await self.flush()
+        await self._run_in_thread(self._close)
+
+    def _close(self) -> None:
+        self._connection.close()
+        self._connection = None
+        self._lock.close()
+
+
+class DurableScheduler(DelayedJobScheduler):
+    """
+    Delayed jobs of a DurableQueue are stored as soon as they are scheduled
+    """
+
+    def schedule(self, exec_time: float, item: Any) -> None:
+        self.hold(exec_time, self.queue.store_job(item, exec_time), item)
+
+    def hold(self, exec_time: float, job_id: str, item: Any) -> None:
+        super().schedule(exec_time, (job_id, item))
+
+    def _put(self, entry: Tuple[str, Any]) -> None:
+        self.queue.put_stored(*entry)
+
+
+class DurableQueue(FairQueue):
+    """
+    FairQueue whose jobs survive a restart of the process.
+
+    A job is stored on put and deleted on task_done(), so a job which was
+    queued, delayed or running when the process died is delivered again by
+    restore() (at least once). Jobs of scheduler are stored with their
+    exec_time and become visible at that time. Changes are written every
+    sync_interval seconds, a crash loses at most that much.
+    """
+
+    def __init__(
+            self,
+            store: SQLiteJobStore,
+            sync_interval: float,
+            weights: Dict[str, float] = None,
+            limits: Dict[str, int] = None,
+            default_weight: float = 1,
+            coalesce: bool = False,
+            coalesce_running: bool = False,
+    ) -> None:
+        super().__init__(weights, limits, default_weight, coalesce, coalesce_running)
+        self.store = store
+        self.sync_interval = sync_interval
+        self.scheduler = DurableScheduler(self)
+        self._acks: Dict[asyncio.Task, str] = {}
+        self._runner: Optional[asyncio.Task] = None
+
+    def put_nowait(self, item: Tuple[int, tuple]) -> None:
+        self.put_stored(self.store_job(item), item)
+
+    def store_job(self, item: Tuple[int, tuple], visible_at: float = 0, **options) -> str:
+        job_id = uuid.uuid4().hex
+        priority, payload = encode_job(item)
+        key = "/".join(map(str, job_key(item)))
+        self.store.add(job_id, key, priority, collect_type_of(item), visible_at, payload, **options)
+        return job_id
+
+    def put_stored(self, job_id: str, item: Tuple[int, tuple]) -> None:
+        # The stored job id is the tag of the queued job
+        self._put(item, job_id)
+
+    def _drop(self, item: Tuple[int, tuple], job_id: str) -> None:
+        self.store.ack(job_id)
+
+    def get_nowait(self) -> Tuple[int, tuple]:
+        item, job_id = self._take()
+        task = asyncio.current_task()
+        if task is not None:
+            self._acks[task] = job_id
+        return item
+
+    def task_done(self) -> None:
+        job_id = self._acks.pop(asyncio.current_task(), None)
+        if job_id is not None:
+            self.store.ack(job_id)
+        super().task_done()
+
+    async def restore(self) -> None:
+        rows = await asyncio.get_running_loop().run_in_executor(None, self.store.open)
+        now = time.time()
+        for job_id, priority, visible_at, payload in rows:
+            item = decode_job(priority, payload)
+            if visible_at > now:
+                self.scheduler.hold(visible_at, job_id, item)
+            else:
+                self.put_stored(job_id, item)
+        queue_logger.info(f"Restored {len(rows)} jobs from {self.store.path}")
+
+    async def sync(self) -> None:
+        await self.store.flush()
+
+    async def run(self) -> None:
+        self._runner = asyncio.current_task()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                queue_logger.exception(e)
+
+    async def close(self) -> None:
+        """
+        Stops run() and writes what is left
+        """
+        self.scheduler.cancel()
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.wait([self._runner])
+            self._runner = None
+        await self.store.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"unsynced": self.store.pending(), "delayed": len(self.scheduler)}
+
+
+class SharedJobStore(SQLiteJobStore):
+    """
+    Job table shared by all processes of a replica in directory/shared.db.
+
+    A job belongs to no process until one of them claims it with sync(),
+    which leases it for lease seconds. Every sync renews the leases of the
+    jobs the process holds, so the jobs of a process which died are claimed
+    by the others once their lease expires.
+
+    With coalesce a job whose key is already waiting in the table is merged
+    into the waiting one, which takes the better priority and the earlier
+    visible_at of the two.
+    """
+
+    def __init__(
+            self, directory: str, lease: float, coalesce: bool = False, depth_interval: float = 1
+    ) -> None:
+        super().__init__(directory)
+        self.lease = lease
+        self.coalesce = coalesce
+        self.depth_interval = depth_interval
+        self.owner = uuid.uuid4().hex
+        self._depth = 0
+        self._counted = 0.0
+        self._renewed = 0.0
+
+    def open(self) -> List[Row]:
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, "shared.db")
+        # Transactions are begun explicitly, claims must take the write lock up front
+        self._connection = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, key TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "collect_type TEXT NOT NULL, "
+            "visible_at REAL NOT NULL, payload TEXT NOT NULL, "
+            "owner TEXT, leased_until REAL NOT NULL DEFAULT 0)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_order ON jobs (priority, visible_at)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (leased_until, visible_at)"
+        )
+        if self.coalesce:
+            self._connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS jobs_waiting ON jobs (key) WHERE owner IS NULL"
+            )
+        else:
+            self._connection.execute("DROP INDEX IF EXISTS jobs_waiting")
+        return []
+
+    def add(
+            self,
+            job_id: str,
+            key: str,
+            priority: int,
+            collect_type: str,
+            visible_at: float,
+            payload: str,
+            owned: bool = False,
+    ) -> None:
+        """
+        An owned job is leased to this process right away, the others do not
+        claim it while the lease is renewed
+        """
+        self._added[job_id] = (key, priority, collect_type, visible_at, payload, owned)
+
+    def depth(self) -> int:
+        """
+        Visible jobs nobody had claimed when they were last counted (at most
+        depth_interval seconds ago), and the ones added since
+        """
+        return self._depth + len(self._added)
+
+    async def sync(self, limit: int, excluded: List[str]) -> List[Row]:
+        """
+        Writes the buffered changes and claims up to limit visible jobs of
+        collect types other than excluded
+        """
+        return await self._run_buffered(self._sync, limit, excluded)
+
+    def _write(self, added: Dict[str, Tuple[str, int, str, float, str]], acked: List[str]) -> None:
+        self._sync(added, acked, 0, [])
+
+    def _apply(self, added: Dict[str, Tuple[str, int, str, float, str, bool]], acked: List[str]) -> None:
+        leased_until = time.time() + self.lease
+        rows = [
+            (job_id, *row, self.owner if owned else None, leased_until if owned else 0)
+            for job_id, (*row, owned) in added.items()
+        ]
+        insert = (
+            "INSERT INTO jobs (id, key, priority, collect_type, visible_at, payload, owner, leased_until) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        )
+        if self.coalesce:
+            # Owned jobs are not covered by the partial index, they are never merged
+            insert += (
+                "ON CONFLICT (key) WHERE owner IS NULL DO UPDATE SET "
+                "priority = min(priority, excluded.priority), "
+                "visible_at = min(visible_at, excluded.visible_at)"
+            )
+        else:
+            insert = insert.replace("INSERT", "INSERT OR REPLACE", 1)
+        self._connection.executemany(insert, rows)
+        self._connection.executemany(
+            "DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in acked]
+        )
+
+    def _sync(
+            self,
+            added: Dict[str, Tuple[str, int, str, float, str]],
+            acked: List[str],
+            limit: int,
+            excluded: List[str],
+    ) -> List[Row]:
+        now = time.time()
+        condition = "visible_at <= ? AND leased_until <= ?"
+        if excluded:
+            condition += f" AND collect_type NOT IN ({', '.join('?' * len(excluded))})"
+        params = [now, now, *excluded]
+        renew = now - self._renewed > self.lease / 3
+        write = bool(added or acked or renew)
+        if not write and limit > 0:
+            # Idle processes poll, the write lock is only taken when there is work
+            write = self._connection.execute(
+                f"SELECT 1 FROM jobs WHERE {condition} LIMIT 1", params
+            ).fetchone() is not None
+        rows = []
+        if write:
+            with self._connection:
+                self._connection.execute("BEGIN IMMEDIATE")
+                self._apply(added, acked)
+                if renew:
+                    self._connection.execute(
+                        "UPDATE jobs SET leased_until = ? WHERE owner = ?",
+                        (now + self.lease, self.owner),
+                    )
+                    self._renewed = now
+                if limit > 0:
+                    rows = self._connection.execute(
+                        f"SELECT id, priority, visible_at, payload FROM jobs WHERE {condition} "
+                        "ORDER BY priority, visible_at, rowid LIMIT ?",
+                        [*params, limit],
+                    ).fetchall()
+                    self._connection.executemany(
+                        "UPDATE jobs SET owner = ?, leased_until = ? WHERE id = ?",
+                        [(self.owner, now + self.lease, row[0]) for row in rows],
+                    )
+        if now - self._counted >= self.depth_interval:
+            self._depth = self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE leased_until <= ? AND visible_at <= ?", (now, now)
+            ).fetchone()[0]
+            self._counted = now
+        return rows
+
+    def _close(self) -> None:
+        # Jobs this process did not finish go to the other processes right away
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute(
+                "UPDATE OR IGNORE jobs SET owner = NULL, leased_until = 0 WHERE owner = ?",
+                (self.owner,),
+            )
+            # The ones left are duplicates of waiting jobs
+            self._connection.execute("DELETE FROM jobs WHERE owner = ?", (self.owner,))
+        self._connection.close()
+        self._connection = None
+
+
+class SharedScheduler(DurableScheduler):
+    """
+    Delayed jobs of a SharedQueue are only stored, the process which claims
+    them once they are visible runs them.
+
+    A resumed job keeps its continuation in memory, so it is leased to this
+    process and held here until it is due. If the process dies the lease
+    expires and another process collects the job from the start.
+    """
+
+    def schedule(self, exec_time: float, item: Any) -> None:
+        _, job = item
+        if len(job) > 7:
+            self.hold(exec_time, self.queue.store_job(item, exec_time, owned=True), item)
+        else:
+            self.queue.store_job(item, exec_time)
+
+
+class SharedQueue(DurableQueue):
+    """
+    DurableQueue shared by all gunicorn processes of a replica, so HTTP
+    intake and collection are decoupled.
+
+    put() only stores a job, any process may run it. Every sync_interval a
+    process claims as many visible jobs as it has idle workers plus
+    prefetch, skipping collect types which are at their limit, so idle
+    processes take over the backlog while busy ones hold little of it.
+    """
+
+    def __init__(
+            self,
+            store: SharedJobStore,
+            sync_interval: float,
+            prefetch: int,
+            weights: Dict[str, float] = None,
+            limits: Dict[str, int] = None,
+            default_weight: float = 1,
+            coalesce: bool = False,
+            coalesce_running: bool = False,
+    ) -> None:
+        super().__init__(
+            store, sync_interval, weights, limits, default_weight, coalesce, coalesce_running
+        )
+        self.prefetch = prefetch
+        self.scheduler = SharedScheduler(self)
+
+    def put_nowait(self, item: Tuple[int, tuple]) -> None:
+        self.store_job(item)
+
+    def depth(self) -> int:
+        """
+        Jobs waiting for any process of the replica
+        """
+        return self.store.depth()
+
+    def blocked(self) -> List[str]:
+        return [collect_type for collect_type in self.limits if self._at_limit(collect_type)]
+
+    async def restore(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.store.open)
+        queue_logger.info(f"Sharing jobs in {self.store.path}")
+
+    async def sync(self) -> None:
+        idle = sum(not getter.done() for getter in self._getters)
+        wanted = idle + self.prefetch - self.qsize()
+        for job_id, priority, _, payload in await self.store.sync(wanted, self.blocked()):
+            self.put_stored(job_id, decode_job(priority, payload))
+
+    def stats(self) -> Dict[str, int]:
+        return {"unsynced": self.store.pending(), "depth": self.store.depth()}
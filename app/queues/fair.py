@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+DEFAULT_TYPE = "default"
+
+
+def collect_type_of(item: Tuple[int, tuple]) -> str:
+    _, job = item
+    return job[2] or DEFAULT_TYPE
+
+
+def job_key(item: Tuple[int, tuple]) -> tuple:
+    """
+    Jobs with the same key check the same thing the same way: sensor_id,
+    collect_type_id, use_db and collect_type
+    """
+    _, job = item
+    return job[0], job[1], job[5], job[2]
+
+
+class FairQueue:
+    """
+    Drop-in replacement of the worker asyncio.PriorityQueue which shares
+    workers between collect types.
+
+    Every collect type has its own priority heap. get() serves the types by
+    deficit round robin, a type gets weights[type] jobs per round (default
+    weight 1), so a backlog of one type only delays the others by their
+    share. A type with limits[type] jobs running is skipped until one of them
+    is finished; a job counts as running from get() until the same task
+    calls task_done().
+
+    With coalesce a job whose key is already queued is dropped, the queued
+    one keeps its place and takes the better priority of the two. With
+    coalesce_running a job whose key is running is dropped too, its check
+    is the result of the running one.
+
+    Subclasses may queue a job with a tag, an opaque value which is handed
+    back with it by _take() or _drop().
+    """
+
+    def __init__(
+            self,
+            weights: Dict[str, float] = None,
+            limits: Dict[str, int] = None,
+            default_weight: float = 1,
+            coalesce: bool = False,
+            coalesce_running: bool = False,
+    ) -> None:
+        self.weights = weights or {}
+        self.limits = limits or {}
+        self.default_weight = default_weight
+        if min([default_weight, *self.weights.values()]) <= 0:
+            raise ValueError("Collect type weights must be positive")
+        # priority, sequence number, item, tag
+        self._queues: Dict[str, List[Tuple[int, int, Any, Any]]] = {}
+        self._active: Deque[str] = deque()
+        self._current: Optional[str] = None
+        self._deficit: Dict[str, float] = {}
+        self._running: Counter = Counter()
+        self._holders: Dict[asyncio.Task, Tuple[str, tuple]] = {}
+        self.coalesce = coalesce
+        self.coalesce_running = coalesce_running
+        # Heap entries of the queued jobs and counts of the running ones by job key
+        self._queued: Dict[tuple, Tuple[str, Tuple[int, int, Any, Any]]] = {}
+        self._running_keys: Counter = Counter()
+        self.coalesced = 0
+        self._getters: Deque[asyncio.Future] = deque()
+        self._counter = itertools.count()
+        self._size = 0
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def sizes(self) -> Dict[str, int]:
+        return {collect_type: len(queue) for collect_type, queue in self._queues.items()}
+
+    def running(self) -> Dict[str, int]:
+        return dict(+self._running)
+
+    async def put(self, item: Tuple[int, tuple]) -> None:
+        self.put_nowait(item)
+
+    def put_nowait(self, item: Tuple[int, tuple]) -> None:
+        self._put(item)
+
+    def _put(self, item: Tuple[int, tuple], tag: Any = None) -> None:
+        key = job_key(item)
+        if self.coalesce and self._coalesce(key, item):
+            self.coalesced += 1
+            self._drop(item, tag)
+            return
+        collect_type = collect_type_of(item)
+        queue = self._queues.setdefault(collect_type, [])
+        if not queue:
+            self._active.append(collect_type)
+            self._deficit[collect_type] = 0
+        entry = (item[0], next(self._counter), item, tag)
+        heapq.heappush(queue, entry)
+        if self.coalesce:
+            self._queued[key] = (collect_type, entry)
+        self._size += 1
+        self._wakeup()
+
+    def _coalesce(self, key: tuple, item: Tuple[int, tuple]) -> bool:
+        """
+        True if item is a duplicate of a queued or running job
+        """
+        if self.coalesce_running and self._running_keys[key]:
+            return True
+        queued = self._queued.get(key)
+        if queued is None:
+            return False
+        collect_type, entry = queued
+        if item[0] < entry[0]:
+            # Rare, so a linear search in the heap is good enough
+            queue = self._queues[collect_type]
+            promoted = (item[0], *entry[1:])
+            queue[queue.index(entry)] = promoted
+            heapq.heapify(queue)
+            self._queued[key] = (collect_type, promoted)
+        return True
+
+    def _drop(self, item: Tuple[int, tuple], tag: Any) -> None:
+        """
+        Called for a job which was coalesced into another one
+        """
+
+    async def get(self) -> Tuple[int, tuple]:
+        while True:
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:
+                getter = asyncio.get_running_loop().create_future()
+                self._getters.append(getter)
+                try:
+                    await getter
+                except asyncio.CancelledError:
+                    # Pass the wakeup on if it was meant for this getter
+                    if getter.done() and not getter.cancelled():
+                        self._wakeup()
+                    raise
+
+    def get_nowait(self) -> Tuple[int, tuple]:
+        item, _ = self._take()
+        return item
+
+    def _take(self) -> Tuple[Tuple[int, tuple], Any]:
+        """
+        Next job and its tag
+        """
+        picked = self._pick()
+        if picked is None:
+            raise asyncio.QueueEmpty
+        collect_type, item, tag = picked
+        self._size -= 1
+        self._running[collect_type] += 1
+        key = job_key(item)
+        if self.coalesce:
+            del self._queued[key]
+        task = asyncio.current_task()
+        if task is not None:
+            self._holders[task] = collect_type, key
+            self._running_keys[key] += 1
+        return item, tag
+
+    def task_done(self) -> None:
+        collect_type, key = self._holders.pop(asyncio.current_task(), (None, None))
+        if collect_type is not None:
+            self._running[collect_type] -= 1
+            self._running_keys[key] -= 1
+            if not self._running_keys[key]:
+                del self._running_keys[key]
+            if self._queues.get(collect_type):
+                self._wakeup()
+
+    def _at_limit(self, collect_type: str) -> bool:
+        limit = self.limits.get(collect_type)
+        return bool(limit) and self._running[collect_type] >= limit
+
+    def _pick(self) -> Optional[Tuple[str, Any, Any]]:
+        if not any(not self._at_limit(collect_type) for collect_type in self._active):
+            return None
+        while True:
+            collect_type = self._active[0]
+            if not self._at_limit(collect_type):
+                if collect_type != self._current:
+                    self._current = collect_type
+                    self._deficit[collect_type] += self.weights.get(collect_type, self.default_weight)
+                if self._deficit[collect_type] >= 1:
+                    self._deficit[collect_type] -= 1
+                    queue = self._queues[collect_type]
+                    _, _, item, tag = heapq.heappop(queue)
+                    if not queue:
+                        self._active.popleft()
+                        self._current = None
+                    return collect_type, item, tag
+            self._active.rotate(-1)
+            self._current = None
+
+    def _wakeup(self) -> None:
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
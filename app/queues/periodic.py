@@ -0,0 +1,208 @@
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import os
+import random
+import zlib
+from typing import IO, Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from image_api_client.client import Client
+from models.remotes import Schedule
+from settings import settings
+
+scheduler_logger = logging.getLogger("collector_app.scheduler")
+
+# Seconds between attempts to take the scheduler lock over
+LOCK_RETRY_PERIOD = 5
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel of size slots, tick seconds each.
+
+    add(), remove() and advance() by one tick cost O(1) per entry involved,
+    however many entries wait in the wheel. An entry due more than size ticks
+    ahead stays in its slot until the wheel comes round to it again.
+    """
+
+    def __init__(self, tick: float, size: int) -> None:
+        self.tick = tick
+        self.size = size
+        self.current = 0
+        self._slots: List[Dict[Any, int]] = [{} for _ in range(size)]
+        self._slot_of: Dict[Any, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._slot_of
+
+    def add(self, key: Any, delay: float) -> None:
+        """
+        (Re)schedules key to fire delay seconds from the current tick
+        """
+        self.remove(key)
+        due = self.current + max(1, math.ceil(delay / self.tick))
+        slot = due % self.size
+        self._slots[slot][key] = due
+        self._slot_of[key] = slot
+
+    def remove(self, key: Any) -> None:
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self) -> List[Any]:
+        """
+        Moves to the next tick and returns the keys which became due
+        """
+        self.current += 1
+        slot = self._slots[self.current % self.size]
+        due = [key for key, due in slot.items() if due <= self.current]
+        for key in due:
+            del slot[key]
+            del self._slot_of[key]
+        return due
+
+
+class PeriodicScheduler:
+    """
+    Puts a job for every schedule into the worker queue each schedule.interval
+    seconds, without an external trigger per check.
+
+    The first run of a new schedule is placed at a random point of its
+    interval, so schedules loaded together do not all fire on the same tick.
+    Ticks are counted from the start time, a slow tick does not shift the
+    following ones.
+
+    Only one process runs the schedules of a partition: the one holding the
+    flock on lock_path, the others wait to take it over when that process
+    exits, so every partition needs a lock_path of its own. Replicas split the schedules by a hash of their key, a replica
+    runs the ones of its partition out of partitions.
+    """
+
+    def __init__(
+            self,
+            enqueue: Callable[[Schedule], Awaitable[None]],
+            tick: float,
+            wheel_size: int,
+            refresh_period: float,
+            lock_path: Optional[str] = None,
+            partitions: int = 1,
+            partition: int = 0,
+    ) -> None:
+        self.enqueue = enqueue
+        self.refresh_period = refresh_period
+        self.lock_path = lock_path
+        self.partitions = partitions
+        self.partition = partition % partitions
+        self.wheel = TimingWheel(tick, wheel_size)
+        self._schedules: Dict[tuple, Schedule] = {}
+        self._lock: Optional[IO] = None
+        self.enqueued = 0
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def owns(self, schedule: Schedule) -> bool:
+        return zlib.crc32(str(schedule.key).encode()) % self.partitions == self.partition
+
+    def set_schedules(self, schedules: List[Schedule]) -> None:
+        schedules = {schedule.key: schedule for schedule in schedules if self.owns(schedule)}
+        for key in self._schedules.keys() - schedules.keys():
+            self.wheel.remove(key)
+        for key, schedule in schedules.items():
+            current = self._schedules.get(key)
+            if current is None or current.interval != schedule.interval:
+                self.wheel.add(key, random.uniform(0, schedule.interval))
+        self._schedules = schedules
+        scheduler_logger.info(f"{len(schedules)} schedules are active")
+
+    async def tick(self) -> None:
+        for key in self.wheel.advance():
+            schedule = self._schedules[key]
+            self.wheel.add(key, schedule.interval)
+            try:
+                await self.enqueue(schedule)
+                self.enqueued += 1
+            except Exception as e:
+                scheduler_logger.exception(e)
+
+    async def refresh(self) -> None:
+        schedules = []
+        for raw in await load_schedules():
+            try:
+                schedules.append(Schedule.parse_obj(raw))
+            except ValidationError as e:
+                scheduler_logger.warning(f"Skipped schedule {raw}: {e}")
+        self.set_schedules(schedules)
+
+    def try_lock(self) -> bool:
+        """
+        Takes the scheduler lock of the replica, it is held until the process exits
+        """
+        if self.lock_path is None or self._lock is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        lock = open(self.lock_path, "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        self._lock = lock
+        return True
+
+    async def run(self) -> None:
+        if not self.try_lock():
+            scheduler_logger.info(f"Schedules are run by another process holding {self.lock_path}")
+            while not self.try_lock():
+                await asyncio.sleep(LOCK_RETRY_PERIOD)
+        scheduler_logger.info(f"Running schedules of partition {self.partition} of {self.partitions}")
+        await asyncio.gather(self._run_refresh(), self._run_ticks())
+
+    async def _run_refresh(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                scheduler_logger.exception(e)
+            await asyncio.sleep(self.refresh_period)
+
+    async def _run_ticks(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ticks = 0
+        while True:
+            ticks += 1
+            await asyncio.sleep(max(0.0, started + ticks * self.wheel.tick - loop.time()))
+            await self.tick()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "schedules": len(self._schedules),
+            "enqueued": self.enqueued,
+            "running": self.lock_path is None or self._lock is not None,
+        }
+
+
+def read_json(path: str) -> Any:
+    with open(path) as f:
+        return json.load(f)
+
+
+async def load_schedules() -> List[Dict]:
+    """
+    Schedules from schedules_file if it is set, otherwise from camguard
+    """
+    if settings.SCHEDULES_FILE:
+        return await asyncio.get_running_loop().run_in_executor(None, read_json, settings.SCHEDULES_FILE)
+    schedules = await Client(None).get_schedules()
+    if not isinstance(schedules, list):
+        raise ValueError(f"Could not load schedules: {schedules}")
+    return schedules
@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_releases_in_exec_time_order():
+    from queues.delayed import DelayedJobScheduler
+
+    queue = asyncio.Queue()
+    scheduler = DelayedJobScheduler(queue)
+    now = time.time()
+    scheduler.schedule(now + 0.05, "late")
+    scheduler.schedule(now + 0.01, "early")
+    scheduler.schedule(now - 1, "overdue")
+    assert len(scheduler) == 3
+    assert await asyncio.wait_for(queue.get(), 0.01) == "overdue"
+    assert queue.empty()
+    assert await asyncio.wait_for(queue.get(), 0.1) == "early"
+    assert await asyncio.wait_for(queue.get(), 0.1) == "late"
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel():
+    from queues.delayed import DelayedJobScheduler
+
+    queue = asyncio.Queue()
+    scheduler = DelayedJobScheduler(queue)
+    scheduler.schedule(time.time() + 0.01, "job")
+    scheduler.cancel()
+    await asyncio.sleep(0.05)
+    assert queue.empty()
+    assert len(scheduler) == 1
@@ -0,0 +1,151 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+
+def make_job(priority=0, exec_time=None, collect_type="rtsp"):
+    from image_api_client.client import Client
+
+    sensor_id = uuid.uuid4()
+    return priority, (sensor_id, uuid.uuid4(), collect_type, 5, exec_time, False, Client(sensor_id))
+
+
+def make_queue(directory):
+    from queues.durable import DurableQueue, SQLiteJobStore
+
+    return DurableQueue(SQLiteJobStore(str(directory)), sync_interval=0.01)
+
+
+async def take(queue):
+    # Like a worker, get() and task_done() must be called by the same task
+    return await asyncio.ensure_future(queue.get())
+
+
+async def finish(queue):
+    item = await queue.get()
+    queue.task_done()
+    return item
+
+
+def test_encode_decode():
+    from queues.durable import decode_job, encode_job
+
+    priority, job = make_job(priority=100, exec_time=12.5)
+    continuation = object()
+    restored_priority, restored = decode_job(*encode_job((priority, (*job, continuation))))
+    assert restored_priority == 100
+    assert restored[:6] == job[:6]
+    assert restored[6].sensor_id == job[0]
+    assert len(restored) == 7
+
+
+@pytest.mark.asyncio
+async def test_restore_unacked_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    await queue.restore()
+    first, second, third = make_job(), make_job(), make_job()
+    for job in (first, second, third):
+        await queue.put(job)
+    assert await asyncio.ensure_future(finish(queue)) == first
+    # Taken by a worker which dies before task_done()
+    assert await take(queue) == second
+    await queue.close()
+
+    restarted = make_queue(tmp_path)
+    await restarted.restore()
+    assert restarted.store.path == queue.store.path
+    restored = [(await restarted.get())[1][0] for _ in range(restarted.qsize())]
+    assert sorted(restored) == sorted([second[1][0], third[1][0]])
+    await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_acked_before_flush_is_not_written(tmp_path, mocker):
+    queue = make_queue(tmp_path)
+    await queue.restore()
+    write_spy = mocker.spy(queue.store, "_write")
+    await queue.put(make_job())
+    await asyncio.ensure_future(finish(queue))
+    assert queue.store.pending() == 0
+    await queue.store.flush()
+    write_spy.assert_not_called()
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_delayed_job_is_stored(tmp_path, mocker):
+    queue = make_queue(tmp_path)
+    await queue.restore()
+    exec_time = time.time() + 60
+    job = make_job(priority=100, exec_time=exec_time)
+    queue.scheduler.schedule(exec_time, job)
+    assert queue.empty()
+    await queue.close()
+
+    restarted = make_queue(tmp_path)
+    await restarted.restore()
+    assert restarted.empty()
+    assert len(restarted.scheduler) == 1
+    restarted.scheduler.cancel()
+    await restarted.close()
+
+    due = make_queue(tmp_path)
+    mocker.patch("queues.durable.time.time", return_value=exec_time + 1)
+    await due.restore()
+    assert (await due.get())[1][0] == job[1][0]
+    await due.close()
+
+
+@pytest.mark.asyncio
+async def test_processes_claim_own_files(tmp_path):
+    first, second = make_queue(tmp_path), make_queue(tmp_path)
+    await first.restore()
+    await second.restore()
+    assert first.store.path != second.store.path
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_run_flushes_periodically(tmp_path):
+    queue = make_queue(tmp_path)
+    await queue.restore()
+    task = asyncio.ensure_future(queue.run())
+    await queue.put(make_job())
+    await asyncio.sleep(0.05)
+    assert queue.store.pending() == 0
+    task.cancel()
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_coalesced_duplicate_is_not_written(tmp_path):
+    from queues.durable import DurableQueue, SQLiteJobStore
+
+    queue = DurableQueue(SQLiteJobStore(str(tmp_path)), sync_interval=0.01, coalesce=True)
+    await queue.restore()
+    job = make_job()
+    await queue.put(job)
+    await queue.put(job)
+    assert queue.qsize() == 1
+    assert queue.store.pending() == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_same_item_put_twice(tmp_path):
+    from queues.durable import DurableQueue, SQLiteJobStore
+
+    for coalesce in (False, True):
+        store = SQLiteJobStore(str(tmp_path / str(coalesce)))
+        queue = DurableQueue(store, sync_interval=0.01, coalesce=coalesce)
+        await queue.restore()
+        job = make_job()
+        await queue.put(job)
+        await queue.put(job)
+        while not queue.empty():
+            assert await asyncio.ensure_future(finish(queue)) is job
+        assert queue.store.pending() == 0
+        await queue.close()
@@ -0,0 +1,185 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+
+def job(collect_type, number=0, priority=0):
+    return priority, ("sensor", "collect type id", collect_type, number, None, False, None)
+
+
+@pytest.mark.asyncio
+async def test_weighted_round_robin():
+    from queues.fair import FairQueue
+
+    queue = FairQueue(weights={"ping": 3})
+    for i in range(100):
+        queue.put_nowait(job("rtsp", i))
+    for i in range(100):
+        queue.put_nowait(job("ping", i))
+    served = [queue.get_nowait()[1][2] for _ in range(40)]
+    assert Counter(served) == {"ping": 30, "rtsp": 10}
+    assert served[:4] == ["rtsp", "ping", "ping", "ping"]
+    assert queue.qsize() == 160
+    assert queue.sizes() == {"rtsp": 90, "ping": 70}
+
+
+@pytest.mark.asyncio
+async def test_priority_and_fifo_within_type():
+    from queues.fair import FairQueue
+
+    queue = FairQueue()
+    queue.put_nowait(job("ping", 1, priority=100))
+    queue.put_nowait(job("ping", 2))
+    queue.put_nowait(job("ping", 3))
+    assert [queue.get_nowait()[1][3] for _ in range(3)] == [2, 3, 1]
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+
+
+@pytest.mark.asyncio
+async def test_limit_is_released_by_task_done():
+    from queues.fair import FairQueue
+
+    queue = FairQueue(limits={"rtsp": 1})
+    for i in range(2):
+        queue.put_nowait(job("rtsp", i))
+    finish = asyncio.Event()
+
+    async def take():
+        item = await queue.get()
+        await finish.wait()
+        queue.task_done()
+        return item[1][3]
+
+    first = asyncio.ensure_future(take())
+    second = asyncio.ensure_future(take())
+    await asyncio.sleep(0.01)
+    assert queue.running() == {"rtsp": 1}
+    assert queue.qsize() == 1
+    queue.put_nowait(job(None))
+    assert queue.get_nowait()[1][2] is None
+    queue.task_done()
+    finish.set()
+    assert await asyncio.wait_for(asyncio.gather(first, second), 1) == [0, 1]
+    assert queue.running() == {}
+
+
+@pytest.mark.asyncio
+async def test_slow_jobs_do_not_starve_others():
+    from queues.fair import FairQueue
+
+    queue = FairQueue(limits={"rtsp": 2})
+    release = asyncio.Event()
+    done = []
+
+    async def worker():
+        while True:
+            _, res = await queue.get()
+            if res[2] == "rtsp":
+                await release.wait()
+            done.append(res[2])
+            queue.task_done()
+
+    for i in range(50):
+        queue.put_nowait(job("rtsp", i))
+    for i in range(20):
+        queue.put_nowait(job("ping", i))
+    workers = [asyncio.ensure_future(worker()) for _ in range(4)]
+    try:
+        await asyncio.sleep(0.05)
+        assert done == ["ping"] * 20
+        assert queue.running() == {"rtsp": 2}
+        release.set()
+        await asyncio.sleep(0.05)
+        assert queue.empty()
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+def test_invalid_weight():
+    from queues.fair import FairQueue
+
+    with pytest.raises(ValueError):
+        FairQueue(weights={"ping": 0})
+
+
+def keyed_job(sensor, priority=0, collect_type="rtsp", use_db=False):
+    return priority, (sensor, "collect type id", collect_type, 0, None, use_db, None)
+
+
+@pytest.mark.asyncio
+async def test_coalesce_queued_duplicates():
+    from queues.fair import FairQueue
+
+    queue = FairQueue(coalesce=True)
+    first = keyed_job("a", priority=100)
+    queue.put_nowait(first)
+    queue.put_nowait(keyed_job("b"))
+    queue.put_nowait(keyed_job("a"))
+    queue.put_nowait(keyed_job("a", priority=100))
+    assert queue.qsize() == 2
+    assert queue.coalesced == 2
+    # The queued job keeps its place but takes the better priority
+    assert queue.get_nowait()[1] is first[1]
+    assert queue.get_nowait()[1][0] == "b"
+    queue.put_nowait(keyed_job("a"))
+    assert queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_coalesce_running_duplicates():
+    from queues.fair import FairQueue
+
+    queue = FairQueue(coalesce=True, coalesce_running=True)
+    queue.put_nowait(keyed_job("a"))
+
+    async def take():
+        return await queue.get()
+
+    await asyncio.ensure_future(take())
+    queue.put_nowait(keyed_job("a"))
+    assert queue.empty()
+    assert queue.coalesced == 1
+    queue.put_nowait(keyed_job("b"))
+    assert queue.qsize() == 1
+    # Checked another way, not a duplicate
+    queue.put_nowait(keyed_job("a", collect_type="ping"))
+    queue.put_nowait(keyed_job("a", use_db=True))
+    assert queue.qsize() == 3
+    assert queue.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_default_limits_keep_workers_for_pings():
+    from queues.fair import FairQueue
+    from settings import settings
+
+    queue = FairQueue(limits=settings.COLLECTOR_LIMITS)
+    release = asyncio.Event()
+    done = []
+
+    async def worker():
+        while True:
+            _, res = await queue.get()
+            if res[2] != "ping":
+                await release.wait()
+            done.append(res[2])
+            queue.task_done()
+
+    for collect_type in ("rtsp", "wectech", "td", "youtube"):
+        for i in range(50):
+            queue.put_nowait(job(collect_type, i))
+    for i in range(20):
+        queue.put_nowait(job("ping", i))
+    # task_queue_size of the stack
+    workers = [asyncio.ensure_future(worker()) for _ in range(20)]
+    try:
+        await asyncio.sleep(0.05)
+        assert done == ["ping"] * 20
+        assert sum(queue.running().values()) < len(workers)
+    finally:
+        release.set()
+        for w in workers:
+            w.cancel()
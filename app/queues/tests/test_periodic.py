@@ -0,0 +1,118 @@
+import asyncio
+import json
+import uuid
+from collections import Counter
+
+import pytest
+
+
+def test_timing_wheel():
+    from queues.periodic import TimingWheel
+
+    wheel = TimingWheel(tick=1, size=4)
+    wheel.add("a", 1)
+    wheel.add("b", 2.5)
+    wheel.add("c", 6)
+    wheel.add("d", 2)
+    wheel.remove("d")
+    fired = [wheel.advance() for _ in range(6)]
+    assert fired == [["a"], [], ["b"], [], [], ["c"]]
+    assert len(wheel) == 0
+
+
+def make_schedules(count, interval):
+    from models.remotes import Schedule
+
+    return [
+        Schedule(sensor_id=uuid.uuid4(), collect_type_id=uuid.uuid4(), interval=interval)
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_schedules_are_spread_and_repeated():
+    from queues.periodic import PeriodicScheduler
+
+    enqueued = []
+
+    async def enqueue(schedule):
+        enqueued.append((scheduler.wheel.current, schedule.key))
+
+    scheduler = PeriodicScheduler(enqueue, tick=1, wheel_size=16, refresh_period=60)
+    schedules = make_schedules(200, interval=10)
+    scheduler.set_schedules(schedules)
+    for _ in range(30):
+        await scheduler.tick()
+    per_key = Counter(key for _, key in enqueued)
+    assert set(per_key.values()) == {3}
+    first_runs = Counter(tick for tick, _ in enqueued if tick <= 10)
+    assert len(first_runs) == 10
+    assert max(first_runs.values()) < 50
+
+    scheduler.set_schedules(schedules[:1])
+    assert len(scheduler.wheel) == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_from_file(tmp_path, mocker):
+    from queues.periodic import PeriodicScheduler
+
+    path = tmp_path / "schedules.json"
+    path.write_text(json.dumps([
+        {"sensor_id": str(uuid.uuid4()), "collect_type_id": str(uuid.uuid4()), "interval": 60},
+        {"sensor_id": str(uuid.uuid4()), "interval": 0},
+    ]))
+    mocker.patch("queues.periodic.settings.SCHEDULES_FILE", str(path))
+    scheduler = PeriodicScheduler(None, tick=1, wheel_size=60, refresh_period=60)
+    await scheduler.refresh()
+    assert len(scheduler) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_feeds_queue():
+    from queues.periodic import PeriodicScheduler
+
+    queue = asyncio.Queue()
+
+    async def enqueue(schedule):
+        queue.put_nowait(schedule)
+
+    scheduler = PeriodicScheduler(enqueue, tick=0.01, wheel_size=10, refresh_period=60)
+    schedule = make_schedules(1, interval=0.01)[0]
+    scheduler.set_schedules([schedule])
+    task = asyncio.ensure_future(scheduler._run_ticks())
+    try:
+        assert await asyncio.wait_for(queue.get(), 1) is schedule
+        assert await asyncio.wait_for(queue.get(), 1) is schedule
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_one_process_runs_schedules(tmp_path):
+    from queues.periodic import PeriodicScheduler
+
+    lock_path = str(tmp_path / "scheduler.lock")
+    first, second = (
+        PeriodicScheduler(None, tick=1, wheel_size=10, refresh_period=60, lock_path=lock_path)
+        for _ in range(2)
+    )
+    assert first.try_lock()
+    assert not second.try_lock()
+    assert first.stats()["running"] and not second.stats()["running"]
+    first._lock.close()
+    assert second.try_lock()
+
+
+def test_partitions_split_schedules():
+    from queues.periodic import PeriodicScheduler
+
+    schedules = make_schedules(300, interval=10)
+    schedulers = [
+        PeriodicScheduler(None, tick=1, wheel_size=10, refresh_period=60, partitions=3, partition=slot)
+        for slot in (1, 2, 3)
+    ]
+    for scheduler in schedulers:
+        scheduler.set_schedules(schedules)
+    assert sum(len(scheduler) for scheduler in schedulers) == len(schedules)
+    assert all(len(scheduler) > 50 for scheduler in schedulers)
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+from queues.tests.test_durable import finish, make_job
+
+
+async def open_queue(directory, lease=30, prefetch=1, limits=None, coalesce=False):
+    from queues.durable import SharedJobStore, SharedQueue
+
+    queue = SharedQueue(
+        SharedJobStore(str(directory), lease=lease, coalesce=coalesce, depth_interval=0),
+        sync_interval=0.01,
+        prefetch=prefetch,
+        limits=limits,
+        coalesce=coalesce,
+    )
+    await queue.restore()
+    return queue
+
+
+def sensors(queue):
+    return [item[1][0] for _, _, item, _ in sorted(sum(queue._queues.values(), []))]
+
+
+@pytest.mark.asyncio
+async def test_any_process_runs_put_jobs(tmp_path):
+    intake, collector = await open_queue(tmp_path), await open_queue(tmp_path, prefetch=2)
+    first, second, third = make_job(), make_job(), make_job()
+    for job in (first, second, third):
+        await intake.put(job)
+    assert intake.empty()
+    await intake.sync()
+    assert intake.qsize() == 1 and intake.depth() == 2
+    await collector.sync()
+    assert sensors(intake) == [first[1][0]]
+    assert sensors(collector) == [second[1][0], third[1][0]]
+    assert collector.depth() == 0
+    await asyncio.ensure_future(finish(collector))
+    await collector.sync()
+    assert collector.qsize() == 1
+    await intake.close()
+    await collector.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_claimed_again(tmp_path):
+    dead, alive = await open_queue(tmp_path, lease=0.05), await open_queue(tmp_path, lease=0.05)
+    job = make_job()
+    await dead.put(job)
+    await dead.sync()
+    assert dead.qsize() == 1
+    await alive.sync()
+    assert alive.empty()
+    await asyncio.sleep(0.1)
+    await alive.sync()
+    assert sensors(alive) == [job[1][0]]
+    await alive.close()
+
+
+@pytest.mark.asyncio
+async def test_close_releases_claimed_jobs(tmp_path):
+    first, second = await open_queue(tmp_path), await open_queue(tmp_path)
+    job = make_job()
+    await first.put(job)
+    await first.sync()
+    await first.close()
+    await second.sync()
+    assert sensors(second) == [job[1][0]]
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_running_sync(tmp_path, mocker):
+    queue, other = await open_queue(tmp_path), await open_queue(tmp_path)
+    sync = queue.store._sync
+
+    def slow_sync(*args):
+        time.sleep(0.05)
+        return sync(*args)
+
+    mocker.patch.object(queue.store, "_sync", slow_sync)
+    job = make_job()
+    await queue.put(job)
+    await queue.sync()
+    await asyncio.ensure_future(finish(queue))
+    runner = asyncio.ensure_future(queue.run())
+    # close() while run() is syncing in a thread
+    await asyncio.sleep(0.03)
+    await queue.close()
+    assert runner.done()
+    await other.sync()
+    assert other.empty()
+    await other.close()
+
+
+@pytest.mark.asyncio
+async def test_blocked_collect_types_are_not_claimed(tmp_path):
+    queue = await open_queue(tmp_path, prefetch=2, limits={"rtsp": 1})
+    rtsp, ping = make_job(collect_type="rtsp"), make_job(collect_type="ping")
+    await queue.put(make_job(collect_type="rtsp"))
+    await queue.sync()
+    running = asyncio.ensure_future(queue.get())
+    await running
+    assert queue.blocked() == ["rtsp"]
+    await queue.put(rtsp)
+    await queue.put(ping)
+    await queue.sync()
+    assert sensors(queue) == [ping[1][0]]
+    assert queue.depth() == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_delayed_job_is_claimed_when_visible(tmp_path):
+    queue = await open_queue(tmp_path)
+    queue.scheduler.schedule(time.time() + 0.05, make_job(priority=100))
+    await queue.sync()
+    assert queue.empty()
+    # Not waiting yet
+    assert queue.depth() == 0
+    assert len(queue.scheduler) == 0
+    await asyncio.sleep(0.1)
+    await queue.sync()
+    assert queue.qsize() == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_workers_are_fed(tmp_path):
+    queue = await open_queue(tmp_path, prefetch=0)
+    workers = [asyncio.ensure_future(finish(queue)) for _ in range(3)]
+    for _ in range(4):
+        await queue.put(make_job())
+    await asyncio.sleep(0)
+    await queue.sync()
+    await asyncio.wait_for(asyncio.gather(*workers), 1)
+    assert queue.depth() == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_merged_in_table(tmp_path):
+    intake = await open_queue(tmp_path, prefetch=0, coalesce=True)
+    collector = await open_queue(tmp_path, coalesce=True)
+    _, job = make_job()
+    await intake.put((100, job))
+    await intake.put((0, job))
+    await intake.put(make_job(priority=50))
+    await intake.sync()
+    assert intake.depth() == 2
+    await collector.sync()
+    assert [(entry[0], entry[2][1][0]) for entry in collector._queues["rtsp"]] == [(0, job[0])]
+    # A duplicate of a claimed job waits for the next run
+    await intake.put((0, job))
+    await intake.sync()
+    assert intake.depth() == 2
+    # and takes the place of the claimed one when that is released
+    await collector.close()
+    await intake.sync()
+    assert intake.depth() == 2
+    await intake.close()
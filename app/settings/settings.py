@@ -2,6 +2,14 @@ from os import environ
 from get_docker_secret import get_docker_secret
 
 
+def parse_mapping(value: str) -> dict:
+    """
+    "rtsp=8,ping=200" -> {"rtsp": 8.0, "ping": 200.0}
+    """
+    pairs = (pair.split("=") for pair in value.split(",") if pair.strip())
+    return {key.strip(): float(number) for key, number in pairs}
+
+
 TOKEN = ""
 TOKEN_TYPE = ""
 TOKEN_TIMEOUT = int(environ.get("token_timeout"))
@@ -21,3 +29,80 @@ TD_DELAY = int(environ.get("td_delay", 10))
 QUEUE_SIZE = int(environ.get("task_queue_size"))
 RETRIES_NUMBER = int(environ.get("retries_number"))
 RETRIES_PERIOD = int(environ.get("retries_period"))
+HTTP_POOL_LIMIT = int(environ.get("http_pool_limit", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(environ.get("http_pool_limit_per_host", 30))
+HTTP_DNS_CACHE_TTL = int(environ.get("http_dns_cache_ttl", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(environ.get("http_keepalive_timeout", 30))
+REFERENCE_CACHE_SIZE = int(environ.get("reference_cache_size", 128 * 1024 * 1024))
+REFERENCE_CACHE_TTL = float(environ.get("reference_cache_ttl", 300))
+SENSOR_CACHE_SIZE = int(environ.get("sensor_cache_size", 10000))
+SENSOR_CACHE_TTL = float(environ.get("sensor_cache_ttl", 60))
+COLLECT_TYPES_REFRESH_PERIOD = float(environ.get("collect_types_refresh_period", 300))
+# OpenCV releases the GIL; a process pool would pickle every frame to a child and back
+CPU_EXECUTOR = environ.get("cpu_executor", "thread")
+CPU_EXECUTOR_WORKERS = int(environ.get("cpu_executor_workers", 2))
+FRAME_FORMAT = environ.get("frame_format", "png")
+FRAME_PNG_COMPRESSION = int(environ.get("frame_png_compression", 3))
+FRAME_QUALITY = int(environ.get("frame_quality", 90))
+RTSP_POOL_ENABLED = bool(int(environ.get("rtsp_pool", 0)))
+RTSP_POOL_MAX_STREAMS = int(environ.get("rtsp_pool_max_streams", 32))
+RTSP_POOL_IDLE_TTL = float(environ.get("rtsp_pool_idle_ttl", 300))
+RTSP_POOL_READ_TIMEOUT = float(environ.get("rtsp_pool_read_timeout", 10))
+CAPTURE_WORKERS = int(environ.get("capture_workers", 16))
+CAPTURE_PER_SOURCE_LIMIT = int(environ.get("capture_per_source_limit", 1))
+CAPTURE_TIMEOUT = float(environ.get("capture_timeout", 30))
+CAPTURE_READ_TIMEOUT = float(environ.get("capture_read_timeout", 10))
+CAPTURE_DEADLINE = float(environ.get("capture_deadline", 60))
+CAPTURE_BACKOFF_BASE = float(environ.get("capture_backoff_base", 0.5))
+CAPTURE_BACKOFF_MAX = float(environ.get("capture_backoff_max", 8))
+CAPTURE_SKIP_FRAMES = int(environ.get("capture_skip_frames", 0))
+UPLOAD_MODE = environ.get("upload_mode", "json")
+CHECK_BATCH_ENABLED = bool(int(environ.get("check_batch", 0)))
+CHECK_BATCH_SIZE = int(environ.get("check_batch_size", 200))
+CHECK_BATCH_DELAY = float(environ.get("check_batch_delay", 0.5))
+CHECK_BATCH_MAX_PENDING = int(environ.get("check_batch_max_pending", 2000))
+SCHEDULER_ENABLED = bool(int(environ.get("scheduler", 0)))
+SCHEDULES_FILE = environ.get("schedules_file", "")
+SCHEDULES_REFRESH_PERIOD = float(environ.get("schedules_refresh_period", 300))
+SCHEDULER_TICK = float(environ.get("scheduler_tick", 1))
+SCHEDULER_WHEEL_SIZE = int(environ.get("scheduler_wheel_size", 3600))
+# Replicas split the schedules, e.g. scheduler_partition={{.Task.Slot}} in a swarm stack
+SCHEDULER_PARTITIONS = int(environ.get("scheduler_partitions", 1))
+SCHEDULER_PARTITION = int(environ.get("scheduler_partition", 0))
+# Slow capture types together stay below task_queue_size, so pings always find a worker
+COLLECTOR_LIMITS = {
+    k: int(v)
+    for k, v in parse_mapping(environ.get("collector_limits", "rtsp=8,wectech=4,td=4,youtube=2")).items()
+}
+COLLECTOR_WEIGHTS = parse_mapping(environ.get("collector_weights", "ping=4"))
+HOST_CONCURRENCY_LIMIT = int(environ.get("host_concurrency_limit", 2))
+HOST_FAILURE_THRESHOLD = int(environ.get("host_failure_threshold", 3))
+HOST_RESET_TIMEOUT = float(environ.get("host_reset_timeout", 60))
+JOB_DEADLINE = float(environ.get("job_deadline", 120))
+JOB_DEADLINES = parse_mapping(environ.get("job_deadlines", ""))
+QUEUE_BACKEND = environ.get("queue_backend", "sqlite")
+QUEUE_DIR = environ.get("queue_dir", "queue")
+QUEUE_SYNC_INTERVAL = float(environ.get("queue_sync_interval", 0.05))
+QUEUE_LEASE = float(environ.get("queue_lease", 30))
+QUEUE_PREFETCH = int(environ.get("queue_prefetch", 2))
+QUEUE_COALESCE = bool(int(environ.get("queue_coalesce", 1)))
+QUEUE_COALESCE_RUNNING = bool(int(environ.get("queue_coalesce_running", 1)))
+PING_ENGINE_ENABLED = bool(int(environ.get("ping_engine", 0)))
+PING_ENGINE_WINDOW = int(environ.get("ping_engine_window", 1000))
+PING_ENGINE_TIMEOUT = float(environ.get("ping_timeout", 10))
+PREFILTER_ENABLED = bool(int(environ.get("prefilter", 0)))
+PREFILTER_THRESHOLD = float(environ.get("prefilter_threshold", 0.3))
+PREFILTER_SIZE = int(environ.get("prefilter_size", 32))
+DETECTOR_DOWNSCALE_ENABLED = bool(int(environ.get("detector_downscale", 0)))
+DETECTOR_IMAGE_WIDTH = int(environ.get("detector_image_width", 1280))
+DETECTOR_IMAGE_HEIGHT = int(environ.get("detector_image_height", 720))
+DETECTOR_IMAGE_FORMAT = environ.get("detector_image_format", "jpg")
+DETECTOR_IMAGE_QUALITY = int(environ.get("detector_image_quality", 85))
+DETECTOR_HEDGE_ENABLED = bool(int(environ.get("detector_hedge", 0)))
+DETECTOR_HEDGE_PERCENTILE = float(environ.get("detector_hedge_percentile", 95))
+DETECTOR_HEDGE_DELAY = float(environ.get("detector_hedge_delay", 2))
+DETECTOR_HEDGE_WINDOW = int(environ.get("detector_hedge_window", 200))
+DETECTOR_HEDGE_MIN_SAMPLES = int(environ.get("detector_hedge_min_samples", 20))
+S3_POOL_CONNECTIONS = int(environ.get("s3_pool_connections", 32))
+S3_CACHE_SIZE = int(environ.get("s3_cache_size", 64 * 1024 * 1024))
+S3_CACHE_TTL = float(environ.get("s3_cache_ttl", 600))
@@ -42,6 +42,55 @@ def test_collector_start(mocker, patch_client):
     assert response.json() == json.loads(json.dumps(body, cls=UUIDEncoder))
 
 
+def test_collector_start_unknown_collect_type(patch_client):
+    from main import app, QUEUE
+
+    client = TestClient(app)
+    unknown = uuid.uuid4()
+    queue_size = QUEUE.qsize()
+    response = client.post("/api/v1/collector_start/",
+                           data=json.dumps({"sensor_id": str(sensor_id), "collect_type_id": str(unknown)}))
+    assert response.status_code == 200
+    assert QUEUE.qsize() == queue_size + 1
+
+
+def test_collector_start_batch(patch_client):
+    from main import app, QUEUE
+
+    client = TestClient(app)
+    items = [
+        {"sensor_id": str(uuid.uuid4()), "collect_type_id": str(collect_type_id)},
+        {"sensor_id": "not a uuid", "collect_type_id": str(collect_type_id)},
+        {"sensor_id": str(uuid.uuid4()), "collect_type_id": str(uuid.uuid4())},
+        {"sensor_id": str(uuid.uuid4()), "collect_type_id": str(collect_type_id), "use_db": True},
+    ]
+    queue_size = QUEUE.qsize()
+    response = client.post("/api/v1/collector_start/batch", data=json.dumps(items))
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["accepted"], result["rejected"]) == (2, 2)
+    assert [error["index"] for error in result["errors"]] == [1, 2]
+    assert QUEUE.qsize() == queue_size + 2
+
+    # Duplicates of a queued job are coalesced into it
+    coalesced = QUEUE.coalesced
+    ndjson = "\n".join(json.dumps(item) for item in items[:1] * 3)
+    response = client.post("/api/v1/collector_start/batch", data=ndjson,
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.json()["accepted"] == 3
+    assert QUEUE.qsize() == queue_size + 2
+    assert QUEUE.coalesced == coalesced + 3
+
+
+@pytest.mark.parametrize("body", ["{not json", json.dumps({"sensor_id": str(sensor_id)})])
+def test_collector_start_batch_malformed(patch_client, body):
+    from main import app
+
+    client = TestClient(app)
+    response = client.post("/api/v1/collector_start/batch", data=body)
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_startup_event(patch_client, mocker):
     from main import startup_event, environ
@@ -49,6 +98,27 @@ async def test_startup_event(patch_client, mocker):
     ensure_future_mock = mocker.patch('asyncio.ensure_future')
     mocker.patch('main.create_workers').return_value = sentinel.some_object
     mocker.patch('main.get_token').return_value = sentinel.another_object
+    mocker.patch('main.collect_types_catalogue.run').return_value = sentinel.catalogue
+    storage_start_mock = mocker.patch('main.object_storage.start', new=AsyncMock())
     await startup_event()
-    assert len(ensure_future_mock.call_args_list) == 2
+    storage_start_mock.assert_awaited_once()
+    assert len(ensure_future_mock.call_args_list) == 3
     assert environ["http_proxy"] == "10.10.256.4"
+
+
+@pytest.mark.asyncio
+async def test_shutdown_event(patch_client, mocker):
+    from main import shutdown_event
+    close_mock = mocker.patch('main.session_manager.close', new=AsyncMock())
+    await shutdown_event()
+    close_mock.assert_awaited_once()
+
+
+def test_metrics(patch_client):
+    from main import app
+
+    client = TestClient(app)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.json()["cpu_executor"]["kind"] == "thread"
+    assert "queue_size" in response.json()
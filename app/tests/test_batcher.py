@@ -0,0 +1,115 @@
+import asyncio
+import uuid
+
+import pytest
+from aiohttp import web
+
+from exceptions.exceptions import ApiClientError
+from tests.test_client import close_server
+
+BASE = "http://127.0.0.1:8080/api/v1/checks/insert_ping_check"
+
+
+@pytest.fixture()
+async def camguard(aiohttp_server):
+    server = None
+    received = {"batches": [], "single": []}
+
+    async def make_server(rejected=(), batch=True):
+        async def batch_handler(request):
+            records = await request.json()
+            received["batches"].append(records)
+            return web.json_response(
+                [{"id": r["id"], "detail": "duplicate"} for r in records if r["id"] in rejected]
+            )
+
+        async def single_handler(request):
+            received["single"].append(await request.json())
+            return web.json_response({})
+
+        nonlocal server
+        app = web.Application()
+        app.add_routes([web.post("/api/v1/checks/insert_ping_check", single_handler)])
+        if batch:
+            app.add_routes([web.post("/api/v1/checks/insert_ping_check/batch", batch_handler)])
+        server = await aiohttp_server(app, port=8080)
+        return received
+
+    yield make_server
+    if server is not None:
+        await close_server(server)
+
+
+def make_batcher(**kwargs):
+    from image_api_client.batcher import CheckBatcher
+
+    params = dict(max_batch=3, max_delay=10, max_pending=100)
+    params.update(kwargs)
+    return CheckBatcher(batch_url=f"{BASE}/batch", single_url=BASE, **params)
+
+
+def record():
+    return {"id": str(uuid.uuid4()), "sensor_id": uuid.uuid4(), "image": False}
+
+
+@pytest.mark.asyncio
+async def test_flush_by_size(camguard):
+    records = [record() for _ in range(3)]
+    received = await camguard(rejected={records[1]["id"]})
+    batcher = make_batcher()
+    futures = [await batcher.submit(r) for r in records]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    assert len(received["batches"]) == 1
+    assert [r["id"] for r in received["batches"][0]] == [r["id"] for r in records]
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ApiClientError)
+    assert results[1].detail == "duplicate"
+    assert batcher.stats()["failed_records"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_by_age(camguard):
+    received = await camguard()
+    batcher = make_batcher(max_delay=0.05)
+    futures = [await batcher.submit(record()) for _ in range(2)]
+    assert not received["batches"]
+    await asyncio.wait_for(asyncio.gather(*futures), 1)
+    assert len(received["batches"]) == 1
+    assert len(received["batches"][0]) == 2
+
+
+@pytest.mark.asyncio
+async def test_fallback_to_single_posts(camguard):
+    received = await camguard(batch=False)
+    batcher = make_batcher()
+    futures = [await batcher.submit(record()) for _ in range(3)]
+    await asyncio.gather(*futures)
+    assert not batcher.batch_supported
+    assert len(received["single"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_backpressure_and_close(camguard):
+    received = await camguard()
+    batcher = make_batcher(max_pending=1)
+    first = await batcher.submit(record())
+    second = asyncio.ensure_future(batcher.submit(record()))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+    await batcher.close()
+    assert first.done()
+    await batcher.close()
+    assert (await second).done()
+    assert [len(batch) for batch in received["batches"]] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_insert_check_is_batched(mocker):
+    from image_api_client.client import Client, ping_check_batcher
+
+    mocker.patch("image_api_client.client.settings.CHECK_BATCH_ENABLED", True)
+    submit_mock = mocker.patch.object(ping_check_batcher, "submit")
+    submit_mock.return_value = asyncio.get_running_loop().create_future()
+    saved = await Client(uuid.uuid4()).insert_check(None, False, None, None, 0)
+    assert saved is submit_mock.return_value
+    assert submit_mock.call_args[0][0]["image"] is False
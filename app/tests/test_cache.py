@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from asynctest import CoroutineMock as AsyncMock
+
+
+def test_lru_cache_evicts_by_size():
+    from image_api_client.cache import LRUCache
+
+    cache = LRUCache(max_size=10, ttl=60)
+    cache.set("a", b"aaaa", 4)
+    cache.set("b", b"bbbb", 4)
+    assert cache.get("a").value == b"aaaa"
+    cache.set("c", b"cccc", 4)
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.size == 8
+    cache.set("huge", b"h" * 11, 11)
+    assert "huge" not in cache
+    assert len(cache) == 2
+
+
+def test_lru_cache_ttl_and_invalidate():
+    from image_api_client.cache import LRUCache
+
+    cache = LRUCache(max_size=10, ttl=60)
+    cache.set("a", b"aaaa", 4)
+    assert cache.get("a").fresh
+    cache.get("a").expires_at = 0
+    entry = cache.get("a")
+    assert entry is not None and not entry.fresh
+    cache.set("a", b"aa", 2)
+    assert cache.get("a").fresh
+    assert cache.size == 2
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+@pytest.mark.asyncio
+async def test_async_lru_cache_single_flight():
+    from image_api_client.cache import AsyncLRUCache
+
+    cache = AsyncLRUCache(max_size=10, ttl=60)
+
+    async def slow_fetch():
+        await asyncio.sleep(0.01)
+        return {"ip": "10.0.0.1"}
+
+    fetch = AsyncMock(side_effect=slow_fetch)
+    results = await asyncio.gather(*[cache.get_or_fetch("sensor", fetch) for _ in range(5)])
+    assert results == [{"ip": "10.0.0.1"}] * 5
+    fetch.assert_awaited_once()
+    assert await cache.get_or_fetch("sensor", fetch) == {"ip": "10.0.0.1"}
+    fetch.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_async_lru_cache_not_cacheable():
+    from image_api_client.cache import AsyncLRUCache
+
+    cache = AsyncLRUCache(max_size=10, ttl=60)
+    fetch = AsyncMock(return_value={"detail": "Not authenticated"})
+    for _ in range(2):
+        await cache.get_or_fetch("sensor", fetch, cacheable=lambda data: "ip" in data)
+    assert fetch.await_count == 2
+    assert "sensor" not in cache
+    fetch.side_effect = ValueError
+    with pytest.raises(ValueError):
+        await cache.get_or_fetch("sensor", fetch)
+    assert not cache._inflight
+
+
+@pytest.mark.asyncio
+async def test_async_lru_cache_sizeof():
+    from image_api_client.cache import AsyncLRUCache
+
+    cache = AsyncLRUCache(max_size=10, ttl=60)
+    await cache.get_or_fetch("first", AsyncMock(return_value=b"123456"), sizeof=len)
+    await cache.get_or_fetch("second", AsyncMock(return_value=b"1234"), sizeof=len)
+    assert cache.size == 10
+    await cache.get_or_fetch("third", AsyncMock(return_value=b"1"), sizeof=len)
+    assert "first" not in cache
+    assert cache.size == 5
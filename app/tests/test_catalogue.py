@@ -0,0 +1,66 @@
+import asyncio
+import uuid
+
+import pytest
+from asynctest import CoroutineMock as AsyncMock
+
+collect_type_id = uuid.uuid4()
+collect_types = [{"id": str(collect_type_id), "name": "Wectech", "collect_type": "wectech"}]
+
+
+@pytest.fixture()
+def get_collect_types_mock(mocker):
+    from image_api_client.client import Client
+
+    mock = AsyncMock(return_value=collect_types)
+    mocker.patch.object(Client, "get_collect_types", mock)
+    return mock
+
+
+@pytest.mark.asyncio
+async def test_get(get_collect_types_mock):
+    from image_api_client.catalogue import CollectTypesCatalogue
+
+    catalogue = CollectTypesCatalogue(refresh_period=60)
+    results = await asyncio.gather(*[catalogue.get(collect_type_id) for _ in range(3)])
+    assert results == ["wectech"] * 3
+    assert await catalogue.get(str(collect_type_id)) == "wectech"
+    get_collect_types_mock.assert_awaited_once()
+    assert await catalogue.get(None) is None
+    get_collect_types_mock.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_unknown_id_refresh_is_throttled(get_collect_types_mock):
+    from image_api_client.catalogue import CollectTypesCatalogue
+
+    catalogue = CollectTypesCatalogue(refresh_period=60, miss_refresh_period=60)
+    for _ in range(3):
+        assert await catalogue.get(uuid.uuid4()) is None
+    get_collect_types_mock.assert_awaited_once()
+    assert len(catalogue) == 1
+
+
+@pytest.mark.asyncio
+async def test_not_loaded_catalogue_refreshes_on_every_miss(get_collect_types_mock):
+    from image_api_client.catalogue import CollectTypesCatalogue
+
+    catalogue = CollectTypesCatalogue(refresh_period=60, miss_refresh_period=60)
+    get_collect_types_mock.return_value = {"detail": "Not authenticated"}
+    assert await catalogue.get(collect_type_id) is None
+    get_collect_types_mock.return_value = collect_types
+    assert await catalogue.get(collect_type_id) == "wectech"
+    assert get_collect_types_mock.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_run(get_collect_types_mock, mocker):
+    from image_api_client.catalogue import CollectTypesCatalogue
+
+    catalogue = CollectTypesCatalogue(refresh_period=60)
+    get_collect_types_mock.side_effect = [ValueError, collect_types]
+    mocker.patch("image_api_client.catalogue.asyncio.sleep", AsyncMock(side_effect=[None, OSError]))
+    with pytest.raises(OSError):
+        await catalogue.run()
+    assert get_collect_types_mock.await_count == 2
+    assert len(catalogue) == 1
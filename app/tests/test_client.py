@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import json
 import os
@@ -30,7 +31,10 @@ def setup(mocker):
             patch_insert_image=True,
             patch_insert_reference_image=True,
     ):
-        from image_api_client.client import Client
+        from image_api_client.client import Client, json_only_urls, multipart_urls
+
+        json_only_urls.clear()
+        multipart_urls.clear()
 
         ref_return = [
             {
@@ -69,6 +73,10 @@ async def setup_server(aiohttp_server):
     async def make_server(resp, mock=None, port=8080, **kwargs):
         async def handler(request):
             try:
+                if request.content_type != "application/json":
+                    # Stands in for a remote which accepts base64 JSON only
+                    await request.read()
+                    return web.Response(status=415)
                 if mock:
                     mock()
                 if resp is None:
@@ -94,7 +102,10 @@ async def setup_server(aiohttp_server):
                 raise HTTPInternalServerError(text=str(e))
 
         async def get_image_handler(request):
-            return web.Response(body=resp)
+            etag = kwargs.get("etag")
+            if etag and request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304)
+            return web.Response(body=resp, headers={"ETag": etag} if etag else None)
 
         async def get_handler(request):
             return web.json_response(resp)
@@ -168,7 +179,15 @@ async def setup_server(aiohttp_server):
 
     yield make_server
     if server is not None:
-        await server.close()
+        await close_server(server)
+
+
+async def close_server(server):
+    # Pooled keep-alive connections are dropped first so the port is not left in TIME_WAIT
+    from image_api_client.sessions import session_manager
+
+    await session_manager.close()
+    await server.close()
 
 
 @pytest.mark.asyncio
@@ -211,6 +230,83 @@ async def test_request(setup, setup_server, image):
     )
 
 
+@pytest.mark.asyncio
+async def test_request_downscaled(setup, mocker):
+    from image_api_client.client import Client, get_im_size
+
+    mocker.patch("image_api_client.client.settings.DETECTOR_DOWNSCALE_ENABLED", True)
+    request_mock = AsyncMock(
+        side_effect=lambda data, api_version, height, width: ImageApiResponse(
+            x=100, y=50, size_x=10, size_y=20, rotation=0.5, image_width=width, image_height=height
+        )
+    )
+    mocker.patch.object(Client, "request_to_detector_api", request_mock)
+    client = setup()
+    client = client(uuid.uuid4())
+    masks = [{"x1": 640, "y1": 0, "x2": 1920, "y2": 540}]
+    response = await client.prepare_data_select_api_and_make_request(
+        test_image=TEST_IMAGE, reference_image=REF_IMAGE, masks=masks
+    )
+    (fields, files), _, height, width = request_mock.call_args[0]
+    assert (width, height) == (1920, 1080)
+    assert get_im_size(files["test_image"]) == get_im_size(files["ref_image"]) == (1280, 720)
+    assert len(files["test_image"]) < len(TEST_IMAGE) / 5
+    assert fields["mask"] == [{"x1": 427, "y1": 0, "x2": 1280, "y2": 360}]
+    assert (response.x, response.y, response.size_x, response.size_y) == (150, 75, 15, 30)
+    assert response.rotation == 0.5
+
+    # Images which can not be decoded are sent as they are
+    await client.prepare_data_select_api_and_make_request(
+        test_image=b"image", reference_image=REF_IMAGE, masks=masks
+    )
+    (fields, files), _, _, _ = request_mock.call_args[0]
+    assert files == {"ref_image": REF_IMAGE, "test_image": b"image"}
+    assert fields["mask"] == masks
+
+
+@pytest.mark.asyncio
+async def test_request_hedged(setup, mocker):
+    from image_api_client.client import Client
+
+    mocker.patch("image_api_client.client.settings.DETECTOR_HEDGE_ENABLED", True)
+    mocker.patch("image_api_client.client.detector_latency.initial_delay", 0.01)
+    delays = [10, 0]
+
+    async def request(*args):
+        await asyncio.sleep(delays.pop(0))
+        return ImageApiResponse(x=1)
+
+    request_mock = mocker.patch.object(Client, "request_to_detector_api", AsyncMock(side_effect=request))
+    client = setup()
+    client = client(uuid.uuid4())
+    response = await client.prepare_data_select_api_and_make_request(
+        test_image=TEST_IMAGE, reference_image=REF_IMAGE, masks=[]
+    )
+    assert response.x == 1
+    assert request_mock.call_count == 2
+
+    # Matches of the winning answer only are stored, after the hedge
+    delays = [10, 0]
+
+    async def request_with_matches(*args):
+        await asyncio.sleep(delays.pop(0))
+        return ImageApiResponse(x=1, matches=base64.b64encode(REF_IMAGE).decode("utf-8"))
+
+    request_mock.side_effect = request_with_matches
+    insert_image_mock = mocker.patch.object(Client, "insert_image", AsyncMock(return_value=NEW_IMAGE_ID))
+    response = await client.prepare_data_select_api_and_make_request(
+        test_image=TEST_IMAGE, reference_image=REF_IMAGE, masks=[]
+    )
+    assert response.match_image_id == NEW_IMAGE_ID
+    insert_image_mock.assert_awaited_once_with(image=REF_IMAGE)
+
+    request_mock.side_effect = aiohttp.ClientError
+    with pytest.raises(ApiClientError):
+        await client.prepare_data_select_api_and_make_request(
+            test_image=TEST_IMAGE, reference_image=REF_IMAGE, masks=[]
+        )
+
+
 @pytest.mark.asyncio
 async def test_request_no_ref_image(setup):
     ref_mock = AsyncMock(return_value=None)
@@ -234,7 +330,7 @@ async def test_request_api_client_error(setup, setup_server):
                                                                   )
         assert count_calls_mock.call_count == len(settings.settings.API_VERSIONS)
         count_calls_mock.reset_mock()
-        await server.close()
+        await close_server(server)
 
 
 @pytest.mark.asyncio
@@ -247,6 +343,78 @@ async def test_get_image(setup, setup_server):
     assert response == image_bytes
 
 
+@pytest.mark.asyncio
+async def test_get_image_if_modified(setup, setup_server):
+    client = setup(patch_get_image=False)
+    client = client(uuid.uuid4())
+    image_bytes = b"image"
+    etag = '"a0a81a0e"'
+    await setup_server(image_bytes, etag=etag)
+    url = os.getenv("camera_guard_base")
+    assert await client.get_image_if_modified(url) == (image_bytes, etag)
+    assert await client.get_image_if_modified(url, etag) == (None, etag)
+    assert await client.get_image_if_modified(url, '"outdated"') == (image_bytes, etag)
+
+
+@pytest.mark.asyncio
+async def test_reference_image_cache(setup, mocker):
+    from image_api_client.client import reference_cache
+
+    client = setup(patch_insert_reference_image=False)
+    client = client(uuid.uuid4())
+    etag = '"a0a81a0e"'
+    fetch_mock = AsyncMock(return_value=(REF_IMAGE, etag))
+    mocker.patch.object(client, "get_image_if_modified", fetch_mock)
+    mocker.patch.object(client, "post_data", AsyncMock())
+    image, masks = await client.get_reference_image()
+    assert await client.get_reference_image() == (image, masks)
+    assert image == REF_IMAGE
+    client.get_reference_image_id.assert_awaited_once()
+    fetch_mock.assert_awaited_once_with("string", None)
+    assert reference_cache.get(client.sensor_id).value.image_width is not None
+
+    reference_cache.get(client.sensor_id).expires_at = 0
+    fetch_mock.return_value = None, etag
+    assert await client.get_reference_image() == (image, masks)
+    fetch_mock.assert_awaited_with("string", etag)
+    assert reference_cache.get(client.sensor_id).fresh
+
+    await client.insert_reference_image(NEW_IMAGE_ID)
+    assert client.sensor_id not in reference_cache
+    fetch_mock.return_value = REF_IMAGE, etag
+    await client.get_reference_image()
+    fetch_mock.assert_awaited_with("string", None)
+
+
+@pytest.mark.asyncio
+async def test_is_unchanged(setup):
+    from image_api_client.client import reference_cache
+    from image_api_client.prefilter import change_prefilter
+    from models.remotes import ReferenceImage
+
+    client = setup()
+    client = client(uuid.uuid4())
+    assert not await client.is_unchanged(REF_IMAGE, None, None)
+    unchanged = change_prefilter.unchanged
+    assert await client.is_unchanged(REF_IMAGE, REF_IMAGE, None)
+    assert change_prefilter.unchanged == unchanged + 1
+
+    reference = ReferenceImage(image_id="id", image=REF_IMAGE, image_width=1920, image_height=1080)
+    reference_cache.set(client.sensor_id, reference, len(REF_IMAGE))
+    assert await client.is_unchanged(REF_IMAGE, reference.image, None)
+    assert reference_cache.get(client.sensor_id).value.fingerprint is not None
+
+    # A cache entry replaced since the fetch is not compared against
+    stale = ReferenceImage(image_id="stale", image=b"stale", image_width=1920, image_height=1080)
+    reference_cache.set(client.sensor_id, stale, len(stale.image))
+    assert await client.is_unchanged(REF_IMAGE, REF_IMAGE, None)
+    assert stale.fingerprint is None
+
+    failed = change_prefilter.failed
+    assert not await client.is_unchanged(b"not an image", REF_IMAGE, None)
+    assert change_prefilter.failed == failed + 1
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("reference", [True, False])
 async def test_get_reference_image_id(setup, setup_server, reference):
@@ -291,6 +459,123 @@ async def test_insert_image(setup, setup_server, mocker):
     assert response == image_id
 
 
+@pytest.mark.asyncio
+async def test_insert_image_multipart(setup, aiohttp_server, mocker):
+    from image_api_client.client import json_only_urls
+
+    mocker.patch("image_api_client.client.settings.UPLOAD_MODE", "multipart")
+    client = setup(patch_insert_image=False)
+    client = client(uuid.uuid4())
+    image_id = uuid.uuid4()
+    received = {}
+
+    async def multipart_handler(request):
+        assert request.content_type == "multipart/form-data"
+        form = await request.post()
+        received.update(id=form["id"], ext=form["ext"], image=form["image"].file.read())
+        return web.json_response({"image_id": form["id"]})
+
+    app = web.Application(client_max_size=10000000)
+    app.add_routes([web.post("/api/v1/images/", multipart_handler)])
+    server = await aiohttp_server(app, port=8080)
+    mocker.patch.object(uuid, "uuid4", Mock(return_value=image_id))
+    try:
+        assert await client.insert_image(image=TEST_IMAGE, ext=EXT) == image_id
+    finally:
+        await close_server(server)
+    assert received == {"id": str(image_id), "ext": EXT, "image": TEST_IMAGE}
+    assert not json_only_urls
+
+
+@pytest.mark.asyncio
+async def test_insert_image_json_fallback(setup, setup_server, mocker):
+    import image_api_client.client as client_module
+    from image_api_client.client import json_only_urls
+
+    mocker.patch("image_api_client.client.settings.UPLOAD_MODE", "multipart")
+    client = setup(patch_insert_image=False)
+    client = client(uuid.uuid4())
+    image_id = uuid.uuid4()
+    count_calls_mock = MagicMock()
+    await setup_server(
+        {"image_id": str(image_id)},
+        mock=count_calls_mock,
+        id=str(image_id),
+        image=base64.b64encode(TEST_IMAGE).decode("utf-8"),
+        ext=EXT,
+    )
+    mocker.patch.object(uuid, "uuid4", Mock(return_value=image_id))
+    multipart_spy = mocker.spy(client_module, "multipart_form")
+    assert await client.insert_image(image=TEST_IMAGE, ext=EXT) == image_id
+    assert json_only_urls == {f"{os.getenv('camera_guard_base')}/api/v1/images/"}
+    await client.insert_image(image=TEST_IMAGE, ext=EXT)
+    assert count_calls_mock.call_count == 2
+    assert multipart_spy.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_json_only_endpoint_422(setup, aiohttp_server, mocker):
+    from image_api_client.client import json_only_urls
+
+    mocker.patch("image_api_client.client.settings.UPLOAD_MODE", "multipart")
+    client = setup(patch_insert_image=False)
+    client = client(uuid.uuid4())
+    calls = []
+
+    async def handler(request):
+        calls.append(request.content_type)
+        if request.content_type != "application/json":
+            # What FastAPI answers when it expects a JSON body
+            await request.read()
+            return web.json_response(
+                {"detail": [{"loc": ["body"], "msg": "value is not a valid dict", "type": "type_error.dict"}]},
+                status=422,
+            )
+        return web.json_response({})
+
+    app = web.Application(client_max_size=10000000)
+    app.add_routes([web.post("/api/v1/images/", handler)])
+    server = await aiohttp_server(app, port=8080)
+    try:
+        await client.insert_image(image=TEST_IMAGE, ext=EXT)
+        await client.insert_image(image=TEST_IMAGE, ext=EXT)
+    finally:
+        await close_server(server)
+    assert calls == ["multipart/form-data", "application/json", "application/json"]
+    assert json_only_urls == {f"{os.getenv('camera_guard_base')}/api/v1/images/"}
+
+
+@pytest.mark.asyncio
+async def test_multipart_validation_error_is_kept(setup, aiohttp_server, mocker):
+    from image_api_client.client import json_only_urls
+
+    mocker.patch("image_api_client.client.settings.UPLOAD_MODE", "multipart")
+    client = setup(patch_insert_image=False)
+    client = client(uuid.uuid4())
+    calls = []
+
+    async def multipart_handler(request):
+        calls.append(request.content_type)
+        await request.read()
+        if len(calls) == 1:
+            return web.json_response({})
+        return web.json_response(
+            {"detail": [{"loc": ["body", "ext"], "msg": "unsupported extension"}]}, status=422
+        )
+
+    app = web.Application(client_max_size=10000000)
+    app.add_routes([web.post("/api/v1/images/", multipart_handler)])
+    server = await aiohttp_server(app, port=8080)
+    try:
+        await client.insert_image(image=TEST_IMAGE, ext=EXT)
+        # The url took multipart before, the 422 is about this upload
+        await client.insert_image(image=TEST_IMAGE, ext=EXT)
+    finally:
+        await close_server(server)
+    assert calls == ["multipart/form-data", "multipart/form-data"]
+    assert not json_only_urls
+
+
 @pytest.mark.asyncio
 async def test_get_sensor_data(setup, setup_server):
     client = setup()
@@ -314,6 +599,23 @@ async def test_get_sensor_data(setup, setup_server):
     assert response == resp
 
 
+@pytest.mark.asyncio
+async def test_sensor_data_cache(setup, mocker):
+    import asyncio
+    from image_api_client.client import sensor_cache
+
+    client = setup()
+    sensor_id = uuid.uuid4()
+    resp = {"ip": "10.24.21.61", "port": 80, "login": None, "password": None}
+    fetch_mock = mocker.patch.object(client, "fetch_sensor_data", AsyncMock(return_value=resp))
+    responses = await asyncio.gather(*[client(sensor_id).get_sensor_data() for _ in range(3)])
+    assert responses == [resp] * 3
+    fetch_mock.assert_awaited_once()
+    sensor_cache.get(sensor_id).expires_at = 0
+    assert await client(sensor_id).get_sensor_data() == resp
+    assert fetch_mock.await_count == 2
+
+
 @pytest.mark.asyncio
 async def test_get_collect_types(setup, setup_server):
     client = setup()
@@ -0,0 +1,62 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+
+def test_outside_of_job():
+    import deadlines
+
+    timeout = aiohttp.ClientTimeout(total=10)
+    assert deadlines.remaining() is None
+    assert not deadlines.expired()
+    assert deadlines.bound(10) == 10
+    assert deadlines.bound_timeout(timeout) is timeout
+    assert deadlines.earliest(5.0) == 5.0
+
+
+def test_bound_to_remaining_budget():
+    import deadlines
+
+    with deadlines.job_deadline(1) as deadline:
+        assert deadlines.get() == deadline
+        assert 0 < deadlines.bound(10) <= 1
+        assert deadlines.bound(0.5) == 0.5
+        assert deadlines.bound_timeout(aiohttp.ClientTimeout(total=10)).total <= 1
+        assert deadlines.bound_timeout(aiohttp.ClientTimeout()).total <= 1
+        assert deadlines.earliest(deadline + 5) == deadline
+    assert deadlines.get() is None
+
+
+def test_expired():
+    import deadlines
+    from exceptions.exceptions import DeadlineExceededError
+
+    with deadlines.job_deadline(0):
+        assert deadlines.expired()
+        with pytest.raises(DeadlineExceededError):
+            deadlines.bound(10)
+
+
+def test_per_collect_type(mocker):
+    import deadlines
+
+    mocker.patch("deadlines.settings.JOB_DEADLINE", 120)
+    mocker.patch("deadlines.settings.JOB_DEADLINES", {"ping": 15})
+    assert deadlines.for_collect_type("ping") == 15
+    assert deadlines.for_collect_type("rtsp") == 120
+
+
+@pytest.mark.asyncio
+async def test_inherited_by_tasks():
+    import deadlines
+
+    with deadlines.job_deadline(1) as deadline:
+        assert await asyncio.ensure_future(_get()) == deadline
+    assert await asyncio.ensure_future(_get()) is None
+
+
+async def _get():
+    import deadlines
+
+    return deadlines.get()
@@ -0,0 +1,41 @@
+import cv2
+import numpy
+import pytest
+
+from tests.helpers import get_image
+
+
+@pytest.mark.parametrize(
+    "size, box, expected",
+    [
+        ((1920, 1080), (1280, 720), (1280, 720)),
+        ((1080, 1920), (1280, 720), (405, 720)),
+        ((640, 480), (1280, 720), (640, 480)),
+        ((1920, 1080), (960, 0), (960, 540)),
+        ((1920, 1080), (0, 0), (1920, 1080)),
+    ],
+)
+def test_fit(size, box, expected):
+    from image_api_client.downscale import fit
+
+    assert fit(size, box) == expected
+
+
+@pytest.mark.parametrize("ext", ["jpg", "webp"])
+def test_downscale(ext):
+    from image_api_client.downscale import downscale
+
+    image = get_image("./tests/picture.png")
+    resized, scale = downscale(image, (1920, 1080), (480, 480), ext, 80)
+    frame = cv2.imdecode(numpy.frombuffer(resized, numpy.uint8), cv2.IMREAD_COLOR)
+    assert frame.shape[:2] == (270, 480)
+    assert scale == (0.25, 0.25)
+    assert len(resized) < len(image) / 10
+
+
+def test_restore_response():
+    from image_api_client.downscale import restore_response
+    from models.remotes import ImageApiResponse
+
+    response = restore_response(ImageApiResponse(x=10, y=None, size_x=4, size_y=8), (0.5, 0.25))
+    assert (response.x, response.y, response.size_x, response.size_y) == (20, None, 8, 32)
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+
+def make_tracker(delay=0.05):
+    from image_api_client.hedging import LatencyTracker
+
+    return LatencyTracker(window=10, percentile=90, initial_delay=delay, min_samples=5)
+
+
+def answer(value, delay=0.0, error=None):
+    async def call():
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return value
+
+    return call
+
+
+def test_delay_percentile():
+    tracker = make_tracker(delay=3)
+    for latency in range(1, 5):
+        tracker.record(latency)
+    assert tracker.delay() == 3
+    for latency in range(5, 21):
+        tracker.record(latency)
+    # Only the last 10 are kept: 11..20
+    assert tracker.delay() == 19
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged():
+    from image_api_client.hedging import hedged
+
+    tracker = make_tracker()
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    started = time.monotonic()
+    assert await hedged([slow, answer("second")], tracker, retryable=(OSError,)) == "second"
+    assert time.monotonic() - started < 1
+    await asyncio.sleep(0)
+    assert cancelled == [True]
+    assert tracker.stats()["hedged"] == 1
+    assert tracker.stats()["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_requests_are_recorded():
+    from image_api_client.hedging import hedged
+
+    tracker = make_tracker(delay=0.02)
+    for _ in range(5):
+        assert await hedged([answer("first", 0.2), answer("second")], tracker, retryable=(OSError,)) == "second"
+    # The winners answer at once, the cancelled ones ran for at least the hedge delay
+    assert tracker.stats()["samples"] == 10
+    assert tracker.delay() >= 0.02
+
+
+@pytest.mark.asyncio
+async def test_failed_request_is_retried_at_once():
+    from image_api_client.hedging import hedged
+
+    tracker = make_tracker(delay=10)
+    calls = [answer(None, error=OSError("first")), answer("second")]
+    assert await asyncio.wait_for(hedged(calls, tracker, retryable=(OSError,)), 1) == "second"
+    assert tracker.stats()["hedged"] == 0
+
+
+@pytest.mark.asyncio
+async def test_errors():
+    from image_api_client.hedging import hedged
+
+    tracker = make_tracker()
+    with pytest.raises(OSError, match="second"):
+        await hedged(
+            [answer(None, error=OSError("first")), answer(None, error=OSError("second"))],
+            tracker,
+            retryable=(OSError,),
+        )
+    with pytest.raises(ValueError):
+        await hedged(
+            [answer(None, error=ValueError()), answer("second")], tracker, retryable=(OSError,)
+        )
+    assert await hedged([answer("first", 0.01)], tracker, retryable=(OSError,)) == "first"
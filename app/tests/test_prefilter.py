@@ -0,0 +1,66 @@
+import cv2
+import numpy
+import pytest
+
+from tests.helpers import get_image
+
+SIZE = (1920, 1080)
+
+
+def encode(frame):
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+@pytest.fixture()
+def frame():
+    return cv2.imdecode(numpy.frombuffer(get_image("./tests/picture.png"), numpy.uint8), cv2.IMREAD_COLOR)
+
+
+def test_distance(frame):
+    from image_api_client.prefilter import distance, fingerprint
+
+    reference = fingerprint(encode(frame), None, SIZE, 32)
+    darker = encode((frame * 0.7).astype(numpy.uint8))
+    shifted = encode(numpy.roll(frame, 40, axis=1))
+    assert distance(reference, fingerprint(encode(frame), None, SIZE, 32)) < 0.01
+    assert distance(reference, fingerprint(darker, None, SIZE, 32)) < 0.05
+    assert distance(reference, fingerprint(shifted, None, SIZE, 32)) > 0.2
+
+
+def test_small_object_is_a_change(frame):
+    from image_api_client.prefilter import distance, fingerprint
+    from settings import settings
+
+    changed = frame.copy()
+    # About 2% of the frame width
+    changed[500:540, 900:940] = (20, 20, 200)
+    reference = fingerprint(encode(frame), None, SIZE, 32)
+    assert distance(reference, fingerprint(encode(changed), None, SIZE, 32)) > settings.PREFILTER_THRESHOLD
+    shifted = encode(numpy.roll(frame, 2, axis=1))
+    assert distance(reference, fingerprint(shifted, None, SIZE, 32)) < settings.PREFILTER_THRESHOLD
+
+
+def test_masked_change_is_ignored(frame):
+    from image_api_client.prefilter import distance, fingerprint
+
+    changed = frame.copy()
+    changed[200:500, 400:900] = 0
+    masks = [{"x1": 900, "y1": 500, "x2": 400, "y2": 200}]
+    assert distance(fingerprint(encode(frame), None, SIZE, 32), fingerprint(encode(changed), None, SIZE, 32)) > 0.05
+    assert distance(
+        fingerprint(encode(frame), masks, SIZE, 32), fingerprint(encode(changed), masks, SIZE, 32)
+    ) < 0.01
+
+
+def test_fully_masked(frame):
+    from image_api_client.prefilter import distance, fingerprint
+
+    masks = [{"x1": 0, "y1": 0, "x2": SIZE[0], "y2": SIZE[1]}]
+    assert distance(fingerprint(encode(frame), masks, SIZE, 32), fingerprint(encode(frame), masks, SIZE, 32)) == float("inf")
+
+
+def test_undecodable_image():
+    from image_api_client.prefilter import fingerprint
+
+    with pytest.raises(ValueError):
+        fingerprint(b"not an image", None, SIZE, 32)
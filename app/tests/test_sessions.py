@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture()
+async def manager():
+    from image_api_client.sessions import SessionManager
+
+    manager = SessionManager(limit=10, limit_per_host=2, dns_cache_ttl=60, keepalive_timeout=5)
+    yield manager
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_get_session_is_shared(manager):
+    session = await manager.get_session()
+    assert await manager.get_session() is session
+    assert session.connector.limit == 10
+    assert session.connector.limit_per_host == 2
+
+
+@pytest.mark.asyncio
+async def test_scoped_session_reuses_connector(manager):
+    shared = await manager.get_session()
+    async with manager.session(raise_for_status=True) as session:
+        assert session is not shared
+        assert session.connector is shared.connector
+    assert session.closed
+    assert not shared.closed
+    assert not shared.connector.closed
+
+
+@pytest.mark.asyncio
+async def test_close(manager):
+    session = await manager.get_session()
+    connector = session.connector
+    await manager.close()
+    assert session.closed
+    assert connector.closed
+    assert await manager.get_session() is not session
@@ -12,7 +12,7 @@ from asyncio import PriorityQueue
 from unittest.mock import ANY, Mock, PropertyMock
 from models.enums import CheckStatus
 from tests.helpers import get_image
-from asynctest import CoroutineMock as AsyncMock, MagicMock, sentinel
+from asynctest import CoroutineMock as AsyncMock, sentinel
 
 sensor_id = uuid.uuid4()
 check_id = uuid.uuid4()
@@ -226,10 +226,28 @@ async def test_api_client_error_worker(patcher):
 
     client_request_mock.reset_mock()
     client_request_mock.side_effect = ApiClientError
-    await run_worker(WectechCollector, patcher)
+    await run_worker(WectechCollector, patcher, timeout=RETRY_PERIOD * 50)
     assert client_request_mock.await_count == RETRIES
 
 
+@pytest.mark.asyncio
+async def test_unknown_collect_type_worker(patcher, mocker):
+    from image_api_client.client import Client
+    from worker import worker
+
+    client, _ = patcher
+    mocker.patch.object(Client, "insert_check", client_insert_check_mock)
+    client_insert_check_mock.reset_mock()
+    queue = await throw_in_queue(sensor_id, collect_type_id, None, RETRIES, None, False, client)
+    try:
+        await asyncio.wait_for(worker("test worker", queue, RETRY_PERIOD), timeout=TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    client_insert_check_mock.assert_awaited_once_with(
+        None, False, collect_type_id, "Unknown collector type None", CheckStatus.UNAVAILABLE.value, None
+    )
+
+
 @pytest.mark.asyncio
 async def test_can_be_executed_in_worker(patcher, mocker):
     from collectors.wecktech_collector import WectechCollector
@@ -267,12 +285,70 @@ async def test_insert_check_exception(patcher, mocker):
 
 
 @pytest.mark.asyncio
-async def test_empty_queue(patcher, mocker):
+async def test_empty_queue(patcher):
     from collectors.wecktech_collector import WectechCollector
-    mock = MagicMock(side_effect=asyncio.QueueEmpty)
-    mocker.patch('asyncio.Queue.get_nowait', new=mock)
-    await run_worker(WectechCollector, patcher, timeout=1.5)
-    assert len(mock.call_args_list) > 1
+    from worker import worker
+
+    client, patch_collector = patcher
+    patch_collector(WectechCollector, client)
+    queue = PriorityQueue()
+    task = asyncio.ensure_future(worker("test worker", queue, RETRY_PERIOD))
+    await asyncio.sleep(TIMEOUT)
+    client_insert_image_check_mock.assert_not_awaited()
+    await queue.put((1, (sensor_id, collect_type_id, WectechCollector.collector_type,
+                         RETRIES, None, False, client)))
+    await asyncio.wait_for(queue.join(), timeout=1)
+    client_insert_image_check_mock.assert_awaited_once()
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_retry_is_delayed(patcher, mocker):
+    from collectors.wecktech_collector import WectechCollector
+    from exceptions.exceptions import ApiClientError
+    from queues.delayed import DelayedJobScheduler
+    from worker import worker
+
+    retry_period = 60
+    schedule_mock = mocker.spy(DelayedJobScheduler, "schedule")
+    client_request_mock.reset_mock()
+    client_request_mock.side_effect = ApiClientError
+    start = time.time()
+    client, patch_collector = patcher
+    patch_collector(WectechCollector, client)
+    queue = await throw_in_queue(sensor_id, collect_type_id, WectechCollector.collector_type,
+                                 RETRIES, None, False, client)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker("test worker", queue, retry_period), timeout=0.1)
+    assert client_request_mock.await_count == 1
+    exec_time, item = schedule_mock.call_args[0][1:]
+    assert exec_time >= start + retry_period
+    assert item[1][3] == RETRIES - 1
+
+
+@pytest.mark.asyncio
+async def test_retry_is_not_coalesced_with_running_job(patcher, mocker):
+    from collectors.wecktech_collector import WectechCollector
+    from exceptions.exceptions import ApiClientError
+    from queues.fair import FairQueue
+    from worker import worker
+
+    async def slow_insert_check(*args):
+        # Longer than the retry period
+        await asyncio.sleep(RETRY_PERIOD * 5)
+
+    mocker.patch("image_api_client.client.Client.insert_check", slow_insert_check)
+    client_request_mock.reset_mock()
+    client_request_mock.side_effect = ApiClientError
+    client, patch_collector = patcher
+    patch_collector(WectechCollector, client)
+    queue = FairQueue(coalesce=True, coalesce_running=True)
+    await queue.put((1, (sensor_id, collect_type_id, WectechCollector.collector_type,
+                         RETRIES, None, False, client)))
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker("test worker", queue, RETRY_PERIOD), timeout=RETRY_PERIOD * 30)
+    assert client_request_mock.await_count == RETRIES
+    assert queue.coalesced == 0
 
 
 @pytest.mark.asyncio
@@ -287,3 +363,172 @@ async def test_create_workers(mocker):
         await asyncio.wait_for(create_workers(asyncio.PriorityQueue, workers_count, 60),
                                timeout=0.2)
     assert len(gather_mock.call_args[0]) == workers_count
+
+
+@pytest.mark.asyncio
+async def test_report_check_saved(mocker):
+    from exceptions.exceptions import ApiClientError
+    from worker import report_check_saved, logger
+
+    warning_mock = mocker.patch.object(logger, "warning")
+    saved, rejected = asyncio.Future(), asyncio.Future()
+    saved.set_result(None)
+    rejected.set_exception(ApiClientError(detail="duplicate"))
+    report_check_saved("test worker", sensor_id, saved)
+    warning_mock.assert_not_called()
+    report_check_saved("test worker", sensor_id, rejected)
+    assert "duplicate" in warning_mock.call_args[0][0]
+
+
+@pytest.mark.asyncio
+async def test_resumed_job(patcher, mocker):
+    from collectors.base_collectors import Resume
+    from collectors.wecktech_collector import WectechCollector
+    from worker import worker
+
+    client_request_mock.side_effect = None
+    client, patch_collector = patcher
+    create_mock = patch_collector(WectechCollector, client)
+    continuation = AsyncMock(return_value=collector_collect_mock.return_value)
+    mocker.patch.object(WectechCollector, "collect", AsyncMock(return_value=Resume(0.05, continuation)))
+    queue = await throw_in_queue(sensor_id, collect_type_id, WectechCollector.collector_type,
+                                 RETRIES, None, False, client)
+    task = asyncio.ensure_future(worker("test worker", queue, RETRY_PERIOD))
+    try:
+        await asyncio.sleep(0.01)
+        continuation.assert_not_awaited()
+        client_insert_image_check_mock.assert_not_awaited()
+        assert queue.empty()
+        created = create_mock.await_count
+        await asyncio.sleep(0.1)
+        continuation.assert_awaited_once()
+        assert create_mock.await_count == created
+        client_insert_image_check_mock.assert_awaited_once()
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_resumed_job_of_shared_queue(patcher, mocker, tmp_path):
+    from collectors.base_collectors import Resume
+    from collectors.wecktech_collector import WectechCollector
+    from queues.tests.test_shared import open_queue
+    from worker import worker
+
+    client_request_mock.side_effect = None
+    client, patch_collector = patcher
+    create_mock = patch_collector(WectechCollector, client)
+    continuation = AsyncMock(return_value=collector_collect_mock.return_value)
+    mocker.patch.object(WectechCollector, "collect", AsyncMock(return_value=Resume(0.05, continuation)))
+    queue, other = await open_queue(tmp_path), await open_queue(tmp_path)
+    await queue.put((0, (sensor_id, collect_type_id, WectechCollector.collector_type,
+                         RETRIES, None, False, client)))
+    tasks = [
+        asyncio.ensure_future(worker("test worker", queue, RETRY_PERIOD, queue.scheduler)),
+        asyncio.ensure_future(queue.run()),
+        asyncio.ensure_future(other.run()),
+    ]
+
+    async def wait_for(condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
+    try:
+        await wait_for(lambda: create_mock.await_count)
+        continuation.assert_not_awaited()
+        assert create_mock.await_count == 1
+        await wait_for(lambda: client_insert_image_check_mock.await_count)
+        continuation.assert_awaited_once()
+        assert create_mock.await_count == 1
+        client_insert_image_check_mock.assert_awaited_once()
+        # The other process never claimed the resumed job
+        assert other.qsize() == 0 and not other._acks
+    finally:
+        for task in tasks:
+            task.cancel()
+        await queue.close()
+        await other.close()
+
+
+@pytest.mark.asyncio
+async def test_job_deadline(patcher, mocker):
+    from collectors.wecktech_collector import WectechCollector
+    from worker import worker
+
+    async def hang(self):
+        await asyncio.sleep(10)
+
+    mocker.patch("deadlines.settings.JOB_DEADLINES", {WectechCollector.collector_type: 0.05})
+    insert_check_mock = mocker.patch("image_api_client.client.Client.insert_check", new=AsyncMock())
+    client, patch_collector = patcher
+    patch_collector(WectechCollector, client)
+    mocker.patch.object(WectechCollector, "collect", hang)
+    queue = await throw_in_queue(sensor_id, collect_type_id, WectechCollector.collector_type,
+                                 RETRIES, None, False, client)
+    task = asyncio.ensure_future(worker("test worker", queue, RETRY_PERIOD))
+    try:
+        await asyncio.wait_for(queue.join(), timeout=1)
+    finally:
+        task.cancel()
+    _, _, _, detail, status, _ = insert_check_mock.call_args[0]
+    assert detail == "Job deadline exceeded"
+    assert status == CheckStatus.UNAVAILABLE.value
+
+
+@pytest.mark.asyncio
+async def test_image_is_saved_after_job_deadline(patcher, mocker):
+    import deadlines
+    from collectors.wecktech_collector import WectechCollector
+    from image_api_client.client import Client
+    from worker import worker
+
+    async def time_out(*args):
+        # The detector request is cut to the job deadline
+        await asyncio.sleep(0.1)
+        raise asyncio.TimeoutError
+
+    async def insert_image(self, image, ext="jpg"):
+        # Raises if the upload is still bound by the expired job deadline
+        deadlines.bound(10)
+        return image_id
+
+    mocker.patch("deadlines.settings.JOB_DEADLINES", {WectechCollector.collector_type: 0.05})
+    mocker.patch("image_api_client.client.Client.get_reference_image", AsyncMock(return_value=(b"", None)))
+    mocker.patch.object(Client, "prepare_data_select_api_and_make_request", time_out)
+    mocker.patch.object(Client, "insert_image", insert_image)
+    insert_check_mock = mocker.patch("image_api_client.client.Client.insert_check", new=AsyncMock())
+    client, patch_collector = patcher
+    patch_collector(WectechCollector, client)
+    queue = await throw_in_queue(sensor_id, collect_type_id, WectechCollector.collector_type,
+                                 RETRIES, None, False, client)
+    task = asyncio.ensure_future(worker("test worker", queue, RETRY_PERIOD))
+    try:
+        await asyncio.wait_for(queue.join(), timeout=1)
+    finally:
+        task.cancel()
+    saved_image_id, _, _, detail, status, _ = insert_check_mock.call_args[0]
+    assert saved_image_id == image_id
+    assert detail == "TimeoutError"
+    assert status == CheckStatus.UNAVAILABLE.value
+
+
+@pytest.mark.asyncio
+async def test_unchanged_image_skips_detector(patcher, mocker):
+    from collectors.wecktech_collector import WectechCollector
+
+    mocker.patch("worker.change_prefilter.enabled", True)
+    mocker.patch("image_api_client.client.Client.get_reference_image", AsyncMock(return_value=(b"", None)))
+    mocker.patch("image_api_client.client.Client.is_unchanged", AsyncMock(return_value=True))
+    client_request_mock.reset_mock()
+    await run_worker(WectechCollector, patcher)
+    client_request_mock.assert_not_awaited()
+    params = dict(ImageApiResponse.parse_obj(dict()).dict())
+    params["id"] = check_id
+    params["collect_type_id"] = collect_type_id
+    params["detail"] = None
+    params["image_id"] = image_id
+    params["sensor_id"] = sensor_id
+    params["check_status"] = CheckStatus.NOCHANGE.value
+    client_insert_image_check_mock.assert_awaited_once_with(**params)
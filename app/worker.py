@@ -1,29 +1,60 @@
 import asyncio
 import logging
 import time
-from typing import Type
+from functools import partial
+from typing import Awaitable, Callable, Optional, Type
 
 from aiohttp import ClientResponseError, ClientConnectionError
 
-from collectors.base_collectors import DBCollector, BaseCollector
+import deadlines
+from collectors.base_collectors import DBCollector, BaseCollector, Resume
 from collectors.factories import factory
 from exceptions.exceptions import (
     ApiClientError,
+    DeadlineExceededError,
     SourceUnavailableException,
     NoReferenceImageError, ForbiddenError, UnauthorizedError,
 )
 from image_api_client.client import Client
+from image_api_client.prefilter import change_prefilter
 from models.enums import CheckStatus
 from models.remotes import CheckResult
+from queues.delayed import DelayedJobScheduler
+from queues.fair import FairQueue
 
 logger = logging.getLogger("collector_app.workers")
 
 
-async def collect_from_source(collector: Type[BaseCollector], use_db: bool):
-    if issubclass(type(collector), DBCollector) and use_db:
+async def collect_from_source(
+        collector: Type[BaseCollector],
+        use_db: bool,
+        continuation: Optional[Callable[[], Awaitable[CheckResult]]] = None,
+):
+    """
+    Collects within the remaining budget of the job, the collection is
+    cancelled when the job deadline is reached
+    """
+    try:
+        return await asyncio.wait_for(
+            _collect(collector, use_db, continuation), deadlines.remaining()
+        )
+    except asyncio.TimeoutError:
+        if deadlines.expired():
+            raise DeadlineExceededError(detail="Job deadline exceeded")
+        raise
+
+
+async def _collect(
+        collector: Type[BaseCollector],
+        use_db: bool,
+        continuation: Optional[Callable[[], Awaitable[CheckResult]]],
+):
+    if continuation is None and issubclass(type(collector), DBCollector) and use_db:
         return await collector.collect_from_db()
     else:
         try:
+            if continuation is not None:
+                return await continuation()
             return await collector.collect()
         except ClientResponseError as ex:
             if ex.status == 401:
@@ -36,6 +67,12 @@ async def collect_from_source(collector: Type[BaseCollector], use_db: bool):
                 raise ex
 
 
+def report_check_saved(name: str, sensor_id, future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        e = future.exception()
+        logger.warning(f"Worker {name}. Check of {sensor_id} was not saved: {getattr(e, 'detail', e)}")
+
+
 def can_be_executed(exec_time) -> bool:
     if exec_time:
         now = time.time()
@@ -45,87 +82,127 @@ def can_be_executed(exec_time) -> bool:
 
 
 async def worker(
-        name: str, job_queue: asyncio.PriorityQueue, retry_period: float
+        name: str,
+        job_queue: FairQueue,
+        retry_period: float,
+        scheduler: DelayedJobScheduler = None,
 ) -> None:
+    if scheduler is None:
+        scheduler = DelayedJobScheduler(job_queue)
     while True:
-        try:
-            res = job_queue.get_nowait()[1]
-        except asyncio.QueueEmpty:
-            await asyncio.sleep(1)
-            continue
-        sensor_id, collect_type_id, collect_type, retry_count, exec_time, use_db, client = res
+        priority, res = await job_queue.get()
+        # A job resumed after a Resume delay carries the continuation as the last element
+        sensor_id, collect_type_id, collect_type, retry_count, exec_time, use_db, client, *resume = res
         image_api_client: Client = client
         if not can_be_executed(exec_time):
-            job_queue.put_nowait((100, res))
+            scheduler.schedule(exec_time or time.time(), (priority, res))
             job_queue.task_done()
-            await asyncio.sleep(0.1)
             continue
         logger.info(
             f"Worker {name}. Making requests for the following collect types: {collect_type}"
         )
-        collector = factory.get_collector(collect_type)
         detail, image_id, response = None, None, None
+        retry = None
         check_result = CheckResult()
-        try:
-            collector = await collector.create(
-                sensor_id, collect_type_id, image_api_client
-            )
-            check_result = await collect_from_source(collector, use_db)
-            if check_result.image:
-                try:
-                    reference_image, masks = await image_api_client.get_reference_image()
-                    response = await image_api_client.prepare_data_select_api_and_make_request(
-                        check_result.image,
-                        reference_image,
-                        masks
+        # The check is saved outside of the deadline, a resumed job gets a new one
+        with deadlines.job_deadline(deadlines.for_collect_type(collect_type)):
+            try:
+                # An unknown collect type is saved as an unavailable check
+                collector = factory.get_collector(collect_type)
+                if not resume:
+                    collector = await collector.create(
+                        sensor_id, collect_type_id, image_api_client
                     )
-                except NoReferenceImageError:
-                    await image_api_client.insert_first_reference_image(check_result.image,
-                                                                        check_result.extension)
-                    raise
-                finally:
-                    image_id = image_api_client.image_id
-                    if not image_id:
-                        image_id = await image_api_client.insert_image(
-                            check_result.image, check_result.extension
-                        )
-            else:
-                logger.warning("Could not find image in check result")
-        except (ClientConnectionError, asyncio.TimeoutError, ClientResponseError) as e:
-            detail = type(e).__name__
-            check_result.check_status = CheckStatus.UNAVAILABLE
-            logger.warning(f"Http error. {e}")
-        except (NoReferenceImageError, SourceUnavailableException, ForbiddenError, UnauthorizedError) as e:
-            detail = e.detail
-            check_result.check_status = e.status
-            logger.warning(str(e))
-        except ApiClientError as e:
-            detail = e.detail
-            check_result.check_status = e.status
-            retry_count -= 1
-            if retry_count > 0:
-                job_queue.put_nowait(
-                    (
-                        100,
+                check_result = await collect_from_source(collector, use_db, *resume)
+                if isinstance(check_result, Resume):
+                    resume_time = time.time() + check_result.delay
+                    scheduler.schedule(
+                        resume_time,
                         (
-                            sensor_id,
-                            collect_type_id,
-                            collect_type,
-                            retry_count,
-                            time.time() + retry_period,
-                            use_db,
-                            image_api_client,
+                            priority,
+                            (
+                                sensor_id,
+                                collect_type_id,
+                                collect_type,
+                                retry_count,
+                                resume_time,
+                                use_db,
+                                image_api_client,
+                                check_result.continuation,
+                            ),
                         ),
                     )
-                )
-        except Exception as e:
-            detail = str(e)
-            check_result.check_status = CheckStatus.UNAVAILABLE
-            logger.exception(e)
+                    logger.info(f"Worker {name}. {collect_type} job resumes in {check_result.delay}s")
+                    job_queue.task_done()
+                    continue
+                if check_result.image:
+                    try:
+                        reference_image, masks = await image_api_client.get_reference_image()
+                        if change_prefilter.enabled and await image_api_client.is_unchanged(
+                                check_result.image, reference_image, masks
+                        ):
+                            check_result.check_status = CheckStatus.NOCHANGE
+                        else:
+                            response = await image_api_client.prepare_data_select_api_and_make_request(
+                                check_result.image,
+                                reference_image,
+                                masks
+                            )
+                    except NoReferenceImageError:
+                        await image_api_client.insert_first_reference_image(check_result.image,
+                                                                            check_result.extension)
+                        raise
+                else:
+                    logger.warning("Could not find image in check result")
+            except (ClientConnectionError, asyncio.TimeoutError, ClientResponseError) as e:
+                detail = type(e).__name__
+                check_result.check_status = CheckStatus.UNAVAILABLE
+                logger.warning(f"Http error. {e}")
+            except (NoReferenceImageError, SourceUnavailableException, ForbiddenError, UnauthorizedError) as e:
+                detail = e.detail
+                check_result.check_status = e.status
+                logger.warning(str(e))
+            except ApiClientError as e:
+                detail = e.detail
+                check_result.check_status = e.status
+                retry_count -= 1
+                if retry_count > 0:
+                    exec_time = time.time() + retry_period
+                    retry = (
+                        exec_time,
+                        (
+                            100,
+                            (
+                                sensor_id,
+                                collect_type_id,
+                                collect_type,
+                                retry_count,
+                                exec_time,
+                                use_db,
+                                image_api_client,
+                            ),
+                        ),
+                    )
+            except Exception as e:
+                detail = str(e)
+                check_result.check_status = CheckStatus.UNAVAILABLE
+                logger.exception(e)
+        # Like the check, the captured image is saved even if the job deadline has passed
+        if check_result.image:
+            try:
+                image_id = image_api_client.image_id
+                if not image_id:
+                    image_id = await image_api_client.insert_image(
+                        check_result.image, check_result.extension
+                    )
+            except Exception as e:
+                detail = detail or type(e).__name__
+                check_result.check_status = CheckStatus.UNAVAILABLE
+                logger.exception(e)
         try:
             if detail:
                 detail = detail[:500]
-            await image_api_client.insert_check(
+            saved = await image_api_client.insert_check(
                 image_id,
                 check_result.image is not None,
                 collect_type_id if collect_type_id else None,
@@ -133,20 +210,33 @@ async def worker(
                 check_result.check_status.value,
                 response,
             )
+            if isinstance(saved, asyncio.Future):
+                saved.add_done_callback(partial(report_check_saved, name, sensor_id))
             logger.info(f"{name} completed")
         except Exception as e:
             logger.exception(e)
         finally:
             job_queue.task_done()
+            # Scheduled once the job key is released, with coalesce_running
+            # a retry due earlier would be dropped as a duplicate of this job
+            if retry is not None:
+                scheduler.schedule(*retry)
 
 
 async def create_workers(
-        task_queue: asyncio.PriorityQueue, workers_count: int, retry_period: int
+        task_queue: FairQueue,
+        workers_count: int,
+        retry_period: int,
+        scheduler: DelayedJobScheduler = None,
 ) -> None:
+    if scheduler is None:
+        scheduler = DelayedJobScheduler(task_queue)
     while True:
         tasks = set()
         for i in range(workers_count):
-            task = asyncio.create_task(worker(f"worker-{i}", task_queue, retry_period))
+            task = asyncio.create_task(
+                worker(f"worker-{i}", task_queue, retry_period, scheduler)
+            )
             logger.debug(f"Created task: {task}")
             tasks.add(task)
         await asyncio.gather(*tasks, return_exceptions=True)